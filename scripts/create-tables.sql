@@ -61,3 +61,57 @@ END;
 ALTER TABLE APP.stock_movements
 ADD CONSTRAINT chk_movement_type CHECK (movement_type IN ('IN', 'OUT'));
 
+CREATE TABLE APP.stock_balances (
+    input_id INTEGER PRIMARY KEY,
+    quantity INTEGER DEFAULT 0 NOT NULL,
+    FOREIGN KEY (input_id) REFERENCES APP.inputs(id) ON DELETE CASCADE
+);
+
+CREATE TABLE APP.stock_checkpoints (
+    input_id INTEGER,
+    checkpoint_date DATE,
+    quantity NUMBER NOT NULL,
+    PRIMARY KEY (input_id, checkpoint_date),
+    FOREIGN KEY (input_id) REFERENCES APP.inputs(id) ON DELETE CASCADE
+);
+
+CREATE TABLE APP.reorder_forecasts (
+    input_id INTEGER PRIMARY KEY,
+    computed_on DATE NOT NULL,
+    balance NUMBER NOT NULL,
+    avg_daily_out NUMBER NOT NULL,
+    std_daily_out NUMBER NOT NULL,
+    days_of_cover NUMBER,
+    safety_stock NUMBER NOT NULL,
+    reorder_point NUMBER NOT NULL,
+    suggested_quantity NUMBER NOT NULL,
+    FOREIGN KEY (input_id) REFERENCES APP.inputs(id) ON DELETE CASCADE
+);
+
+CREATE TABLE APP.ledger_archives (
+    id INTEGER GENERATED BY DEFAULT ON NULL AS IDENTITY PRIMARY KEY,
+    period_start DATE NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    movements INTEGER NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    archived_before DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE APP.archived_balances (
+    input_id INTEGER PRIMARY KEY,
+    quantity NUMBER NOT NULL,
+    movements INTEGER NOT NULL,
+    FOREIGN KEY (input_id) REFERENCES APP.inputs(id)
+);
+
+CREATE INDEX APP.ix_stock_movements_input_date ON APP.stock_movements (input_id, movement_date);
+CREATE INDEX APP.ix_stock_movements_movement_date ON APP.stock_movements (movement_date);
+CREATE INDEX APP.ix_stock_movements_updated_at ON APP.stock_movements (updated_at);
+CREATE INDEX APP.ix_inputs_supplier_id ON APP.inputs (supplier_id);
+CREATE INDEX APP.ix_inputs_expiration_date ON APP.inputs (expiration_date);
+CREATE INDEX APP.ix_inputs_updated_at ON APP.inputs (updated_at);
+CREATE INDEX APP.ix_ledger_archives_period_start ON APP.ledger_archives (period_start);
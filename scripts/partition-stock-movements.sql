@@ -0,0 +1,14 @@
+-- Optional: range-partitions APP.stock_movements by month of movement_date (Oracle 12.2+ with the
+-- Partitioning option). New months get their own partition automatically (interval partitioning).
+-- The date indexes become local, so queries on a date range only touch the partitions of the range.
+-- After archive-ledger moves the movements of a month to its archive file, the emptied partition
+-- can be dropped with `python app.py archive-ledger --drop_partitions`.
+
+ALTER TABLE APP.stock_movements MODIFY
+    PARTITION BY RANGE (movement_date) INTERVAL (NUMTOYMINTERVAL(1, 'MONTH'))
+    (PARTITION p_before_2000 VALUES LESS THAN (DATE '2000-01-01'))
+    ONLINE
+    UPDATE INDEXES (
+        APP.ix_stock_movements_input_date LOCAL,
+        APP.ix_stock_movements_movement_date LOCAL
+    );
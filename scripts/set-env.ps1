@@ -3,4 +3,8 @@ $env:DB_HOSTNAME = "localhost"
 $env:DEBUG = "False"
 $env:DB_PORT = "1521"
 $env:DB_USER = "APP"
-$env:DB_SERVICE_NAME = "FREE"
\ No newline at end of file
+$env:DB_SERVICE_NAME = "FREE"
+$env:DB_POOL_SIZE = "5"
+$env:DB_MAX_OVERFLOW = "10"
+$env:DB_POOL_RECYCLE = "1800"
+$env:DB_POOL_PRE_PING = "True"
\ No newline at end of file
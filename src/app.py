@@ -1,43 +1,27 @@
-import csv
 import os
 import json
 import sys
-from datetime import datetime
+import time
+from dataclasses import asdict
+from datetime import date, datetime
+from itertools import chain
 
 import click
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from service.supplier import SupplierService
-from service.supplier_inputs import InputService
-from service.stock_movements import StockMovementService
-from repository.supplier import SupplierRepository
-from repository.inputs import InputRepository
-from repository.stock_movements import StockMovementRepository
+from context import AppContext
+from serialization import compact_encoder, indented_encoder, to_dict
+from service.movement_io import (
+    SUPPORTED_FORMATS, detect_format, read_ids, read_movement_rows, write_movement_report, write_rejected_rows,
+    write_rows
+)
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 
-db_user = os.getenv('DB_USER')
-db_password = os.getenv('DB_PASSWORD')
-db_hostname = os.getenv('DB_HOSTNAME')
-db_echo = bool(os.getenv('DEBUG', False))
-db_port = os.getenv('DB_PORT')
-db_service_name = os.getenv('DB_SERVICE_NAME')
-
-connection_string = f'oracle+oracledb://{db_user}:{db_password}@{db_hostname}:{db_port}/?service_name={db_service_name}'
-engine = create_engine(connection_string, echo=False)
-
-Session = sessionmaker(bind=engine)
-session = Session()
-
-input_repository = InputRepository(session)
-stock_movement_repository = StockMovementRepository(session)
-stock_movement_service = StockMovementService(stock_movement_repository)
-supplier_repository = SupplierRepository(session)
-supplier_service = SupplierService(supplier_repository)
-input_service = InputService(input_repository, supplier_service)
+context = AppContext()
 
 
 def validate_date(ctx, self, value):
+    if value is None:
+        return value
     try:
         datetime.strptime(value, '%Y-%m-%d')
         return value
@@ -45,34 +29,100 @@ def validate_date(ctx, self, value):
         raise click.BadParameter(f"The date '{value}' is not in the correct format (YYYY-MM-DD).")
 
 
-def validate_env() -> None:
-    """Validates the required environment variables."""
-    required_vars = [
-        'DB_USER',
-        'DB_PASSWORD',
-        'DB_HOSTNAME',
-        'DB_PORT',
-        'DB_SERVICE_NAME',
-    ]
-    for var in required_vars:
-        if not os.getenv(var):
-            raise EnvironmentError(f"Required environment variable {var} is missing")
+def load_ids(path):
+    """Reads the IDs of a bulk command from a file, one per line."""
+    try:
+        return list(read_ids(path))
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--ids_file')
+
+
+def ids_file_option(required=True):
+    """Option of the bulk commands with the file of the IDs to be changed."""
+    return click.option('--ids_file', required=required, type=click.Path(exists=True, dir_okay=False),
+                        help='File with one ID per line (or a CSV with the IDs in its first column).')
 
 
-def serialize_model(model):
-    """Converts a SQLAlchemy object into a dictionary, excluding unwanted attributes."""
-    return {key: value for key, value in model.__dict__.items() if not key.startswith('_')}
+def bulk_summary(action, entity, count, requested):
+    """Displays the number of rows affected by a bulk command."""
+    output_json({'message': f'{count} {entity} successfully {action}!', action: count,
+                 **({'requested': requested} if requested is not None else {})})
+
+
+def run_bulk(operation, *args, **kwargs):
+    """Runs a bulk service operation, turning invalid values into a usage error."""
+    try:
+        return operation(*args, **kwargs)
+    except ValueError as error:
+        raise click.UsageError(str(error))
 
 
 def output_json(data):
     """Converts data to JSON and displays it."""
-    click.echo(json.dumps(data, default=str, indent=4))
+    click.echo(indented_encoder.encode(data))
+
+
+def output_json_list(items, ndjson=False, compact=False):
+    """
+    Displays a sequence of items as they are produced, either as the same indented JSON
+    array printed by output_json, as a compact single-line array or as NDJSON (one compact
+    object per line). Lines are written to the buffered stdout instead of click.echo, which
+    flushes on every call.
+    """
+    stdout = click.get_text_stream('stdout')
+    if ndjson:
+        encode = compact_encoder.encode
+        for item in items:
+            stdout.write(encode(item))
+            stdout.write('\n')
+    elif compact:
+        encode = compact_encoder.encode
+        separator = '['
+        for item in items:
+            stdout.write(separator)
+            stdout.write(encode(item))
+            separator = ','
+        stdout.write('[]\n' if separator == '[' else ']\n')
+    else:
+        first = True
+        for item in items:
+            stdout.write('[\n' if first else ',\n')
+            stdout.write('\n'.join('    ' + line for line in indented_encoder.encode(item).splitlines()))
+            first = False
+        stdout.write('[]\n' if first else '\n]\n')
+    stdout.flush()
+
+
+def pagination_options(function):
+    """Adds the --limit, --after, --ndjson and --compact options shared by the list commands."""
+    function = click.option('--compact', is_flag=True, help='Print the list as a single-line JSON array.')(function)
+    function = click.option('--ndjson', is_flag=True, help='Stream one JSON object per line.')(function)
+    function = click.option('--after', type=int, help='Only list records with an ID greater than this one.')(function)
+    function = click.option('--limit', type=click.IntRange(min=1), help='Maximum number of records to list.')(function)
+    return function
 
 
 @click.group()
-def cli():
+@click.option('--profile', is_flag=True, help='Print a summary of the SQL statements and service calls to stderr.')
+@click.option('--profile_output', type=click.Path(dir_okay=False, writable=True),
+              help='Also write the profiling summary to this JSON file.')
+@click.pass_context
+def cli(ctx, profile, profile_output):
     """CLI application for managing agricultural supplies."""
-    validate_env()
+    if not profile and not profile_output:
+        return
+    from instrumentation import QueryProfiler, format_summary
+
+    profiler = QueryProfiler()
+    context.enable_profiling(profiler)
+
+    def report():
+        summary = profiler.summary()
+        click.echo(format_summary(summary), err=True)
+        if profile_output:
+            with open(profile_output, 'w', encoding='utf-8') as file:
+                json.dump(summary, file, indent=4)
+    ctx.call_on_close(report)
 
 
 @click.command()
@@ -81,26 +131,33 @@ def cli():
 @click.option('--address', prompt='Address', help='Address of the supplier.')
 def create_supplier(name, contact_info, address):
     """Adds a new supplier."""
-    supplier = supplier_service.create_supplier(name, contact_info, address)
-    output_json({'message': f'Supplier {supplier.name} successfully created!', 'supplier': serialize_model(supplier)})
+    supplier = context.supplier_service.create_supplier(name, contact_info, address)
+    output_json({'message': f'Supplier {supplier.name} successfully created!', 'supplier': to_dict(supplier)})
 
 
 @click.command()
-@click.option('--supplier_id', prompt='Supplier ID', help='ID of the supplier.')
-def get_supplier(supplier_id):
+@click.option('--supplier_id', prompt='Supplier ID', help='ID of the supplier.', type=int)
+@click.option('--with_inputs', is_flag=True, help='Include the inputs of the supplier.')
+def get_supplier(supplier_id, with_inputs):
     """Fetches a supplier by ID."""
-    supplier = supplier_service.fetch_supplier(supplier_id)
+    if with_inputs:
+        supplier = context.supplier_service.fetch_supplier_with_inputs(supplier_id)
+    else:
+        supplier = context.supplier_service.fetch_supplier(supplier_id)
     if supplier:
-        output_json({'supplier': serialize_model(supplier)})
+        output_json({'supplier': to_dict(supplier, ('inputs',) if with_inputs else ())})
     else:
         output_json({'error': 'Supplier not found!'})
 
 
 @click.command()
-def list_suppliers():
+@pagination_options
+@click.option('--with_inputs', is_flag=True, help='Include the inputs of each supplier.')
+def list_suppliers(limit, after, ndjson, compact, with_inputs):
     """Lists all suppliers."""
-    suppliers = supplier_service.fetch_all_suppliers()
-    output_json([serialize_model(supplier) for supplier in suppliers])
+    suppliers = context.supplier_service.iter_suppliers(after, limit, with_inputs=with_inputs)
+    relationships = ('inputs',) if with_inputs else ()
+    output_json_list((to_dict(supplier, relationships) for supplier in suppliers), ndjson, compact)
 
 
 @click.command()
@@ -109,32 +166,46 @@ def list_suppliers():
 @click.option('--quantity', prompt='Quantity', help='Available quantity of the input.', type=int)
 @click.option('--expiration_date', prompt='Expiration date', help='Expiration date (YYYY-MM-DD).', callback=validate_date)
 @click.option('--supplier_id', prompt='Supplier ID', help='ID of the supplier of the input.', type=int)
-def create_input(name, category, quantity, expiration_date, supplier_id):
+@click.option('--opening_movement', is_flag=True,
+              help='Also record the quantity as an opening IN stock movement, in the same transaction.')
+def create_input(name, category, quantity, expiration_date, supplier_id, opening_movement):
     """Adds a new agricultural input."""
     converted_date = datetime.strptime(expiration_date, '%Y-%m-%d')
-    new_input = input_service.create_input(name, category, quantity, converted_date, supplier_id)
+    with context.unit_of_work() as unit_of_work:
+        new_input = context.input_service.create_input(name, category, quantity, converted_date, supplier_id)
+        if new_input is not None and opening_movement and quantity > 0:
+            unit_of_work.flush()
+            context.stock_movement_service.create_stock_movement(new_input.id, quantity, 'IN',
+                                                                 datetime.now().date())
     if new_input is None:
         output_json({'error': 'Supplier not found!'})
     else:
-        output_json({'message': f'Input {new_input.name} successfully created!', 'input': serialize_model(new_input)})
+        output_json({'message': f'Input {new_input.name} successfully created!', 'input': to_dict(new_input)})
 
 
 @click.command()
-@click.option('--input_id', prompt='Input ID', help='ID of the input.')
-def get_input(input_id):
+@click.option('--input_id', prompt='Input ID', help='ID of the input.', type=int)
+@click.option('--with_supplier', is_flag=True, help='Include the supplier of the input.')
+def get_input(input_id, with_supplier):
     """Fetches an input by ID."""
-    input_item = input_service.get_input(input_id)
+    if with_supplier:
+        input_item = context.input_service.get_input_with_supplier(input_id)
+    else:
+        input_item = context.input_service.get_input(input_id)
     if input_item:
-        output_json({'input': serialize_model(input_item)})
+        output_json({'input': to_dict(input_item, ('supplier',) if with_supplier else ())})
     else:
         output_json({'error': 'Input not found!'})
 
 
 @click.command()
-def list_inputs():
+@pagination_options
+@click.option('--with_supplier', is_flag=True, help='Include the supplier of each input.')
+def list_inputs(limit, after, ndjson, compact, with_supplier):
     """Lists all inputs."""
-    inputs = input_service.get_all_inputs()
-    output_json([serialize_model(input_item) for input_item in inputs])
+    inputs = context.input_service.iter_inputs(after, limit, with_supplier=with_supplier)
+    relationships = ('supplier',) if with_supplier else ()
+    output_json_list((to_dict(input_item, relationships) for input_item in inputs), ndjson, compact)
 
 
 @click.command()
@@ -143,31 +214,137 @@ def list_inputs():
 @click.option('--movement_type', '-t', prompt='Movement type', help="Movement type ('IN' or 'OUT').",
               type=click.Choice(['IN', 'OUT'], case_sensitive=False))
 @click.option('--when', prompt='Movement date', help="Movement date (YYYY-MM-DD).", callback=validate_date)
-def create_stock_movement(input_id, quantity, movement_type, when):
+@click.option('--check_stock', is_flag=True,
+              help='Refuse an OUT movement larger than the stock of the input, checked atomically with the debit.')
+def create_stock_movement(input_id, quantity, movement_type, when, check_stock):
     """Adds a stock movement."""
     movement_date = datetime.now()
     if when is not None:
         movement_date = datetime.strptime(when, '%Y-%m-%d')
-    movement = stock_movement_service.create_stock_movement(input_id, quantity, movement_type, movement_date)
-    output_json({'message': f'{movement.quantity} units of movement successfully created!', 'movement': serialize_model(movement)})
+    if check_stock and movement_type.upper() == 'OUT':
+        from service.stock_movements import InsufficientStockError
+
+        try:
+            movement = context.stock_movement_service.debit_stock(input_id, quantity, movement_date)
+        except InsufficientStockError as error:
+            output_json({'error': str(error), 'available': error.available})
+            return
+    else:
+        movement = context.stock_movement_service.create_stock_movement(input_id, quantity, movement_type,
+                                                                        movement_date)
+    output_json({'message': f'{movement.quantity} units of movement successfully created!', 'movement': to_dict(movement)})
+
+
+@click.command()
+@click.option('--file', 'file_path', prompt='Movements file', help='CSV or JSONL file with the movements.',
+              type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', help='File format. Detected from the extension when omitted.',
+              type=click.Choice(SUPPORTED_FORMATS, case_sensitive=False))
+@click.option('--batch_size', default=1000, show_default=True, help='Rows validated and inserted per batch.',
+              type=click.IntRange(min=1))
+@click.option('--rejects', help='Path of a JSONL file to quarantine the rejected rows.')
+def bulk_import_movements(file_path, file_format, batch_size, rejects):
+    """Imports stock movements in bulk from a CSV or JSONL file."""
+    try:
+        file_format = detect_format(file_path, file_format)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--format')
+    rows = read_movement_rows(file_path, file_format)
+    result = context.stock_movement_service.bulk_import_stock_movements(rows, batch_size)
+    summary = {
+        'message': f'{result.imported} movements successfully imported!',
+        'imported': result.imported,
+        'rejected': len(result.rejected),
+        'elapsed_seconds': round(result.elapsed_seconds, 3),
+        'rows_per_second': round(result.rows_per_second, 1),
+    }
+    if rejects:
+        write_rejected_rows(rejects, result.rejected)
+        summary['rejects_file'] = rejects
+    else:
+        summary['rejected_rows'] = [
+            {'line': item.line_number, 'reason': item.reason} for item in result.rejected
+        ]
+    output_json(summary)
 
 
 @click.command()
 @click.option('--movement_id', prompt='Movement ID', help='ID of the movement.')
 def get_stock_movement(movement_id):
     """Fetches a movement by ID."""
-    movement = stock_movement_service.get_stock_movement(movement_id)
+    movement = context.stock_movement_service.get_stock_movement(movement_id)
     if movement:
-        output_json({'movement': serialize_model(movement)})
+        output_json({'movement': to_dict(movement)})
     else:
         output_json({'error': 'Movement not found!'})
 
 
 @click.command()
-def list_stock_movements():
+@pagination_options
+def list_stock_movements(limit, after, ndjson, compact):
     """Lists all stock movements."""
-    movements = stock_movement_service.get_all_stock_movements()
-    output_json([serialize_model(movement) for movement in movements])
+    movements = context.stock_movement_service.iter_stock_movements(after, limit)
+    output_json_list((to_dict(movement) for movement in movements), ndjson, compact)
+
+
+@click.command()
+@click.option('--supplier_id', 'supplier_ids', multiple=True, type=int, help='ID of a supplier (repeatable).')
+@click.option('--input_id', 'input_ids', multiple=True, type=int, help='ID of an input (repeatable).')
+@click.option('--movement_id', 'movement_ids', multiple=True, type=int, help='ID of a stock movement (repeatable).')
+def lookup(supplier_ids, input_ids, movement_ids):
+    """Fetches several suppliers, inputs and stock movements by ID at once."""
+    import asyncio
+
+    async def fetch_all():
+        try:
+            return await asyncio.gather(
+                context.async_supplier_service.fetch_suppliers(supplier_ids),
+                context.async_input_service.get_inputs(input_ids),
+                context.async_stock_movement_service.get_stock_movements(movement_ids),
+            )
+        finally:
+            await context.aclose()
+
+    suppliers, inputs, movements = asyncio.run(fetch_all())
+    output_json({
+        'suppliers': [to_dict(supplier) for supplier in suppliers],
+        'inputs': [to_dict(input_item) for input_item in inputs],
+        'stock_movements': [to_dict(movement) for movement in movements],
+    })
+
+
+@click.command()
+@click.option('--input_id', prompt='Input ID', help='ID of the input.', type=int)
+def get_stock_balance(input_id):
+    """Shows the current stock of an input."""
+    output_json({'input_id': input_id, 'balance': context.stock_balance_service.get_balance(input_id)})
+
+
+@click.command()
+def reconcile_stock_balances():
+    """Rebuilds the stock balances from the stock movements ledger."""
+    result = context.stock_balance_service.reconcile()
+    output_json({'message': f"{result['balances']} stock balances rebuilt from the ledger!", **result})
+
+
+@click.command()
+@click.option('--input_id', prompt='Input ID', help='ID of the input.', type=int)
+@click.option('--date', 'as_of', prompt='Date', help='Date of the balance (YYYY-MM-DD), movements on it included.',
+              callback=validate_date)
+def stock_as_of(input_id, as_of):
+    """Shows the stock of an input at the end of a past date."""
+    as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+    balance = context.stock_balance_service.get_balance_as_of(input_id, as_of)
+    output_json({'input_id': input_id, 'as_of': as_of, 'balance': balance})
+
+
+@click.command()
+@click.option('--interval', default='month', show_default=True, help='Period between checkpoints.',
+              type=click.Choice(['day', 'week', 'month']))
+def build_stock_checkpoints(interval):
+    """Rebuilds the stock balance checkpoints used by stock-as-of from the ledger."""
+    result = context.stock_balance_service.build_checkpoints(interval)
+    output_json({'message': f"{result['checkpoints']} stock checkpoints built!", **result})
 
 
 @click.command()
@@ -180,47 +357,374 @@ def list_stock_movements():
 def update_input(input_id, name, category, quantity, expiration_date, supplier_id):
     """Updates an existing input."""
     converted_date = datetime.strptime(expiration_date, '%Y-%m-%d')
-    updated_input = input_service.update_input(input_id, name, category, quantity, converted_date, supplier_id)
+    updated_input = context.input_service.update_input(input_id, name, category, quantity, converted_date, supplier_id)
     if updated_input is None:
         output_json({'error': 'Input or supplier not found!'})
     else:
-        output_json({'message': f'Input {updated_input.name} successfully updated!', 'input': serialize_model(updated_input)})
+        output_json({'message': f'Input {updated_input.name} successfully updated!', 'input': to_dict(updated_input)})
 
 
 @click.command()
 @click.option('--input_id', prompt='Input ID', help='ID of the input.', type=int)
 def delete_input(input_id):
     """Deletes an input by ID."""
-    if input_service.delete_input(input_id):
+    if context.input_service.delete_input(input_id):
         output_json({'message': 'Input successfully deleted!'})
     else:
         output_json({'error': 'Input not found!'})
 
 
+@click.command()
+@ids_file_option(required=False)
+@click.option('--where_category', help='Update all the inputs of this category instead of the IDs of a file.')
+@click.option('--category', help='New category.')
+@click.option('--quantity', help='New available quantity.', type=int)
+@click.option('--expiration_date', help='New expiration date (YYYY-MM-DD).', callback=validate_date)
+@click.option('--supplier_id', help='ID of the new supplier.', type=int)
+def bulk_update_inputs(ids_file, where_category, category, quantity, expiration_date, supplier_id):
+    """Sets the same values on many inputs, with one UPDATE per 1000 IDs."""
+    if (ids_file is None) == (where_category is None):
+        raise click.UsageError('Give either --ids_file or --where_category.')
+    values = {'category': category, 'quantity': quantity, 'supplier_id': supplier_id,
+              'expiration_date': datetime.strptime(expiration_date, '%Y-%m-%d').date() if expiration_date else None}
+    values = {field: value for field, value in values.items() if value is not None}
+    input_ids = load_ids(ids_file) if ids_file else None
+    count = run_bulk(context.input_service.bulk_update_inputs, values, input_ids, where_category)
+    bulk_summary('updated', 'inputs', count, len(input_ids) if input_ids is not None else None)
+
+
+@click.command()
+@ids_file_option(required=False)
+@click.option('--where_category', help='Delete all the inputs of this category instead of the IDs of a file.')
+def bulk_delete_inputs(ids_file, where_category):
+    """Deletes many inputs, with one DELETE per 1000 IDs. Inputs with stock movements are kept."""
+    if (ids_file is None) == (where_category is None):
+        raise click.UsageError('Give either --ids_file or --where_category.')
+    input_ids = load_ids(ids_file) if ids_file else None
+    count = run_bulk(context.input_service.bulk_delete_inputs, input_ids, where_category)
+    bulk_summary('deleted', 'inputs', count, len(input_ids) if input_ids is not None else None)
+
+
+@click.command()
+@ids_file_option()
+@click.option('--contact_info', help='New contact information.')
+@click.option('--address', help='New address.')
+def bulk_update_suppliers(ids_file, contact_info, address):
+    """Sets the same values on many suppliers, with one UPDATE per 1000 IDs."""
+    values = {field: value for field, value in (('contact_info', contact_info), ('address', address))
+              if value is not None}
+    supplier_ids = load_ids(ids_file)
+    count = run_bulk(context.supplier_service.bulk_update_suppliers, supplier_ids, values)
+    bulk_summary('updated', 'suppliers', count, len(supplier_ids))
+
+
+@click.command()
+@ids_file_option()
+def bulk_delete_suppliers(ids_file):
+    """Deletes many suppliers, with one DELETE per 1000 IDs. Suppliers with inputs are kept."""
+    supplier_ids = load_ids(ids_file)
+    count = context.supplier_service.bulk_delete_suppliers(supplier_ids)
+    bulk_summary('deleted', 'suppliers', count, len(supplier_ids))
+
+
+@click.command()
+@ids_file_option()
+@click.option('--quantity', help='New quantity.', type=int)
+@click.option('--movement_type', '-t', help="New movement type ('IN' or 'OUT').",
+              type=click.Choice(['IN', 'OUT'], case_sensitive=False))
+@click.option('--movement_date', help='New movement date (YYYY-MM-DD).', callback=validate_date)
+def bulk_update_stock_movements(ids_file, quantity, movement_type, movement_date):
+    """Sets the same values on many movements, with one UPDATE per 1000 IDs, keeping the balances in step."""
+    values = {'quantity': quantity, 'movement_type': movement_type,
+              'movement_date': datetime.strptime(movement_date, '%Y-%m-%d').date() if movement_date else None}
+    values = {field: value for field, value in values.items() if value is not None}
+    movement_ids = load_ids(ids_file)
+    count = run_bulk(context.stock_movement_service.bulk_update_stock_movements, movement_ids, values)
+    bulk_summary('updated', 'movements', count, len(movement_ids))
+
+
+@click.command()
+@ids_file_option()
+def bulk_delete_stock_movements(ids_file):
+    """Deletes many movements, with one DELETE per 1000 IDs, keeping the balances in step."""
+    movement_ids = load_ids(ids_file)
+    count = context.stock_movement_service.bulk_delete_stock_movements(movement_ids)
+    bulk_summary('deleted', 'movements', count, len(movement_ids))
+
+
 @click.command()
 @click.option('--output', prompt='Output CSV file path', help='Path to save the generated report CSV.')
-def generate_report(output):
+@click.option('--format', 'file_format', default='csv', show_default=True, help='Report file format.',
+              type=click.Choice(SUPPORTED_FORMATS, case_sensitive=False))
+@click.option('--chunk_size', default=1000, show_default=True, help='Rows fetched from the database per round-trip.',
+              type=click.IntRange(min=1))
+@click.option('--workers', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of ID ranges of the ledger queried in parallel, each on its own connection.')
+@click.option('--partitions', type=click.IntRange(min=1),
+              help='Number of ID ranges the ledger is split in with --workers (default: 4 per worker).')
+@click.option('--incremental', is_flag=True,
+              help='Only export the movements created or changed since the previous incremental export.')
+@click.option('--part_files', is_flag=True,
+              help='With --incremental, write the new rows to a dated part file instead of appending them.')
+@click.option('--rebuild', is_flag=True, help='With --incremental, rewrite the whole report and reset its watermark.')
+@click.option('--settle_seconds', default=60.0, show_default=True, type=click.FloatRange(min=0),
+              help='With --incremental, seconds the watermark stays behind the database clock for late commits.')
+def generate_report(output, file_format, chunk_size, workers, partitions, incremental, part_files, rebuild,
+                    settle_seconds):
     """Generates a report of stock movements and exports it to a CSV file."""
-    movements = stock_movement_service.generate_movement_report()
-
-    # Defining the CSV headers
-    headers = ['ID', 'Quantity', 'Movement Type', 'Movement Date', 'Input Name', 'Supplier Name']
-
-    # Writing the data to a CSV file
-    with open(output, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(headers)
-        for movement in movements:
-            writer.writerow([
-                movement['movement_id'],
-                movement['movement_quantity'],
-                movement['movement_type'],
-                movement['movement_date'],
-                movement['input_name'],
-                movement['supplier_name']
-            ])
-
-    click.echo(f'Report successfully generated at {output}!')
+    if (part_files or rebuild) and not incremental:
+        raise click.UsageError('--part_files and --rebuild require --incremental.')
+    if incremental:
+        if workers > 1:
+            raise click.UsageError('--workers cannot be combined with --incremental.')
+        from service.incremental_export import IncrementalReportExporter
+
+        exporter = IncrementalReportExporter(context.stock_movement_service.repository,
+                                             archive=context.ledger_archive_service, settle_seconds=settle_seconds)
+        try:
+            result = exporter.export(output, file_format.lower(), part_files, rebuild, chunk_size)
+        except (ValueError, FileNotFoundError) as error:
+            raise click.ClickException(str(error))
+        click.echo(f'Report successfully exported to {result.path} ({result.mode}: {result.new_rows} new and '
+                   f'{result.changed_rows} changed movements)!')
+        return
+
+    with open(output, mode='w', newline='', encoding='utf-8') as file:
+        if workers > 1:
+            from service.parallel_report import write_movement_report_parallel
+
+            count = write_movement_report_parallel(context.session_factory, file, file_format.lower(), workers,
+                                                   partitions, chunk_size, context.ledger_archive_service.directory)
+        else:
+            movements = context.stock_movement_service.stream_movement_report(chunk_size)
+            count = write_movement_report(movements, file, file_format.lower())
+
+    click.echo(f'Report successfully generated at {output} ({count} movements)!')
+
+
+@click.command()
+@click.option('--period', default='month', show_default=True, help='Size of the time buckets.',
+              type=click.Choice(['day', 'week', 'month']))
+@click.option('--group_by', default='input', show_default=True, help='Grouping of the totals.',
+              type=click.Choice(['input', 'category', 'supplier']))
+@click.option('--start', help='First movement date included (YYYY-MM-DD).',
+              callback=validate_date)
+@click.option('--end', help='Last movement date included (YYYY-MM-DD).',
+              callback=validate_date)
+@click.option('--format', 'file_format', default='json', show_default=True, help='Output format.',
+              type=click.Choice(['csv', 'json', 'jsonl'], case_sensitive=False))
+@click.option('--output', help='Path of the output file. The report is printed when omitted.')
+def consumption_report(period, group_by, start, end, file_format, output):
+    """Totals the stock movements per day, week or month and input, category or supplier."""
+    from service.analytics import consumption_fields
+
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    try:
+        rows = context.analytics_service.consumption_report(period, group_by, start, end)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+    fields = consumption_fields(group_by)
+    headers = fields if file_format.lower() == 'csv' else None
+    if output:
+        with open(output, mode='w', newline='', encoding='utf-8') as file:
+            count = write_rows(rows, file, fields, file_format.lower(), headers)
+        click.echo(f'Report successfully generated at {output} ({count} rows)!')
+    else:
+        write_rows(rows, click.get_text_stream('stdout'), fields, file_format.lower(), headers)
+
+
+@click.command()
+@click.option('--window_days', default=90, show_default=True, type=click.IntRange(min=1),
+              help='Days of OUT history, up to today, averaged into the daily consumption.')
+@click.option('--lead_time_days', default=7, show_default=True, type=click.IntRange(min=0),
+              help='Days between placing an order and receiving it.')
+@click.option('--review_days', default=14, show_default=True, type=click.IntRange(min=0),
+              help='Days of consumption an order should cover after the lead time.')
+@click.option('--service_level', default=0.95, show_default=True, type=click.FloatRange(0.5, 1, max_open=True),
+              help='Probability of not running out during the lead time.')
+@click.option('--only_reorder', is_flag=True, help='Only list the inputs with a suggested order.')
+@click.option('--format', 'file_format', default='json', show_default=True, help='Output format.',
+              type=click.Choice(['csv', 'json', 'jsonl'], case_sensitive=False))
+@click.option('--output', help='Path of the output file. The suggestions are printed when omitted.')
+@click.option('--save', is_flag=True, help='Replace the contents of the reorder_forecasts table with the forecast.')
+def forecast_reorders(window_days, lead_time_days, review_days, service_level, only_reorder, file_format, output,
+                      save):
+    """Computes the reorder point and suggested order of every input from its consumption."""
+    from service.reorder_forecast import FORECAST_FIELDS, ForecastParameters
+
+    parameters = ForecastParameters(window_days, lead_time_days, review_days, service_level)
+    started = time.perf_counter()
+    forecast = context.analytics_service.reorder_forecast(parameters)
+    if save:
+        context.analytics_service.save_reorder_forecast(forecast)
+    headers = FORECAST_FIELDS if file_format.lower() == 'csv' else None
+    if output or save:
+        count = 0
+        if output:
+            with open(output, mode='w', newline='', encoding='utf-8') as file:
+                count = write_rows(forecast.rows(only_reorder), file, FORECAST_FIELDS, file_format.lower(), headers)
+        output_json({
+            'message': f'Reorder forecast of {len(forecast)} inputs computed!',
+            'inputs': len(forecast),
+            'to_reorder': forecast.reorder_count,
+            'computed_on': forecast.computed_on.isoformat(),
+            **({'output': output, 'rows': count} if output else {}),
+            **({'table': 'reorder_forecasts'} if save else {}),
+            'vectorized': forecast.vectorized,
+            'elapsed_seconds': round(time.perf_counter() - started, 3),
+        })
+    else:
+        write_rows(forecast.rows(only_reorder), click.get_text_stream('stdout'), FORECAST_FIELDS,
+                   file_format.lower(), headers)
+
+
+@click.command()
+@click.option('--before', help='Archive the movements dated before this day (YYYY-MM-DD).', callback=validate_date)
+@click.option('--keep_months', default=12, show_default=True, type=click.IntRange(min=0),
+              help='Without --before, keep the movements of the current month and of this many months before it.')
+@click.option('--dry_run', is_flag=True, help='Only count the movements that would be archived, per month.')
+@click.option('--drop_partitions', is_flag=True,
+              help='Drop the emptied monthly partitions of stock_movements (Oracle, when partitioned by date).')
+@click.option('--status', is_flag=True, help='Only list the archive files.')
+def archive_ledger(before, keep_months, dry_run, drop_partitions, status):
+    """Moves old stock movements to compressed monthly files in LEDGER_ARCHIVE_DIR."""
+    service = context.ledger_archive_service
+    if status:
+        archives = service.list_archives()
+        output_json({'directory': service.directory, 'cutoff': service.cutoff(),
+                     'movements': sum(archive['movements'] for archive in archives), 'archives': archives})
+        return
+    if before:
+        before = datetime.strptime(before, '%Y-%m-%d').date()
+    else:
+        today = date.today()
+        month = today.year * 12 + today.month - 1 - keep_months
+        before = date(month // 12, month % 12 + 1, 1)
+    try:
+        result = service.archive(before, dry_run, drop_partitions)
+    except (ValueError, RuntimeError) as error:
+        raise click.ClickException(str(error))
+    action = 'would be archived' if dry_run else f'archived to {service.directory}'
+    output_json({'message': f'{result.movements} movements dated before {before} {action}!',
+                 **asdict(result), 'elapsed_seconds': round(result.elapsed_seconds, 3)})
+
+
+@click.command()
+@click.option('--query', prompt='Search', help='Text searched in the name, category and supplier of the inputs.')
+@click.option('--mode', default='prefix', show_default=True, help='How the text must match a field.',
+              type=click.Choice(['prefix', 'substring', 'token']))
+@click.option('--field', 'fields', multiple=True, help='Field searched (repeatable). All fields when omitted.',
+              type=click.Choice(['name', 'category', 'supplier']))
+@click.option('--limit', default=20, show_default=True, type=click.IntRange(min=1),
+              help='Maximum number of inputs listed.')
+@click.option('--sql', is_flag=True, help='Search with LIKE queries instead of the search index.')
+@click.option('--ndjson', is_flag=True, help='Stream one JSON object per line.')
+def search_inputs(query, mode, fields, limit, sql, ndjson):
+    """Searches the inputs by name, category or supplier name."""
+    from service.search_index import SEARCH_FIELDS
+
+    hits = context.search_service.search(query, mode, fields or SEARCH_FIELDS, limit, use_index=not sql)
+    output_json_list((asdict(hit) for hit in hits), ndjson)
+
+
+@click.command()
+@click.option('--refresh', is_flag=True, help='Only apply the inputs changed since the last build or refresh.')
+def build_search_index(refresh):
+    """Builds the search index of the inputs and writes it to SEARCH_INDEX_PATH."""
+    service = context.search_service
+    result = service.refresh_index() if refresh else service.build_index()
+    output_json({'message': f'Search index of {result.size} inputs written to {service.store.path}!',
+                 **asdict(result), 'elapsed_seconds': round(result.elapsed_seconds, 3)})
+
+
+@click.command()
+@click.option('--days', default=30, show_default=True, help='Warn about inputs expiring within this many days.',
+              type=click.IntRange(min=0))
+@click.option('--threshold', default=10, show_default=True, help='Warn about inputs with this much stock or less.',
+              type=float)
+@click.option('--type', 'alert_type', default='all', show_default=True, help='Kind of alert to check.',
+              type=click.Choice(['all', 'expiration', 'low-stock']))
+@click.option('--ndjson', is_flag=True, help='Stream one JSON object per line.')
+def alerts(days, threshold, alert_type, ndjson):
+    """Lists inputs close to expiration or low on stock."""
+    found = []
+    if alert_type in ('all', 'expiration'):
+        found.append({'alert': 'expiration', **asdict(alert)}
+                     for alert in context.alert_service.expiration_alerts(days))
+    if alert_type in ('all', 'low-stock'):
+        found.append({'alert': 'low-stock', **asdict(alert)}
+                     for alert in context.alert_service.low_stock_alerts(threshold))
+    output_json_list(chain.from_iterable(found), ndjson)
+
+
+@click.command()
+@click.option('--days', default=30, show_default=True, help='Warn about inputs expiring within this many days.',
+              type=click.IntRange(min=0))
+@click.option('--interval', default=60, show_default=True, help='Seconds between checks.',
+              type=click.FloatRange(min=0))
+@click.option('--once', is_flag=True, help='Check once and exit.')
+def watch_alerts(days, interval, once):
+    """Watches for inputs entering the expiration window and prints each alert once, as NDJSON."""
+    from service.alerts import ExpirationScheduler
+
+    scheduler = ExpirationScheduler(context.input_repository, warning_days=days)
+    try:
+        while True:
+            for alert in scheduler.poll():
+                click.echo(json.dumps({'alert': 'expiration', **asdict(alert)}, default=str))
+            # release the connection and the read snapshot between checks
+            context.session.close()
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Host to listen on.')
+@click.option('--port', default=8080, show_default=True, help='Port to listen on.', type=int)
+@click.option('--socket', 'socket_path', help='Listen on this Unix socket instead of TCP.')
+@click.option('--verbose', is_flag=True, help='Log every request.')
+def serve(host, port, socket_path, verbose):
+    """Serves the supplier, input and stock operations over HTTP using pooled connections."""
+    from server import create_server
+
+    server = create_server(context.engine, host, port, socket_path, verbose)
+    click.echo(f'Serving on {server.address} (press Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        context.engine.dispose()
+
+
+@click.command()
+@click.option('--status', is_flag=True, help='Only show which migrations are applied.')
+def migrate(status):
+    """Applies the pending database schema migrations."""
+    from migrations.runner import MigrationRunner
+
+    runner = MigrationRunner(context.engine)
+    if not status:
+        applied = runner.upgrade()
+        click.echo(f'{len(applied)} migration(s) applied.')
+    output_json(runner.status())
+
+
+@click.command()
+def explain_queries():
+    """Prints the database execution plans of the main repository queries."""
+    from migrations.query_plans import explain_main_queries
+
+    with context.engine.connect() as connection:
+        for name, plan in explain_main_queries(connection).items():
+            click.echo(f'== {name}')
+            for line in plan:
+                click.echo(f'   {line}')
 
 cli.add_command(create_supplier)
 cli.add_command(get_supplier)
@@ -231,9 +735,31 @@ cli.add_command(list_inputs)
 cli.add_command(create_stock_movement)
 cli.add_command(get_stock_movement)
 cli.add_command(list_stock_movements)
+cli.add_command(bulk_import_movements)
+cli.add_command(lookup)
+cli.add_command(get_stock_balance)
+cli.add_command(reconcile_stock_balances)
+cli.add_command(stock_as_of)
+cli.add_command(build_stock_checkpoints)
 cli.add_command(update_input)
 cli.add_command(delete_input)
+cli.add_command(bulk_update_inputs)
+cli.add_command(bulk_delete_inputs)
+cli.add_command(bulk_update_suppliers)
+cli.add_command(bulk_delete_suppliers)
+cli.add_command(bulk_update_stock_movements)
+cli.add_command(bulk_delete_stock_movements)
 cli.add_command(generate_report)
+cli.add_command(consumption_report)
+cli.add_command(forecast_reorders)
+cli.add_command(archive_ledger)
+cli.add_command(search_inputs)
+cli.add_command(build_search_index)
+cli.add_command(serve)
+cli.add_command(migrate)
+cli.add_command(explain_queries)
+cli.add_command(alerts)
+cli.add_command(watch_alerts)
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,188 @@
+"""
+Concurrency check of the stock debits: several threads take stock out of a few inputs at once,
+and the ledger is then checked for overselling.
+
+Usage (from the src folder):
+
+    python -m benchmarks.contention --threads 8 --inputs 1,8,64 --output contention.json
+    DB_URL=oracle+oracledb://... python -m benchmarks.contention --db_url env
+
+Every scenario starts from fresh inputs holding --stock units each; every thread makes
+--attempts debits of one unit on inputs picked at random among --inputs distinct ones. The
+'atomic' strategy uses StockMovementService.debit_stock (one conditional UPDATE); the 'naive'
+one reads the balance and then writes the movement, which is the race the atomic path avoids.
+Afterwards, the OUT movements of every input are compared with its initial stock and its
+balance. The script exits with status 1 if the atomic strategy oversold any input.
+
+SQLite allows a single writer at a time, so on the stand-in the throughput cannot grow with
+the number of distinct inputs; on Oracle the debits only lock the balance row of their input.
+Point --db_url at a scratch database: the scenarios insert suppliers, inputs and movements.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+import click
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import get_connection_string
+from migrations.runner import MigrationRunner
+from models.models import Input, StockBalance, StockMovement, Supplier
+from repository.stock_balances import StockBalanceRepository
+from repository.stock_movements import StockMovementRepository
+from service.stock_movements import InsufficientStockError, StockMovementService
+
+STRATEGIES = ('atomic', 'naive')
+
+
+def create_inputs(engine, count: int, stock: int) -> list[int]:
+    """Creates a supplier and count inputs holding stock units each, and returns the input IDs."""
+    with engine.begin() as connection:
+        supplier_id = connection.execute(insert(Supplier).values(name='Contention supplier')
+                                         .returning(Supplier.id)).scalar_one()
+        input_ids = []
+        for number in range(count):
+            input_ids.append(connection.execute(
+                insert(Input).values(name=f'Contention input {number}', category='tools', quantity=stock,
+                                     expiration_date=func.current_date(), supplier_id=supplier_id)
+                .returning(Input.id)
+            ).scalar_one())
+        connection.execute(insert(StockBalance), [{'input_id': input_id, 'quantity': stock} for input_id in input_ids])
+    return input_ids
+
+
+def debit_worker(session_factory, strategy: str, input_ids: list[int], attempts: int, think_ms: float, seed: int,
+                 totals: dict, lock: threading.Lock) -> None:
+    """Makes attempts debits of one unit on random inputs and adds its counts to totals."""
+    picker = random.Random(seed)
+    counts = {'debits': 0, 'refused': 0, 'retries': 0}
+    with session_factory() as session:
+        balances = StockBalanceRepository(session)
+        service = StockMovementService(StockMovementRepository(session), balances)
+        for _ in range(attempts):
+            input_id = picker.choice(input_ids)
+            while True:
+                try:
+                    if strategy == 'atomic':
+                        service.debit_stock(input_id, 1)
+                    else:
+                        balance = balances.get_balance_by_input_id(input_id)
+                        session.commit()
+                        time.sleep(think_ms / 1000)
+                        if balance.quantity < 1:
+                            raise InsufficientStockError(input_id, 1, balance.quantity)
+                        service.create_stock_movement(input_id, 1, 'OUT', date.today())
+                    counts['debits'] += 1
+                except InsufficientStockError:
+                    session.rollback()
+                    counts['refused'] += 1
+                except OperationalError:
+                    # the database stayed locked by other writers longer than the busy timeout
+                    session.rollback()
+                    counts['retries'] += 1
+                    continue
+                break
+    with lock:
+        for key, value in counts.items():
+            totals[key] += value
+
+
+def check_ledger(engine, input_ids: list[int], stock: int) -> dict:
+    """Compares the OUT movements and the balance of every input with its initial stock."""
+    with engine.connect() as connection:
+        taken = dict(connection.execute(
+            select(StockMovement.input_id, func.sum(StockMovement.quantity))
+            .where(StockMovement.input_id.in_(input_ids))
+            .group_by(StockMovement.input_id)
+        ).tuples().all())
+        balances = dict(connection.execute(
+            select(StockBalance.input_id, StockBalance.quantity).where(StockBalance.input_id.in_(input_ids))
+        ).tuples().all())
+    oversold = sum(max(0, int(taken.get(input_id, 0)) - stock) for input_id in input_ids)
+    inconsistent = sum(1 for input_id in input_ids if balances[input_id] != stock - taken.get(input_id, 0))
+    negative = sum(1 for input_id in input_ids if balances[input_id] < 0)
+    return {'oversold_units': oversold, 'negative_balances': negative, 'inconsistent_balances': inconsistent}
+
+
+def run_scenario(engine, strategy: str, distinct_inputs: int, threads: int, attempts: int, stock: int,
+                 think_ms: float) -> dict:
+    """Runs the debits of one scenario in parallel threads and checks the ledger afterwards."""
+    input_ids = create_inputs(engine, distinct_inputs, stock)
+    session_factory = sessionmaker(bind=engine)
+    totals = {'debits': 0, 'refused': 0, 'retries': 0}
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(target=debit_worker,
+                         args=(session_factory, strategy, input_ids, attempts, think_ms, seed, totals, lock))
+        for seed in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    operations = totals['debits'] + totals['refused']
+    return {
+        'strategy': strategy,
+        'distinct_inputs': distinct_inputs,
+        'threads': threads,
+        'elapsed_s': round(elapsed, 3),
+        **totals,
+        'operations_per_s': round(operations / elapsed, 1) if elapsed else None,
+        **check_ledger(engine, input_ids, stock),
+    }
+
+
+@click.command()
+@click.option('--threads', default=8, show_default=True, help='Concurrent writers.', type=click.IntRange(min=1))
+@click.option('--inputs', 'input_counts', default='1,8,64', show_default=True,
+              help='Comma-separated numbers of distinct inputs the writers debit.')
+@click.option('--attempts', default=200, show_default=True, help='Debits attempted by every writer.',
+              type=click.IntRange(min=1))
+@click.option('--stock', default=100, show_default=True, help='Initial stock of every input.',
+              type=click.IntRange(min=0))
+@click.option('--think_ms', default=1.0, show_default=True, type=float,
+              help='Pause of the naive strategy between reading the balance and writing the movement.')
+@click.option('--strategy', 'strategies', default='atomic,naive', show_default=True,
+              help='Comma-separated strategies to run: atomic, naive.')
+@click.option('--db_url', help="Database URL, or 'env' for the DB_* variables. A temporary SQLite file by default.")
+@click.option('--output', help='Path of a JSON file to save the results.')
+def main(threads, input_counts, attempts, stock, think_ms, strategies, db_url, output):
+    """Checks that concurrent stock debits never oversell."""
+    strategies = [strategy.strip() for strategy in strategies.split(',')]
+    unknown = [strategy for strategy in strategies if strategy not in STRATEGIES]
+    if unknown:
+        raise click.BadParameter(f"Unknown strategies: {', '.join(unknown)}", param_hint='--strategy')
+    if db_url is None:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'contention.sqlite')}"
+    elif db_url == 'env':
+        db_url = get_connection_string()
+    connect_args = {'timeout': 30, 'check_same_thread': False} if db_url.startswith('sqlite') else {}
+    engine = create_engine(db_url, pool_size=threads, connect_args=connect_args)
+    MigrationRunner(engine).upgrade()
+
+    results = {'database': engine.dialect.name, 'attempts_per_thread': attempts, 'stock_per_input': stock,
+               'scenarios': []}
+    for strategy in strategies:
+        for count in (int(value) for value in input_counts.split(',')):
+            results['scenarios'].append(run_scenario(engine, strategy, count, threads, attempts, stock, think_ms))
+
+    click.echo(json.dumps(results, indent=4))
+    if output:
+        with open(output, mode='w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+    failed = any(scenario['oversold_units'] or scenario['negative_balances'] or scenario['inconsistent_balances']
+                 for scenario in results['scenarios'] if scenario['strategy'] == 'atomic')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Synthetic data generator for benchmarks, built on the schema of models/models.py.
+"""
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from sqlalchemy import Engine, insert
+from sqlalchemy.orm import Session
+
+from models.models import Input, StockMovement, Supplier
+from repository.stock_balances import StockBalanceRepository
+
+CATEGORIES = ['seeds', 'fertilizers', 'pesticides', 'herbicides', 'fungicides', 'machinery parts', 'feed', 'tools']
+BATCH_SIZE = 10000
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    """
+    Number of rows generated for each table.
+    """
+    name: str
+    suppliers: int
+    inputs: int
+    movements: int
+
+
+DATASET_SIZES = {
+    'small': DatasetSize('small', suppliers=10, inputs=1000, movements=10000),
+    'medium': DatasetSize('medium', suppliers=100, inputs=10000, movements=100000),
+    'large': DatasetSize('large', suppliers=1000, inputs=100000, movements=1000000),
+    'xlarge': DatasetSize('xlarge', suppliers=2000, inputs=200000, movements=5000000),
+}
+
+
+def _insert_batches(engine: Engine, model, rows) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            with engine.begin() as connection:
+                connection.execute(insert(model), batch)
+            batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(insert(model), batch)
+
+
+def generate_dataset(engine: Engine, size: DatasetSize, seed: int = 42, start_date: date = date(2022, 1, 1),
+                     days: int = 3 * 365) -> None:
+    """
+    Fills an empty database with suppliers, inputs and stock movements, then rebuilds
+    the stock balances from the generated ledger.
+
+    IDs are assigned sequentially from 1, movements are spread over `days` days from
+    `start_date` and about 60% of them are IN movements.
+
+    :param engine: Engine of a database with the schema already created.
+    :param size: Number of rows per table.
+    :param seed: Seed of the random generator, so runs are reproducible.
+    :param start_date: Date of the oldest movement.
+    :param days: Number of days covered by the movements.
+    """
+    generator = random.Random(seed)
+    today = date.today()
+
+    _insert_batches(engine, Supplier, (
+        {'id': supplier_id, 'name': f'Supplier {supplier_id}', 'contact_info': f'contact{supplier_id}@example.com',
+         'address': f'Road {supplier_id}, km {generator.randint(1, 500)}'}
+        for supplier_id in range(1, size.suppliers + 1)
+    ))
+    _insert_batches(engine, Input, (
+        {'id': input_id, 'name': f'Input {input_id}', 'category': generator.choice(CATEGORIES),
+         'quantity': generator.randint(0, 1000),
+         'expiration_date': today + timedelta(days=generator.randint(-30, 3 * 365)),
+         'supplier_id': generator.randint(1, size.suppliers)}
+        for input_id in range(1, size.inputs + 1)
+    ))
+    _insert_batches(engine, StockMovement, (
+        {'id': movement_id, 'input_id': generator.randint(1, size.inputs),
+         'quantity': generator.randint(1, 100),
+         'movement_type': 'IN' if generator.random() < 0.6 else 'OUT',
+         'movement_date': start_date + timedelta(days=generator.randrange(days))}
+        for movement_id in range(1, size.movements + 1)
+    ))
+
+    with Session(engine) as session:
+        StockBalanceRepository(session).rebuild_from_ledger()
@@ -0,0 +1,718 @@
+"""
+Benchmark suite for the repositories, services and CLI commands on a seeded SQLite stand-in.
+
+Usage (from the src folder):
+
+    python -m benchmarks.run --sizes small,medium --repeat 3 --output results.json
+    python -m benchmarks.run --sizes small --compare results.json --tolerance 0.2
+
+For every dataset size, a SQLite database is created with the migrations and filled by
+benchmarks.datagen; then each benchmark is timed --repeat times. Results are written as
+JSON so runs can be compared: with --compare, the medians are checked against a previous
+results file and the command exits with status 1 when a benchmark got slower than the
+tolerance allows.
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+import click
+import sqlalchemy
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.datagen import DATASET_SIZES, DatasetSize, generate_dataset
+from context import AppContext
+from database import get_async_connection_string
+from migrations.runner import MigrationRunner
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+BENCHMARKS = {}
+
+
+class BenchmarkContext:
+    """
+    Database and dataset a benchmark runs against.
+    """
+
+    def __init__(self, engine: Engine, db_url: str, size: DatasetSize, seed: int):
+        self.engine = engine
+        self.db_url = db_url
+        self.size = size
+        self.random = random.Random(seed)
+
+    def app_context(self) -> AppContext:
+        """Returns a new application context, with its own session, over the benchmark database."""
+        return AppContext(engine_factory=lambda: self.engine,
+                          async_engine_factory=lambda: create_async_engine(get_async_connection_string(self.db_url)))
+
+    def random_ids(self, count: int, upper: int) -> list[int]:
+        return [self.random.randint(1, upper) for _ in range(count)]
+
+
+def benchmark(name: str):
+    """
+    Registers a benchmark. The decorated function receives a BenchmarkContext, does its setup
+    and returns the timed callable, which returns the number of operations it performed.
+    """
+    def decorator(function: Callable[[BenchmarkContext], Callable[[], int]]):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+def _timed_lookups(context: BenchmarkContext, upper: int, lookup: Callable[[AppContext, int], object],
+                   count: int = 500) -> Callable[[], int]:
+    ids = context.random_ids(count, upper)
+
+    def run() -> int:
+        app_context = context.app_context()
+        for item_id in ids:
+            lookup(app_context, item_id)
+        app_context.close()
+        return len(ids)
+    return run
+
+
+@benchmark('service.fetch_supplier')
+def bench_fetch_supplier(context: BenchmarkContext):
+    return _timed_lookups(context, context.size.suppliers,
+                          lambda app_context, item_id: app_context.supplier_service.fetch_supplier(item_id))
+
+
+@benchmark('service.get_input')
+def bench_get_input(context: BenchmarkContext):
+    return _timed_lookups(context, context.size.inputs,
+                          lambda app_context, item_id: app_context.input_service.get_input(item_id))
+
+
+@benchmark('service.get_stock_movement')
+def bench_get_stock_movement(context: BenchmarkContext):
+    return _timed_lookups(context, context.size.movements,
+                          lambda app_context, item_id: app_context.stock_movement_service.get_stock_movement(item_id))
+
+
+@benchmark('service.get_stock_balance')
+def bench_get_stock_balance(context: BenchmarkContext):
+    return _timed_lookups(context, context.size.inputs,
+                          lambda app_context, item_id: app_context.stock_balance_service.get_balance(item_id))
+
+
+@benchmark('service.stock_as_of')
+def bench_stock_as_of(context: BenchmarkContext):
+    app_context = context.app_context()
+    app_context.stock_balance_service.build_checkpoints('month')
+    app_context.close()
+    as_of = date(2024, 6, 15)
+    return _timed_lookups(context, context.size.inputs,
+                          lambda app_context, item_id: app_context.stock_balance_service.get_balance_as_of(item_id,
+                                                                                                          as_of))
+
+
+@benchmark('service.build_stock_checkpoints')
+def bench_build_stock_checkpoints(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = app_context.stock_balance_service.build_checkpoints('month')['checkpoints']
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('service.create_input')
+def bench_create_input(context: BenchmarkContext):
+    supplier_ids = context.random_ids(200, context.size.suppliers)
+    expiration_date = date.today() + timedelta(days=365)
+
+    def run() -> int:
+        app_context = context.app_context()
+        for supplier_id in supplier_ids:
+            app_context.input_service.create_input('Benchmark input', 'seeds', 10, expiration_date, supplier_id)
+        app_context.close()
+        return len(supplier_ids)
+    return run
+
+
+@benchmark('service.update_input')
+def bench_update_input(context: BenchmarkContext):
+    input_ids = context.random_ids(200, context.size.inputs)
+    expiration_date = date.today() + timedelta(days=365)
+
+    def run() -> int:
+        app_context = context.app_context()
+        for input_id in input_ids:
+            app_context.input_service.update_input(input_id, f'Input {input_id}', 'seeds', 10, expiration_date, 1)
+        app_context.close()
+        return len(input_ids)
+    return run
+
+
+@benchmark('service.bulk_update_inputs')
+def bench_bulk_update_inputs(context: BenchmarkContext):
+    input_ids = context.random_ids(5000, context.size.inputs)
+
+    def run() -> int:
+        app_context = context.app_context()
+        app_context.input_service.bulk_update_inputs({'category': 'seeds', 'quantity': 10}, input_ids)
+        app_context.close()
+        return len(input_ids)
+    return run
+
+
+@benchmark('service.create_stock_movement')
+def bench_create_stock_movement(context: BenchmarkContext):
+    input_ids = context.random_ids(200, context.size.inputs)
+
+    def run() -> int:
+        app_context = context.app_context()
+        for input_id in input_ids:
+            app_context.stock_movement_service.create_stock_movement(input_id, 5, 'IN', date.today())
+        app_context.close()
+        return len(input_ids)
+    return run
+
+
+@benchmark('service.update_stock_movement')
+def bench_update_stock_movement(context: BenchmarkContext):
+    movement_ids = context.random_ids(200, context.size.movements)
+    input_ids = context.random_ids(200, context.size.inputs)
+
+    def run() -> int:
+        app_context = context.app_context()
+        for movement_id, input_id in zip(movement_ids, input_ids):
+            app_context.stock_movement_service.update_stock_movement(movement_id, input_id, 5, 'IN')
+        app_context.close()
+        return len(movement_ids)
+    return run
+
+
+@benchmark('service.delete_stock_movement')
+def bench_delete_stock_movement(context: BenchmarkContext):
+    input_ids = context.random_ids(200, context.size.inputs)
+
+    def run() -> int:
+        app_context = context.app_context()
+        service = app_context.stock_movement_service
+        movement_ids = [service.create_stock_movement(input_id, 1, 'IN', date.today()).id for input_id in input_ids]
+        for movement_id in movement_ids:
+            service.delete_stock_movement(movement_id)
+        app_context.close()
+        return len(movement_ids) * 2
+    return run
+
+
+@benchmark('service.bulk_update_stock_movements')
+def bench_bulk_update_stock_movements(context: BenchmarkContext):
+    movement_ids = context.random_ids(5000, context.size.movements)
+
+    def run() -> int:
+        app_context = context.app_context()
+        app_context.stock_movement_service.bulk_update_stock_movements(movement_ids, {'quantity': 5})
+        app_context.close()
+        return len(movement_ids)
+    return run
+
+
+@benchmark('service.bulk_import_stock_movements')
+def bench_bulk_import(context: BenchmarkContext):
+    rows = [
+        (line_number, {'input_id': input_id, 'quantity': 3, 'movement_type': 'IN', 'movement_date': '2024-01-01'})
+        for line_number, input_id in enumerate(context.random_ids(10000, context.size.inputs), start=2)
+    ]
+
+    def run() -> int:
+        app_context = context.app_context()
+        result = app_context.stock_movement_service.bulk_import_stock_movements(rows)
+        app_context.close()
+        return result.imported
+    return run
+
+
+@benchmark('service.stream_movement_report')
+def bench_stream_movement_report(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = sum(1 for _ in app_context.stock_movement_service.stream_movement_report())
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('service.incremental_export')
+def bench_incremental_export(context: BenchmarkContext):
+    from service.incremental_export import IncrementalReportExporter
+
+    output = os.path.join(tempfile.mkdtemp(), 'movements.csv')
+    app_context = context.app_context()
+    IncrementalReportExporter(app_context.stock_movement_service.repository).export(output, rebuild=True)
+    app_context.close()
+
+    def run() -> int:
+        app_context = context.app_context()
+        movement_ids = context.random_ids(100, context.size.movements)
+        for movement_id in movement_ids:
+            app_context.stock_movement_service.update_stock_movement(movement_id, 1, 5, 'IN')
+        result = IncrementalReportExporter(app_context.stock_movement_service.repository).export(output)
+        app_context.close()
+        return result.changed_rows + result.new_rows
+    return run
+
+
+@benchmark('repository.generate_movement_report')
+def bench_generate_movement_report(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = len(app_context.stock_movement_service.generate_movement_report())
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('service.parallel_movement_report')
+def bench_parallel_movement_report(context: BenchmarkContext):
+    from service.parallel_report import write_movement_report_parallel
+
+    def run() -> int:
+        app_context = context.app_context()
+        with open(os.devnull, 'w', newline='', encoding='utf-8') as file:
+            count = write_movement_report_parallel(app_context.session_factory, file, workers=4)
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('async.generate_movement_report')
+def bench_async_generate_movement_report(context: BenchmarkContext):
+    async def generate(app_context: AppContext) -> int:
+        try:
+            return len(await app_context.async_stock_movement_service.generate_movement_report())
+        finally:
+            await app_context.aclose()
+
+    def run() -> int:
+        return asyncio.run(generate(context.app_context()))
+    return run
+
+
+@benchmark('async.lookup')
+def bench_async_lookup(context: BenchmarkContext):
+    supplier_ids = context.random_ids(100, context.size.suppliers)
+    input_ids = context.random_ids(500, context.size.inputs)
+    movement_ids = context.random_ids(500, context.size.movements)
+
+    async def lookup(app_context: AppContext) -> int:
+        try:
+            results = await asyncio.gather(
+                app_context.async_supplier_service.fetch_suppliers(supplier_ids),
+                app_context.async_input_service.get_inputs(input_ids),
+                app_context.async_stock_movement_service.get_stock_movements(movement_ids),
+            )
+            return sum(len(result) for result in results)
+        finally:
+            await app_context.aclose()
+
+    def run() -> int:
+        return asyncio.run(lookup(context.app_context()))
+    return run
+
+
+@benchmark('service.consumption_report')
+def bench_consumption_report(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = sum(1 for _ in app_context.analytics_service.consumption_report('month', 'input'))
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('repository.get_all_stock_movements')
+def bench_get_all_stock_movements(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = len(app_context.stock_movement_service.repository.get_all_stock_movements())
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('analytics.ledger_snapshot')
+def bench_ledger_snapshot(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = len(app_context.analytics_service.ledger_snapshot())
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('analytics.snapshot_aggregates')
+def bench_snapshot_aggregates(context: BenchmarkContext):
+    app_context = context.app_context()
+    snapshot = app_context.analytics_service.ledger_snapshot()
+    app_context.close()
+
+    def run() -> int:
+        snapshot.balances()
+        for period in ('day', 'week', 'month'):
+            snapshot.period_totals(period)
+        snapshot.top_consumers(10)
+        return 5
+    return run
+
+
+def _loaded_records(context: BenchmarkContext, count: int = 5000) -> list:
+    app_context = context.app_context()
+    records = [*app_context.input_service.iter_inputs(limit=count),
+               *app_context.stock_movement_service.iter_stock_movements(limit=count)]
+    app_context.close()
+    return records
+
+
+def _reorder_forecast_benchmark(context: BenchmarkContext, use_numpy: bool) -> Callable[[], int]:
+    from repository.analytics import AnalyticsRepository
+    from service.reorder_forecast import ForecastParameters, ReorderForecaster
+
+    # the generated movements cover 2022-2024, so the window ends with them instead of today
+    parameters = ForecastParameters(window_days=365)
+
+    def run() -> int:
+        app_context = context.app_context()
+        forecaster = ReorderForecaster(AnalyticsRepository(app_context.session), clock=lambda: date(2024, 12, 31))
+        forecast = forecaster.forecast(parameters, use_numpy)
+        rows = sum(1 for _ in forecast.rows())
+        app_context.close()
+        return rows
+    return run
+
+
+@benchmark('analytics.reorder_forecast')
+def bench_reorder_forecast(context: BenchmarkContext):
+    return _reorder_forecast_benchmark(context, use_numpy=None)
+
+
+@benchmark('analytics.reorder_forecast_loops')
+def bench_reorder_forecast_loops(context: BenchmarkContext):
+    return _reorder_forecast_benchmark(context, use_numpy=False)
+
+
+def _search_queries(context: BenchmarkContext, count: int = 200) -> list[tuple[str, str]]:
+    queries = []
+    for input_id in context.random_ids(count, context.size.inputs):
+        mode = context.random.choice(['prefix', 'substring', 'token'])
+        text = {'prefix': f'input {input_id}', 'substring': f'ut {input_id}'[:6],
+                'token': f'supplier {input_id % context.size.suppliers + 1} input'}[mode]
+        queries.append((text, mode))
+    return queries
+
+
+def _search_benchmark(context: BenchmarkContext, use_index: bool) -> Callable[[], int]:
+    from service.search import SearchIndexStore, SearchService
+
+    queries = _search_queries(context)
+    # the index is built during the setup, like a server that has already answered a search
+    store = SearchIndexStore(os.path.join(tempfile.mkdtemp(), 'search.idx'), refresh_seconds=3600)
+    app_context = context.app_context()
+    SearchService(app_context.input_repository, store).build_index()
+    app_context.close()
+
+    def run() -> int:
+        app_context = context.app_context()
+        service = SearchService(app_context.input_repository, store)
+        for text, mode in queries:
+            service.search(text, mode, limit=20, use_index=use_index)
+        app_context.close()
+        return len(queries)
+    return run
+
+
+@benchmark('search.index')
+def bench_search_index(context: BenchmarkContext):
+    return _search_benchmark(context, use_index=True)
+
+
+@benchmark('search.sql')
+def bench_search_sql(context: BenchmarkContext):
+    return _search_benchmark(context, use_index=False)
+
+
+@benchmark('search.build_index')
+def bench_build_search_index(context: BenchmarkContext):
+    from service.search import SearchIndexStore, SearchService
+
+    path = os.path.join(tempfile.mkdtemp(), 'search.idx')
+
+    def run() -> int:
+        app_context = context.app_context()
+        result = SearchService(app_context.input_repository, SearchIndexStore(path)).build_index()
+        app_context.close()
+        return result.size
+    return run
+
+
+# movements dated before this day are moved to the archive files of the archive.* benchmarks
+ARCHIVE_BEFORE = date(2024, 1, 1)
+
+_archived_databases = {}
+
+
+def _archived_database(context: BenchmarkContext) -> tuple[Engine, str]:
+    """
+    Copies the benchmark database and archives its movements dated before ARCHIVE_BEFORE, once
+    per database, so the benchmarks on the archive leave the original untouched.
+
+    :return: The engine of the copy and the directory of its archive files.
+    """
+    from repository.archive import LedgerArchiveRepository
+    from service.ledger_archive import LedgerArchiveService
+
+    if context.db_url not in _archived_databases:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'archived.sqlite')
+        shutil.copyfile(context.engine.url.database, path)
+        engine = create_engine(f'sqlite:///{path}')
+        archive_directory = os.path.join(directory, 'archive')
+        with Session(engine) as session:
+            LedgerArchiveService(LedgerArchiveRepository(session), archive_directory).archive(ARCHIVE_BEFORE)
+        _archived_databases[context.db_url] = engine, archive_directory
+    return _archived_databases[context.db_url]
+
+
+def _archived_movement_service(session: Session, archive_directory: str):
+    from repository.archive import LedgerArchiveRepository
+    from repository.stock_movements import StockMovementRepository
+    from service.ledger_archive import LedgerArchiveService
+    from service.stock_movements import StockMovementService
+
+    archive = LedgerArchiveService(LedgerArchiveRepository(session), archive_directory)
+    return StockMovementService(StockMovementRepository(session), archive=archive)
+
+
+@benchmark('archive.get_all_stock_movements')
+def bench_archived_get_all_stock_movements(context: BenchmarkContext):
+    engine, archive_directory = _archived_database(context)
+
+    def run() -> int:
+        with Session(engine) as session:
+            return len(_archived_movement_service(session, archive_directory).get_all_stock_movements())
+    return run
+
+
+@benchmark('archive.stream_movement_report')
+def bench_archived_stream_movement_report(context: BenchmarkContext):
+    engine, archive_directory = _archived_database(context)
+
+    def run() -> int:
+        with Session(engine) as session:
+            return sum(1 for _ in _archived_movement_service(session, archive_directory).stream_movement_report())
+    return run
+
+
+@benchmark('serialization.serialize_model')
+def bench_serialize_model(context: BenchmarkContext):
+    from serialization import serialize_model
+    records = _loaded_records(context)
+
+    def run() -> int:
+        for record in records:
+            json.dumps(serialize_model(record), default=str)
+        return len(records)
+    return run
+
+
+@benchmark('serialization.to_dict')
+def bench_to_dict(context: BenchmarkContext):
+    from serialization import compact_encoder, to_dict
+    records = _loaded_records(context)
+
+    def run() -> int:
+        for record in records:
+            compact_encoder.encode(to_dict(record))
+        return len(records)
+    return run
+
+
+@benchmark('service.expiration_alerts')
+def bench_expiration_alerts(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        count = sum(1 for _ in app_context.alert_service.expiration_alerts(30))
+        app_context.close()
+        return count
+    return run
+
+
+@benchmark('service.reconcile_stock_balances')
+def bench_reconcile(context: BenchmarkContext):
+    def run() -> int:
+        app_context = context.app_context()
+        result = app_context.stock_balance_service.reconcile()
+        app_context.close()
+        return result['balances']
+    return run
+
+
+def _cli_benchmark(*arguments: str):
+    def factory(context: BenchmarkContext):
+        environment = {**os.environ, 'DB_URL': context.db_url}
+
+        def run() -> int:
+            subprocess.run([sys.executable, 'app.py', *arguments], cwd=SRC_DIR, env=environment,
+                           stdout=subprocess.DEVNULL, check=True)
+            return 1
+        return run
+    return factory
+
+
+benchmark('cli.list-suppliers')(_cli_benchmark('list-suppliers'))
+benchmark('cli.list-inputs')(_cli_benchmark('list-inputs'))
+benchmark('cli.list-inputs --ndjson')(_cli_benchmark('list-inputs', '--ndjson'))
+benchmark('cli.list-stock-movements --ndjson')(_cli_benchmark('list-stock-movements', '--ndjson'))
+benchmark('cli.generate-report')(_cli_benchmark('generate-report', '--output', os.devnull))
+
+
+def prepare_database(size: DatasetSize, seed: int, db_dir: str, reuse: bool) -> tuple[Engine, str]:
+    """
+    Creates (or reuses) the SQLite database of a dataset size.
+
+    :return: The engine and the URL of the database.
+    """
+    path = os.path.join(db_dir, f'benchmark-{size.name}-{seed}.sqlite')
+    exists = os.path.exists(path)
+    if exists and not reuse:
+        os.remove(path)
+    db_url = f'sqlite:///{path}'
+    engine = create_engine(db_url)
+    # reused databases may predate the latest migrations
+    MigrationRunner(engine).upgrade()
+    if not (exists and reuse):
+        started = time.perf_counter()
+        generate_dataset(engine, size, seed)
+        click.echo(f'Generated dataset {size.name} in {time.perf_counter() - started:.1f}s', err=True)
+    return engine, db_url
+
+
+def run_benchmark(name: str, context: BenchmarkContext, repeat: int) -> dict:
+    """
+    Runs a benchmark repeat times.
+
+    :return: Dictionary with the timings of the benchmark.
+    """
+    run = BENCHMARKS[name](context)
+    timings = []
+    operations = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operations = run()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        'dataset': context.size.name,
+        'benchmark': name,
+        'operations': operations,
+        'median_s': round(median, 6),
+        'min_s': round(min(timings), 6),
+        'max_s': round(max(timings), 6),
+        'operations_per_s': round(operations / median, 1) if median else None,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """
+    Compares the medians of two runs.
+
+    :return: List of the benchmarks present in both runs, with their ratio and regression flag.
+    """
+    previous = {(item['dataset'], item['benchmark']): item for item in baseline}
+    comparison = []
+    for item in results:
+        old = previous.get((item['dataset'], item['benchmark']))
+        if old is None or not old['median_s']:
+            continue
+        ratio = item['median_s'] / old['median_s']
+        comparison.append({
+            'dataset': item['dataset'],
+            'benchmark': item['benchmark'],
+            'baseline_median_s': old['median_s'],
+            'median_s': item['median_s'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + tolerance,
+        })
+    return comparison
+
+
+@click.command()
+@click.option('--sizes', default='small,medium', show_default=True,
+              help=f"Comma-separated dataset sizes: {', '.join(DATASET_SIZES)}.")
+@click.option('--only', help='Comma-separated benchmark names (or prefixes) to run.')
+@click.option('--repeat', default=3, show_default=True, help='Runs per benchmark.', type=click.IntRange(min=1))
+@click.option('--seed', default=42, show_default=True, help='Seed of the data generator.', type=int)
+@click.option('--db_dir', help='Folder for the benchmark databases. A temporary folder is used when omitted.')
+@click.option('--reuse', is_flag=True, help='Reuse the databases already generated in --db_dir.')
+@click.option('--output', help='Path of a JSON file to save the results.')
+@click.option('--compare', 'baseline_path', help='Results file of a previous run to compare against.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed slowdown before flagging a regression.',
+              type=float)
+def main(sizes, only, repeat, seed, db_dir, reuse, output, baseline_path, tolerance):
+    """Runs the benchmark suite."""
+    # measure the database, not the lookup caches
+    os.environ['CACHE_MAX_SIZE'] = '0'
+    selected = [name for name in BENCHMARKS
+                if not only or any(name.startswith(prefix.strip()) for prefix in only.split(','))]
+    db_dir = db_dir or tempfile.mkdtemp(prefix='farmtech-benchmarks-')
+    os.makedirs(db_dir, exist_ok=True)
+
+    results = []
+    for size_name in sizes.split(','):
+        size = DATASET_SIZES[size_name.strip()]
+        engine, db_url = prepare_database(size, seed, db_dir, reuse)
+        context = BenchmarkContext(engine, db_url, size, seed)
+        for name in selected:
+            result = run_benchmark(name, context, repeat)
+            click.echo(f"{size.name:>8} {name:<45} {result['median_s']:>10.4f}s "
+                       f"{result['operations_per_s'] or 0:>12.1f} ops/s", err=True)
+            results.append(result)
+        engine.dispose()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'sizes': {name.strip(): vars(DATASET_SIZES[name.strip()]) for name in sizes.split(',')},
+        },
+        'results': results,
+    }
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as file:
+            report['comparison'] = compare(results, json.load(file)['results'], tolerance)
+        regressions = [item for item in report['comparison'] if item['regression']]
+        for item in regressions:
+            click.echo(f"REGRESSION {item['dataset']} {item['benchmark']}: {item['ratio']}x", err=True)
+
+    if output:
+        with open(output, mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+    else:
+        click.echo(json.dumps(report, indent=4))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
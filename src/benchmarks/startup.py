@@ -0,0 +1,84 @@
+"""
+Measures the startup time of the CLI for commands that must not touch the database.
+
+Usage (from the src folder):
+
+    python -m benchmarks.startup --runs 10 --max_ms 150 --output startup.json
+
+Each command is run in a fresh interpreter; the time of an empty interpreter is
+measured too, so the overhead of the application itself can be told apart. The
+script exits with status 1 if the median of any command exceeds --max_ms, or if
+importing app.py loads SQLAlchemy, the Oracle driver or numpy.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+COMMANDS = {
+    'interpreter': [sys.executable, '-c', 'pass'],
+    'help': [sys.executable, 'app.py', '--help'],
+    'command_help': [sys.executable, 'app.py', 'create-supplier', '--help'],
+    'unknown_command': [sys.executable, 'app.py', 'no-such-command'],
+}
+
+HEAVY_MODULES = ('sqlalchemy', 'oracledb', 'numpy')
+
+
+def time_command(argv: list[str], runs: int) -> list[float]:
+    """Runs a command several times and returns the wall time of each run, in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(argv, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def heavy_modules_loaded_by_import() -> list[str]:
+    """Returns the heavy modules loaded by importing app.py."""
+    code = (
+        'import sys, app; '
+        f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True).stdout
+    return [module for module in output.strip().split(',') if module]
+
+
+@click.command()
+@click.option('--runs', default=10, show_default=True, help='Runs per command.', type=click.IntRange(min=1))
+@click.option('--max_ms', type=float, help='Fail if the median time of a CLI command exceeds this value.')
+@click.option('--output', help='Path of a JSON file to save the results.')
+def main(runs, max_ms, output):
+    """Measures the startup time of the CLI."""
+    results = {'python': sys.version.split()[0], 'runs': runs, 'commands': {}}
+    for name, argv in COMMANDS.items():
+        timings = time_command(argv, runs)
+        results['commands'][name] = {
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+        }
+    results['heavy_modules_on_import'] = heavy_modules_loaded_by_import()
+
+    click.echo(json.dumps(results, indent=4))
+    if output:
+        with open(output, mode='w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+
+    failed = bool(results['heavy_modules_on_import'])
+    if max_ms is not None:
+        failed = failed or any(
+            result['median_ms'] > max_ms for name, result in results['commands'].items() if name != 'interpreter'
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
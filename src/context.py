@@ -0,0 +1,206 @@
+from functools import cached_property
+
+
+class AppContext:
+    """
+    Lazily wires the engine, session, repositories and services of the application.
+
+    Nothing is imported or connected until a command first uses one of the properties,
+    which keeps `--help` and argument errors fast.
+    """
+
+    def __init__(self, engine_factory=None, session=None, async_engine_factory=None):
+        """
+        Initializes the context.
+
+        :param engine_factory: Callable returning the SQLAlchemy engine. Defaults to database.create_app_engine.
+        :param session: Existing session to be used by the repositories, instead of opening a new one.
+        :param async_engine_factory: Callable returning the SQLAlchemy asyncio engine used by the async
+            services. Defaults to database.create_async_app_engine.
+        """
+        self.engine_factory = engine_factory
+        self.async_engine_factory = async_engine_factory
+        self.profiler = None
+        if session is not None:
+            self.__dict__['session'] = session
+
+    def enable_profiling(self, profiler) -> None:
+        """
+        Records the statements of the engine and the calls of the services created from now on.
+
+        :param profiler: instrumentation.QueryProfiler collecting the measurements.
+        """
+        self.profiler = profiler
+        if 'engine' in self.__dict__:
+            profiler.attach(self.engine)
+        if 'async_engine' in self.__dict__:
+            profiler.attach(self.async_engine.sync_engine)
+
+    def _profiled(self, service, name: str):
+        if self.profiler is None:
+            return service
+        return self.profiler.wrap(service, name)
+
+    @cached_property
+    def engine(self):
+        if self.engine_factory is None:
+            from database import create_app_engine
+            engine = create_app_engine()
+        else:
+            engine = self.engine_factory()
+        if self.profiler is not None:
+            self.profiler.attach(engine)
+        return engine
+
+    @cached_property
+    def session_factory(self):
+        from sqlalchemy.orm import sessionmaker
+
+        return sessionmaker(bind=self.engine)
+
+    @cached_property
+    def session(self):
+        return self.session_factory()
+
+    @cached_property
+    def supplier_service(self):
+        from repository.supplier import SupplierRepository
+        from service.cache import get_cache
+        from service.supplier import SupplierService
+
+        service = SupplierService(SupplierRepository(self.session), get_cache('suppliers'))
+        return self._profiled(service, 'supplier_service')
+
+    @cached_property
+    def input_service(self):
+        from service.cache import get_cache
+        from service.supplier_inputs import InputService
+
+        service = InputService(self.input_repository, self.supplier_service, get_cache('inputs'))
+        return self._profiled(service, 'input_service')
+
+    @cached_property
+    def stock_balance_repository(self):
+        from repository.stock_balances import StockBalanceRepository
+
+        return StockBalanceRepository(self.session)
+
+    @cached_property
+    def stock_movement_service(self):
+        from repository.stock_movements import StockMovementRepository
+        from service.stock_movements import StockMovementService
+
+        service = StockMovementService(StockMovementRepository(self.session), self.stock_balance_repository,
+                                       self.ledger_archive_service)
+        return self._profiled(service, 'stock_movement_service')
+
+    @cached_property
+    def stock_balance_service(self):
+        from service.stock_balances import StockBalanceService
+
+        service = StockBalanceService(self.stock_balance_repository, self.ledger_archive_service)
+        return self._profiled(service, 'stock_balance_service')
+
+    @cached_property
+    def input_repository(self):
+        from repository.inputs import InputRepository
+
+        return InputRepository(self.session)
+
+    @cached_property
+    def alert_service(self):
+        from service.alerts import AlertService
+
+        service = AlertService(self.input_repository)
+        return self._profiled(service, 'alert_service')
+
+    @cached_property
+    def analytics_service(self):
+        from repository.analytics import AnalyticsRepository
+        from service.analytics import AnalyticsService
+
+        service = AnalyticsService(AnalyticsRepository(self.session), self.ledger_archive_service)
+        return self._profiled(service, 'analytics_service')
+
+    @cached_property
+    def ledger_archive_service(self):
+        import os
+
+        from repository.archive import LedgerArchiveRepository
+        from service.ledger_archive import LedgerArchiveService
+
+        directory = os.getenv('LEDGER_ARCHIVE_DIR', 'ledger-archive')
+        service = LedgerArchiveService(LedgerArchiveRepository(self.session), directory)
+        return self._profiled(service, 'ledger_archive_service')
+
+    @cached_property
+    def search_service(self):
+        from service.search import SearchService, get_index_store
+
+        service = SearchService(self.input_repository, get_index_store())
+        return self._profiled(service, 'search_service')
+
+    @cached_property
+    def async_engine(self):
+        if self.async_engine_factory is None:
+            from database import create_async_app_engine
+            engine = create_async_app_engine()
+        else:
+            engine = self.async_engine_factory()
+        if self.profiler is not None:
+            self.profiler.attach(engine.sync_engine)
+        return engine
+
+    @cached_property
+    def async_session_factory(self):
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        return async_sessionmaker(self.async_engine, expire_on_commit=False)
+
+    @cached_property
+    def async_supplier_service(self):
+        from repository.async_repositories import AsyncSupplierRepository
+        from service.async_services import AsyncSupplierService
+        from service.cache import get_cache
+
+        service = AsyncSupplierService(AsyncSupplierRepository(self.async_session_factory), get_cache('suppliers'))
+        return self._profiled(service, 'async_supplier_service')
+
+    @cached_property
+    def async_input_service(self):
+        from repository.async_repositories import AsyncInputRepository
+        from service.async_services import AsyncInputService
+        from service.cache import get_cache
+
+        service = AsyncInputService(AsyncInputRepository(self.async_session_factory), self.async_supplier_service,
+                                    get_cache('inputs'))
+        return self._profiled(service, 'async_input_service')
+
+    @cached_property
+    def async_stock_movement_service(self):
+        from repository.async_repositories import AsyncStockMovementRepository
+        from service.async_services import AsyncStockMovementService
+
+        service = AsyncStockMovementService(AsyncStockMovementRepository(self.async_session_factory),
+                                            archive=self.ledger_archive_service)
+        return self._profiled(service, 'async_stock_movement_service')
+
+    def unit_of_work(self):
+        """
+        Returns a unit of work over the session of the services, to group their writes in one transaction.
+
+        :return: service.unit_of_work.UnitOfWork, to be used as a context manager.
+        """
+        from service.unit_of_work import UnitOfWork
+
+        return UnitOfWork(self.session)
+
+    def close(self) -> None:
+        """Closes the session, if it was opened."""
+        if 'session' in self.__dict__:
+            self.session.close()
+
+    async def aclose(self) -> None:
+        """Disposes of the asyncio engine, if it was created. Must run in the event loop that used it."""
+        if 'async_engine' in self.__dict__:
+            await self.async_engine.dispose()
@@ -0,0 +1,133 @@
+import os
+from typing import Optional
+
+REQUIRED_ENV_VARS = [
+    'DB_USER',
+    'DB_PASSWORD',
+    'DB_HOSTNAME',
+    'DB_PORT',
+    'DB_SERVICE_NAME',
+]
+
+
+def env_flag(value: str) -> bool:
+    """Parses a boolean environment variable (1, true, yes or on, in any case)."""
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+POOL_ENV_VARS = {
+    'DB_POOL_SIZE': ('pool_size', int),
+    'DB_MAX_OVERFLOW': ('max_overflow', int),
+    'DB_POOL_RECYCLE': ('pool_recycle', int),
+    'DB_POOL_TIMEOUT': ('pool_timeout', float),
+    'DB_POOL_PRE_PING': ('pool_pre_ping', env_flag),
+}
+
+
+def validate_env() -> None:
+    """Validates the required environment variables."""
+    if os.getenv('DB_URL'):
+        return
+    for var in REQUIRED_ENV_VARS:
+        if not os.getenv(var):
+            raise EnvironmentError(f"Required environment variable {var} is missing")
+
+
+def get_connection_string() -> str:
+    """
+    Builds the Oracle connection string from the environment variables. DB_URL, when set,
+    replaces it with any SQLAlchemy URL (e.g. sqlite:///farmtech.db for a local stand-in).
+    """
+    if os.getenv('DB_URL'):
+        return os.getenv('DB_URL')
+    db_user = os.getenv('DB_USER')
+    db_password = os.getenv('DB_PASSWORD')
+    db_hostname = os.getenv('DB_HOSTNAME')
+    db_port = os.getenv('DB_PORT')
+    db_service_name = os.getenv('DB_SERVICE_NAME')
+    return f'oracle+oracledb://{db_user}:{db_password}@{db_hostname}:{db_port}/?service_name={db_service_name}'
+
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'oracle': 'oracle+oracledb_async',
+    'oracle+oracledb': 'oracle+oracledb_async',
+}
+
+
+def get_async_connection_string(connection_string: Optional[str] = None) -> str:
+    """
+    Converts a connection string to the asyncio driver of its database: the async mode of
+    oracledb for Oracle and aiosqlite for SQLite. Other URLs are returned unchanged.
+
+    :param connection_string: URL to be converted. Defaults to get_connection_string().
+    :return: The asyncio URL.
+    """
+    connection_string = connection_string or get_connection_string()
+    scheme, separator, rest = connection_string.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+def get_pool_options(connection_string: str) -> dict:
+    """
+    Reads the connection pool settings (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT and DB_POOL_PRE_PING) from the environment.
+
+    :param connection_string: URL of the database, used to skip the settings its pool does not support.
+    :return: Keyword arguments for create_engine.
+    """
+    options = {}
+    for var, (option, convert) in POOL_ENV_VARS.items():
+        value = os.getenv(var)
+        if value:
+            options[option] = convert(value)
+    if connection_string.startswith('sqlite') and (':memory:' in connection_string
+                                                    or connection_string.rstrip('/') == 'sqlite:'):
+        # in-memory SQLite uses a single connection per thread, which has no size or overflow
+        options.pop('max_overflow', None)
+        options.pop('pool_timeout', None)
+    return options
+
+
+def create_app_engine():
+    """
+    Creates the SQLAlchemy engine of the application. SQLAlchemy and the database
+    driver are only imported here, so commands that never touch the database do not pay for them.
+    Statements are logged when the DEBUG environment variable is set to a true value.
+    """
+    from sqlalchemy import create_engine
+
+    validate_env()
+    connection_string = get_connection_string()
+    return create_engine(connection_string, echo=env_flag(os.getenv('DEBUG', '')), **get_pool_options(connection_string))
+
+
+def create_async_app_engine():
+    """
+    Creates the SQLAlchemy asyncio engine of the application, with the same pool settings
+    as create_app_engine. Requires aiosqlite for SQLite; oracledb already ships its async mode.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    validate_env()
+    connection_string = get_async_connection_string()
+    return create_async_engine(connection_string, echo=env_flag(os.getenv('DEBUG', '')),
+                               **get_pool_options(connection_string))
+
+
+def warm_pool(engine, size: int) -> None:
+    """
+    Opens up to size connections and returns them to the pool, so the first requests
+    of a long-running process do not pay for the connection setup.
+
+    :param engine: SQLAlchemy engine.
+    :param size: Number of connections to open.
+    """
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
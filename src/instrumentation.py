@@ -0,0 +1,286 @@
+import inspect
+import re
+import threading
+import time
+import weakref
+from collections import defaultdict
+from functools import wraps
+
+from sqlalchemy import event
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_BIND_PARAMETER = re.compile(r'(?::\w+|%\(\w+\)s|\?|__\[POSTCOMPILE_\w+\])')
+_PARAMETER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalizes a SQL statement so that executions differing only by their parameters,
+    literals or IN-list sizes share the same fingerprint.
+
+    :param statement: SQL statement.
+    :return: The fingerprint.
+    """
+    normalized = _WHITESPACE.sub(' ', statement).strip()
+    normalized = _STRING_LITERAL.sub('?', normalized)
+    normalized = _BIND_PARAMETER.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    return _PARAMETER_LIST.sub('(...)', normalized)
+
+
+class _StatementStats:
+    __slots__ = ('count', 'total', 'max', 'rows', 'parameters')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = None
+        self.parameters = defaultdict(int)
+
+
+class QueryProfiler:
+    """
+    Collects per-statement latency, row counts and fingerprints through SQLAlchemy engine
+    events, and wall time per service call through proxies. Nothing is collected, and no
+    event listener is installed, unless the profiler is attached.
+    """
+
+    def __init__(self, n_plus_one_threshold: int = 10):
+        """
+        Initializes an empty profiler.
+
+        :param n_plus_one_threshold: Number of executions of the same SELECT fingerprint from
+            which it is reported as a possible N+1 pattern.
+        """
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.started = time.perf_counter()
+        self.statements = defaultdict(_StatementStats)
+        self.service_calls = defaultdict(lambda: [0, 0.0])
+        self._engines = []
+        self._connections = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def attach(self, engine) -> None:
+        """
+        Starts recording the statements executed by an engine.
+
+        :param engine: SQLAlchemy engine.
+        """
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines.append(engine)
+
+    def detach(self) -> None:
+        """Stops recording statements on every attached engine."""
+        for engine in self._engines:
+            event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines = []
+
+    # the state of a statement is kept in the connection, which is used by one thread or task at a time
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        self._resolve_pending_rows(connection)
+        connection.info['profiler_started'] = time.perf_counter()
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info.pop('profiler_started')
+        stats_key = fingerprint(statement)
+        with self._lock:
+            stats = self.statements[stats_key]
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            if not executemany:
+                stats.parameters[repr(parameters)] += 1
+        # SELECT row counts are only known after the rows are fetched, so they are read when
+        # the next statement starts (drivers that do not report them leave the count empty)
+        connection.info['profiler_pending'] = (stats, cursor)
+        self._connections.add(connection)
+
+    def _resolve_pending_rows(self, connection) -> None:
+        pending = connection.info.pop('profiler_pending', None)
+        if pending is None:
+            return
+        stats, cursor = pending
+        try:
+            rowcount = cursor.rowcount
+        except Exception:
+            return
+        if rowcount is not None and rowcount >= 0:
+            with self._lock:
+                stats.rows = (stats.rows or 0) + rowcount
+
+    def wrap(self, service, name: str):
+        """
+        Returns a proxy of a service that records the wall time of each method call. Iterators
+        returned by the methods are timed while they are consumed.
+
+        :param service: Service object.
+        :param name: Name used in the report.
+        :return: The proxy.
+        """
+        return _ProfiledService(service, name, self)
+
+    def record_call(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            call = self.service_calls[name]
+            call[0] += 1
+            call[1] += elapsed
+
+    def summary(self, top: int = 10) -> dict:
+        """
+        Builds the profiling report.
+
+        :param top: Number of statements listed, by total time.
+        :return: Dictionary with the wall time, statement totals, top statements,
+            possible N+1 patterns and service call times.
+        """
+        for connection in list(self._connections):
+            if not connection.closed:
+                self._resolve_pending_rows(connection)
+        with self._lock:
+            statements = [
+                {
+                    'statement': key,
+                    'count': stats.count,
+                    'total_ms': round(stats.total * 1000, 3),
+                    'mean_ms': round(stats.total * 1000 / stats.count, 3),
+                    'max_ms': round(stats.max * 1000, 3),
+                    'rows': stats.rows,
+                    'distinct_parameters': len(stats.parameters),
+                }
+                for key, stats in self.statements.items()
+            ]
+            calls = [
+                {'call': name, 'count': count, 'total_ms': round(total * 1000, 3)}
+                for name, (count, total) in self.service_calls.items()
+            ]
+        statements.sort(key=lambda item: item['total_ms'], reverse=True)
+        calls.sort(key=lambda item: item['total_ms'], reverse=True)
+        n_plus_one = [
+            {
+                'statement': item['statement'],
+                'count': item['count'],
+                'distinct_parameters': item['distinct_parameters'],
+                'identical_repeats': item['count'] - item['distinct_parameters'],
+            }
+            for item in statements
+            if item['statement'].upper().startswith('SELECT') and item['count'] >= self.n_plus_one_threshold
+        ]
+        return {
+            'wall_time_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'statements': sum(item['count'] for item in statements),
+            'database_time_ms': round(sum(item['total_ms'] for item in statements), 3),
+            'top_statements': statements[:top],
+            'possible_n_plus_one': n_plus_one,
+            'service_calls': calls,
+        }
+
+
+class _ProfiledService:
+    """
+    Proxy recording the wall time of every method call of a service. Coroutines are timed
+    until they complete, from the moment they are awaited.
+    """
+
+    def __init__(self, service, name: str, profiler: QueryProfiler):
+        self._service = service
+        self._name = name
+        self._profiler = profiler
+
+    def __getattr__(self, attribute: str):
+        value = getattr(self._service, attribute)
+        if not callable(value):
+            return value
+        call_name = f'{self._name}.{attribute}'
+        profiler = self._profiler
+
+        @wraps(value)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+            if inspect.iscoroutine(result):
+                return _timed_coroutine(result, call_name, profiler, elapsed)
+            if hasattr(result, '__anext__'):
+                return _timed_async_iterator(result, call_name, profiler, elapsed)
+            if hasattr(result, '__next__'):
+                return _timed_iterator(result, call_name, profiler, elapsed)
+            profiler.record_call(call_name, elapsed)
+            return result
+        return timed
+
+
+def _timed_iterator(iterator, call_name: str, profiler: QueryProfiler, elapsed: float):
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        profiler.record_call(call_name, elapsed)
+
+
+async def _timed_coroutine(coroutine, call_name: str, profiler: QueryProfiler, elapsed: float):
+    started = time.perf_counter()
+    try:
+        return await coroutine
+    finally:
+        profiler.record_call(call_name, elapsed + time.perf_counter() - started)
+
+
+async def _timed_async_iterator(iterator, call_name: str, profiler: QueryProfiler, elapsed: float):
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        profiler.record_call(call_name, elapsed)
+
+
+def format_summary(summary: dict) -> str:
+    """
+    Formats a profiling report as plain text.
+
+    :param summary: Report returned by QueryProfiler.summary.
+    :return: The text, one line per statement or service call.
+    """
+    lines = [
+        f"Wall time: {summary['wall_time_ms']:.1f} ms, {summary['statements']} statements, "
+        f"database time: {summary['database_time_ms']:.1f} ms",
+    ]
+    if summary['top_statements']:
+        lines.append('Top statements (count, total ms, mean ms, max ms, rows):')
+        for item in summary['top_statements']:
+            rows = '-' if item['rows'] is None else item['rows']
+            lines.append(f"  {item['count']:>6} {item['total_ms']:>10.1f} {item['mean_ms']:>8.2f} "
+                         f"{item['max_ms']:>8.2f} {rows:>8}  {_shorten(item['statement'])}")
+    if summary['possible_n_plus_one']:
+        lines.append('Possible N+1 patterns (count, distinct parameters):')
+        for item in summary['possible_n_plus_one']:
+            lines.append(f"  {item['count']:>6} {item['distinct_parameters']:>6}  {_shorten(item['statement'])}")
+    if summary['service_calls']:
+        lines.append('Service calls (count, total ms):')
+        for item in summary['service_calls']:
+            lines.append(f"  {item['count']:>6} {item['total_ms']:>10.1f}  {item['call']}")
+    return '\n'.join(lines)
+
+
+def _shorten(statement: str, width: int = 120) -> str:
+    return statement if len(statement) <= width else statement[:width - 3] + '...'
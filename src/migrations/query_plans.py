@@ -0,0 +1,69 @@
+from sqlalchemy import Connection, func, select, text
+
+from models.models import Input, StockBalance, StockCheckpoint, StockMovement
+from repository.analytics import AnalyticsRepository
+from repository.stock_balances import StockBalanceRepository
+from repository.stock_movements import MOVEMENT_REPORT_SQL
+
+
+def main_queries() -> dict:
+    """
+    Returns the main queries issued by the repositories, with sample parameters.
+
+    :return: Dictionary mapping a description to a statement.
+    """
+    return {
+        'Input by ID': select(Input).where(Input.id == 1),
+        'Inputs of a supplier': select(Input).where(Input.supplier_id == 1),
+        'Inputs expiring until a date': select(Input).where(Input.expiration_date <= func.current_date()),
+        'Stock movements page': (
+            select(StockMovement).where(StockMovement.id > 1000).order_by(StockMovement.id).limit(100)
+        ),
+        'Stock movements of an input up to a date': select(StockMovement).where(
+            StockMovement.input_id == 1, StockMovement.movement_date <= func.current_date()),
+        'Stock movements in a date range': select(StockMovement).where(
+            StockMovement.movement_date >= func.current_date(), StockMovement.movement_date <= func.current_date()),
+        'Stock balance of an input': select(StockBalance).where(StockBalance.input_id == 1),
+        'Ledger balances': StockBalanceRepository._ledger_balances_query(),
+        'Latest stock checkpoint of an input before a date': (
+            select(StockCheckpoint)
+            .where(StockCheckpoint.input_id == 1, StockCheckpoint.checkpoint_date <= func.current_date())
+            .order_by(StockCheckpoint.checkpoint_date.desc())
+            .limit(1)
+        ),
+        'Movement report': text(MOVEMENT_REPORT_SQL),
+        'Monthly consumption by input in a date range': AnalyticsRepository._consumption_query(
+            'month', 'input', func.current_date(), func.current_date()),
+    }
+
+
+def explain(connection: Connection, statement) -> list[str]:
+    """
+    Returns the execution plan chosen by the database for a statement.
+
+    Supports SQLite (EXPLAIN QUERY PLAN) and Oracle (EXPLAIN PLAN and DBMS_XPLAN).
+
+    :param connection: Connection to the database.
+    :param statement: Statement to be explained. Sample parameters are rendered inline.
+    :return: Lines of the plan.
+    """
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in rows]
+    if dialect == 'oracle':
+        connection.exec_driver_sql(f'EXPLAIN PLAN FOR {sql}')
+        rows = connection.exec_driver_sql("SELECT plan_table_output FROM TABLE(DBMS_XPLAN.DISPLAY(NULL, NULL, 'BASIC'))")
+        return [row[0] for row in rows]
+    raise NotImplementedError(f'Query plans are not supported for {dialect}')
+
+
+def explain_main_queries(connection: Connection) -> dict[str, list[str]]:
+    """
+    Explains every main query of the repositories.
+
+    :param connection: Connection to the database.
+    :return: Dictionary mapping each query description to its plan.
+    """
+    return {name: explain(connection, statement) for name, statement in main_queries().items()}
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Engine, Integer, MetaData, String, Table, insert, select
+
+from migrations.versions import MIGRATIONS, Migration
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations',
+    metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class MigrationRunner:
+    """
+    Applies the versioned migrations in order and records each applied version
+    in the schema_migrations table.
+    """
+
+    def __init__(self, engine: Engine, migrations: list[Migration] = MIGRATIONS):
+        """
+        Initializes the runner.
+
+        :param engine: SQLAlchemy engine of the database to be migrated.
+        :param migrations: Migrations known by the application.
+        """
+        self.engine = engine
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+
+    def applied_versions(self) -> dict[int, datetime]:
+        """
+        Retrieves the versions already applied to the database.
+
+        :return: Dictionary mapping versions to the moment they were applied.
+        """
+        with self.engine.begin() as connection:
+            schema_migrations.create(connection, checkfirst=True)
+            rows = connection.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+            return {version: applied_at for version, applied_at in rows}
+
+    def status(self) -> list[dict]:
+        """
+        Lists every known migration and whether it was applied.
+
+        :return: List of dictionaries with version, description and applied_at (None if pending).
+        """
+        applied = self.applied_versions()
+        return [
+            {'version': migration.version, 'description': migration.description,
+             'applied_at': applied.get(migration.version)}
+            for migration in self.migrations
+        ]
+
+    def upgrade(self) -> list[Migration]:
+        """
+        Applies the pending migrations, each one in its own transaction together with its version record.
+
+        :return: Migrations applied by this call.
+        """
+        applied = self.applied_versions()
+        pending = [migration for migration in self.migrations if migration.version not in applied]
+        for migration in pending:
+            with self.engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(insert(schema_migrations).values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.now(),
+                ))
+        return pending
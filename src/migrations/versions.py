@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import Connection, func, inspect, update
+
+from models.models import (
+    ArchivedBalance, Base, Input, LedgerArchive, ReorderForecast, StockBalance, StockCheckpoint, StockMovement,
+    Supplier
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    A versioned change to the database schema. Upgrades must be idempotent, so databases
+    created from scripts/create-tables.sql can be brought under version control.
+    """
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _create_tables(*tables):
+    def upgrade(connection: Connection) -> None:
+        Base.metadata.create_all(connection, tables=[table.__table__ for table in tables], checkfirst=True)
+    return upgrade
+
+
+def _create_indexes(*indexes):
+    def upgrade(connection: Connection) -> None:
+        for index in indexes:
+            index.create(connection, checkfirst=True)
+    return upgrade
+
+
+def _add_timestamp_columns(*models):
+    def upgrade(connection: Connection) -> None:
+        for model in models:
+            table = model.__table__
+            existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+            for name in ('created_at', 'updated_at'):
+                if name not in existing:
+                    column_type = table.c[name].type.compile(connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD {name} {column_type}')
+            connection.execute(
+                update(table).where(table.c.updated_at.is_(None))
+                .values(created_at=func.current_timestamp(), updated_at=func.current_timestamp())
+            )
+    return upgrade
+
+
+def _run_all(*upgrades):
+    def upgrade(connection: Connection) -> None:
+        for step in upgrades:
+            step(connection)
+    return upgrade
+
+
+def _index(model, name: str):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+MIGRATIONS = [
+    Migration(1, 'Create suppliers, inputs, stock_movements and stock_balances tables',
+              _create_tables(Supplier, Input, StockMovement, StockBalance)),
+    Migration(2, 'Index stock movements by input and date, and inputs by supplier and expiration date',
+              _create_indexes(
+                  _index(StockMovement, 'ix_stock_movements_input_date'),
+                  _index(StockMovement, 'ix_stock_movements_movement_date'),
+                  _index(Input, 'ix_inputs_supplier_id'),
+                  _index(Input, 'ix_inputs_expiration_date'),
+              )),
+    Migration(3, 'Add created_at/updated_at to suppliers, inputs and stock_movements and index inputs by updated_at',
+              _run_all(
+                  _add_timestamp_columns(Supplier, Input, StockMovement),
+                  _create_indexes(_index(Input, 'ix_inputs_updated_at')),
+              )),
+    Migration(4, 'Create stock_checkpoints table', _create_tables(StockCheckpoint)),
+    Migration(5, 'Index stock movements by updated_at',
+              _create_indexes(_index(StockMovement, 'ix_stock_movements_updated_at'))),
+    Migration(6, 'Create reorder_forecasts table', _create_tables(ReorderForecast)),
+    Migration(7, 'Create ledger_archives and archived_balances tables',
+              _create_tables(LedgerArchive, ArchivedBalance)),
+]
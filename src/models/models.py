@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Numeric, CheckConstraint
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Numeric, CheckConstraint, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -11,6 +11,8 @@ class Supplier(Base):
     name = Column(String(100), nullable=False)
     contact_info = Column(String(100))
     address = Column(String(255))
+    created_at = Column(DateTime, default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp())
 
     # Relacionamento com a tabela Input
     inputs = relationship('Input', back_populates='supplier')
@@ -25,6 +27,14 @@ class Input(Base):
     quantity = Column(Numeric, nullable=False)
     expiration_date = Column(Date, nullable=False)
     supplier_id = Column(Integer, ForeignKey('suppliers.id'))
+    created_at = Column(DateTime, default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+    __table_args__ = (
+        Index('ix_inputs_supplier_id', 'supplier_id'),
+        Index('ix_inputs_expiration_date', 'expiration_date'),
+        Index('ix_inputs_updated_at', 'updated_at'),
+    )
 
     # Relacionamento com a tabela Supplier
     supplier = relationship('Supplier', back_populates='inputs')
@@ -41,10 +51,76 @@ class StockMovement(Base):
     quantity = Column(Numeric, nullable=False)
     movement_type = Column(String(10), nullable=False)
     movement_date = Column(Date, nullable=False)
+    created_at = Column(DateTime, default=func.current_timestamp())
+    updated_at = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp())
 
     __table_args__ = (
-        CheckConstraint("movement_type IN ('in', 'out')", name='check_movement_type'),
+        CheckConstraint("movement_type IN ('IN', 'OUT')", name='check_movement_type'),
+        Index('ix_stock_movements_input_date', 'input_id', 'movement_date'),
+        Index('ix_stock_movements_movement_date', 'movement_date'),
+        Index('ix_stock_movements_updated_at', 'updated_at'),
     )
 
     # Relacionamento com a tabela Input
     input = relationship('Input', back_populates='stock_movements')
+
+
+class StockBalance(Base):
+    __tablename__ = 'stock_balances'
+
+    input_id = Column(Integer, ForeignKey('inputs.id', ondelete='CASCADE'), primary_key=True)
+    quantity = Column(Numeric, nullable=False, default=0)
+
+
+class StockCheckpoint(Base):
+    __tablename__ = 'stock_checkpoints'
+
+    # balance of the input from the movements dated before checkpoint_date
+    input_id = Column(Integer, ForeignKey('inputs.id', ondelete='CASCADE'), primary_key=True)
+    checkpoint_date = Column(Date, primary_key=True)
+    quantity = Column(Numeric, nullable=False)
+
+
+class ReorderForecast(Base):
+    __tablename__ = 'reorder_forecasts'
+
+    # latest reorder suggestion of the input, replaced by every forecast run saved to the table
+    input_id = Column(Integer, ForeignKey('inputs.id', ondelete='CASCADE'), primary_key=True)
+    computed_on = Column(Date, nullable=False)
+    balance = Column(Numeric, nullable=False)
+    avg_daily_out = Column(Numeric, nullable=False)
+    std_daily_out = Column(Numeric, nullable=False)
+    days_of_cover = Column(Numeric)
+    safety_stock = Column(Numeric, nullable=False)
+    reorder_point = Column(Numeric, nullable=False)
+    suggested_quantity = Column(Numeric, nullable=False)
+
+
+class LedgerArchive(Base):
+    __tablename__ = 'ledger_archives'
+
+    # one compressed file of stock movements moved out of stock_movements, all from the same month
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    period_start = Column(Date, nullable=False)
+    file_name = Column(String(255), nullable=False)
+    movements = Column(Integer, nullable=False)
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    first_date = Column(Date, nullable=False)
+    last_date = Column(Date, nullable=False)
+    # every movement dated before this day was archived by the run that wrote the file
+    archived_before = Column(Date, nullable=False)
+    created_at = Column(DateTime, default=func.current_timestamp())
+
+    __table_args__ = (
+        Index('ix_ledger_archives_period_start', 'period_start'),
+    )
+
+
+class ArchivedBalance(Base):
+    __tablename__ = 'archived_balances'
+
+    # net effect on the stock of the archived movements of the input
+    input_id = Column(Integer, ForeignKey('inputs.id'), primary_key=True)
+    quantity = Column(Numeric, nullable=False)
+    movements = Column(Integer, nullable=False)
@@ -0,0 +1,242 @@
+from datetime import date
+from typing import Iterator, Optional
+
+from sqlalchemy import Date, Float, RowMapping, case, delete, func, insert, select, type_coerce
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
+
+from models.models import Input, ReorderForecast, StockBalance, StockMovement, Supplier
+from repository.transaction import commit, rollback
+
+
+class day_start(FunctionElement):
+    """First day of the day bucket of a date column (the date itself)."""
+    type = Date()
+    inherit_cache = True
+
+
+class week_start(FunctionElement):
+    """Monday of the ISO week of a date column."""
+    type = Date()
+    inherit_cache = True
+
+
+class month_start(FunctionElement):
+    """First day of the month of a date column."""
+    type = Date()
+    inherit_cache = True
+
+
+# the bucket formats are rendered as literals, so the GROUP BY expression is identical to the
+# SELECT one (Oracle rejects the query when they differ by a bind parameter)
+@compiles(day_start)
+def _day_start(element, compiler, **kw):
+    return "date_trunc('day', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start)
+def _week_start(element, compiler, **kw):
+    return "date_trunc('week', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start)
+def _month_start(element, compiler, **kw):
+    return "date_trunc('month', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_start, 'oracle')
+def _day_start_oracle(element, compiler, **kw):
+    return 'TRUNC(%s)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, 'oracle')
+def _week_start_oracle(element, compiler, **kw):
+    return "TRUNC(%s, 'IW')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'oracle')
+def _month_start_oracle(element, compiler, **kw):
+    return "TRUNC(%s, 'MM')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(day_start, 'sqlite')
+def _day_start_sqlite(element, compiler, **kw):
+    return 'date(%s)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(week_start, 'sqlite')
+def _week_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'weekday 0', '-6 days')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, 'sqlite')
+def _month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+PERIOD_FUNCTIONS = {
+    'day': day_start,
+    'week': week_start,
+    'month': month_start,
+}
+
+GROUP_COLUMNS = {
+    'input': (Input.id.label('input_id'), Input.name.label('input_name')),
+    'category': (Input.category.label('category'),),
+    'supplier': (Supplier.id.label('supplier_id'), Supplier.name.label('supplier_name')),
+}
+
+
+class AnalyticsRepository:
+    """
+    Repository for aggregate queries over the stock movements ledger. The aggregation runs
+    in the database, so only one row per group is transferred.
+    """
+
+    def __init__(self, session: Session):
+        """
+        Initializes the repository with a database session.
+
+        :param session: SQLAlchemy session for interacting with the database.
+        """
+        self.session = session
+
+    def aggregate_movements(self, period: str, group_by: str, start: Optional[date] = None,
+                            end: Optional[date] = None, chunk_size: int = 1000) -> Iterator[RowMapping]:
+        """
+        Streams the IN and OUT totals of the stock movements per period and group, in a single
+        GROUP BY query over stock_movements joined to inputs (and suppliers). The date range is
+        filtered through the movement date index.
+
+        :param period: Size of the time buckets: 'day', 'week' (starting on Monday) or 'month'.
+        :param group_by: 'input', 'category' or 'supplier'.
+        :param start: First movement date included, if given.
+        :param end: Last movement date included, if given.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of mappings with period, the group columns, total_in, total_out,
+            net_change and movements, ordered by period and group.
+        """
+        query = self._consumption_query(period, group_by, start, end)
+        result = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        yield from result.mappings()
+
+    def stream_ledger(self, chunk_size: int = 10000) -> Iterator[tuple]:
+        """
+        Streams the columns of the stock movements needed by the ledger snapshot, without
+        building ORM objects. Quantities are read as floats instead of Decimals.
+
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of (input_id, quantity, movement_type, movement_date) tuples, ordered by movement ID.
+        """
+        query = select(
+            StockMovement.input_id,
+            type_coerce(StockMovement.quantity, Float),
+            StockMovement.movement_type,
+            StockMovement.movement_date,
+        ).order_by(StockMovement.id)
+        result = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            yield from result.tuples()
+        finally:
+            result.close()
+
+    def stream_stock_positions(self, chunk_size: int = 10000) -> Iterator[tuple]:
+        """
+        Streams the maintained stock balance of every input, including the inputs without a
+        balance row (with a balance of 0). Balances are read as floats.
+
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of (input_id, balance) tuples, ordered by input ID.
+        """
+        query = (
+            select(Input.id, type_coerce(func.coalesce(StockBalance.quantity, 0), Float))
+            .outerjoin(StockBalance, StockBalance.input_id == Input.id)
+            .order_by(Input.id)
+        )
+        result = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            yield from result.tuples()
+        finally:
+            result.close()
+
+    def stream_daily_consumption(self, start: date, end: date, chunk_size: int = 10000) -> Iterator[tuple]:
+        """
+        Streams the OUT totals of every input per day with OUT movements, in a single GROUP BY
+        query filtered through the movement date index. Totals are read as floats.
+
+        :param start: First movement date included.
+        :param end: Last movement date included.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of (input_id, movement_date, total_out) tuples, in no particular order.
+        """
+        query = (
+            select(StockMovement.input_id, StockMovement.movement_date,
+                   type_coerce(func.sum(StockMovement.quantity), Float))
+            .where(StockMovement.movement_type == 'OUT',
+                   StockMovement.movement_date >= start, StockMovement.movement_date <= end)
+            .group_by(StockMovement.input_id, StockMovement.movement_date)
+        )
+        result = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            yield from result.tuples()
+        finally:
+            result.close()
+
+    def replace_reorder_forecasts(self, rows: Iterator[dict], batch_size: int = 5000) -> int:
+        """
+        Replaces the contents of the reorder_forecasts table with executemany INSERTs of
+        batch_size rows, and commits once.
+
+        :param rows: Iterable of dictionaries keyed by the columns of ReorderForecast.
+        :param batch_size: Number of rows inserted per round-trip.
+        :return: Number of rows written.
+        """
+        table = ReorderForecast.__table__
+        count = 0
+        try:
+            self.session.execute(delete(ReorderForecast))
+            connection = self.session.connection()
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    connection.execute(insert(table), batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                connection.execute(insert(table), batch)
+                count += len(batch)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    @staticmethod
+    def _consumption_query(period: str, group_by: str, start: Optional[date] = None, end: Optional[date] = None):
+        bucket = PERIOD_FUNCTIONS[period](StockMovement.movement_date)
+        group_columns = GROUP_COLUMNS[group_by]
+        total_in = func.sum(case((StockMovement.movement_type == 'IN', StockMovement.quantity), else_=0))
+        total_out = func.sum(case((StockMovement.movement_type == 'OUT', StockMovement.quantity), else_=0))
+        query = (
+            select(
+                bucket.label('period'),
+                *group_columns,
+                total_in.label('total_in'),
+                total_out.label('total_out'),
+                (total_in - total_out).label('net_change'),
+                func.count(StockMovement.id).label('movements'),
+            )
+            .select_from(StockMovement)
+            .join(Input, StockMovement.input_id == Input.id)
+            .group_by(bucket, *(column.element for column in group_columns))
+            .order_by(bucket, *(column.element for column in group_columns))
+        )
+        if group_by == 'supplier':
+            query = query.outerjoin(Supplier, Input.supplier_id == Supplier.id)
+        if start is not None:
+            query = query.where(StockMovement.movement_date >= start)
+        if end is not None:
+            query = query.where(StockMovement.movement_date <= end)
+        return query
@@ -0,0 +1,243 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import Row, bindparam, func, insert, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from models.models import ArchivedBalance, Input, LedgerArchive, StockMovement, Supplier
+from repository.analytics import month_start
+from repository.bulk import delete_by_ids, id_chunks
+from repository.transaction import commit, rollback
+
+# high bound of an interval partition, as Oracle shows it in ALL_TAB_PARTITIONS.HIGH_VALUE
+_PARTITION_BOUND = re.compile(r"TO_DATE\(' ?(\d{4}-\d{2}-\d{2})")
+
+
+class LedgerArchiveRepository:
+    """
+    Repository for moving old stock movements out of the stock_movements table. The movements
+    themselves go to archive files written by the service; the database keeps one
+    ledger_archives row per file and, in archived_balances, the net effect of the archived
+    movements of each input.
+    """
+
+    def __init__(self, session: Session):
+        """
+        Initializes the repository with a database session.
+
+        :param session: SQLAlchemy session for interacting with the database.
+        """
+        self.session = session
+        self._has_tables = None
+
+    def has_archive_tables(self) -> bool:
+        """
+        Checks whether the archive tables exist (migration 7 applied). The answer is kept for
+        the life of the repository.
+
+        :return: True if the ledger_archives table exists.
+        """
+        if self._has_tables is None:
+            self._has_tables = inspect(self.session.connection()).has_table(LedgerArchive.__tablename__)
+        return self._has_tables
+
+    def get_cutoff(self) -> Optional[date]:
+        """
+        Retrieves the day before which every stock movement has been archived.
+
+        :return: The latest archived_before of the archive files, or None if nothing was archived
+            (or the archive tables do not exist).
+        """
+        if not self.has_archive_tables():
+            return None
+        return _as_date(self.session.scalar(select(func.max(LedgerArchive.archived_before))))
+
+    def get_archives(self, start: Optional[date] = None, end: Optional[date] = None, first_id: Optional[int] = None,
+                     last_id: Optional[int] = None) -> list[LedgerArchive]:
+        """
+        Retrieves the archive files holding movements in a date range and an ID range.
+
+        :param start: Only files with movements dated on or after this day, if given.
+        :param end: Only files with movements dated on or before this day, if given.
+        :param first_id: Only files with movement IDs greater than or equal to this one, if given.
+        :param last_id: Only files with movement IDs lower than or equal to this one, if given.
+        :return: List of LedgerArchive objects, ordered by month and ID.
+        """
+        if not self.has_archive_tables():
+            return []
+        query = select(LedgerArchive).order_by(LedgerArchive.period_start, LedgerArchive.id)
+        if start is not None:
+            query = query.where(LedgerArchive.last_date >= start)
+        if end is not None:
+            query = query.where(LedgerArchive.first_date <= end)
+        if first_id is not None:
+            query = query.where(LedgerArchive.last_id >= first_id)
+        if last_id is not None:
+            query = query.where(LedgerArchive.first_id <= last_id)
+        return list(self.session.scalars(query))
+
+    def get_archived_balance(self, input_id: int) -> Decimal:
+        """
+        Retrieves the net effect of the archived movements of an input, by primary key.
+
+        :param input_id: ID of the input.
+        :return: Signed quantity, 0 if the input has no archived movements.
+        """
+        if not self.has_archive_tables():
+            return Decimal(0)
+        return self.session.scalar(
+            select(ArchivedBalance.quantity).where(ArchivedBalance.input_id == input_id)
+        ) or Decimal(0)
+
+    def get_input_details(self) -> dict[int, Row]:
+        """
+        Retrieves the name, category and supplier of every input, used to join the archived
+        movements the way the reports join the stock_movements table.
+
+        :return: Dictionary mapping input IDs to rows with id, name, category, supplier_id and supplier_name.
+        """
+        query = (
+            select(Input.id, Input.name, Input.category, Input.supplier_id, Supplier.name.label('supplier_name'))
+            .outerjoin(Supplier, Input.supplier_id == Supplier.id)
+        )
+        return {row.id: row for row in self.session.execute(query)}
+
+    def count_movements_by_month(self, before: date) -> list[tuple[date, int]]:
+        """
+        Counts the stock movements dated before a day, per month, in a single GROUP BY query
+        filtered through the movement date index.
+
+        :param before: Only movements dated before this day are counted.
+        :return: List of (first day of the month, number of movements) pairs, oldest first.
+        """
+        bucket = month_start(StockMovement.movement_date)
+        query = (
+            select(bucket, func.count(StockMovement.id))
+            .where(StockMovement.movement_date < before)
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+        return [(_as_date(month), count) for month, count in self.session.execute(query).tuples()]
+
+    def stream_movements_to_archive(self, start: date, end: date, chunk_size: int = 10000) -> Iterator[Row]:
+        """
+        Streams the stock movements dated in a range, ordered by ID, and locks them (FOR UPDATE,
+        on databases that support it) until the transaction ends, so they cannot change between
+        being written to the archive and being deleted.
+
+        :param start: First movement date included.
+        :param end: Movements dated on or after this day are excluded.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of rows with id, input_id, quantity, movement_type, movement_date,
+            created_at and updated_at.
+        """
+        query = (
+            select(StockMovement.id, StockMovement.input_id, StockMovement.quantity, StockMovement.movement_type,
+                   StockMovement.movement_date, StockMovement.created_at, StockMovement.updated_at)
+            .where(StockMovement.movement_date >= start, StockMovement.movement_date < end)
+            .order_by(StockMovement.id)
+            .with_for_update()
+        )
+        result = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            yield from result
+        finally:
+            result.close()
+
+    def add_archive(self, archive: dict, totals: dict[int, tuple[Decimal, int]], movement_ids: Iterable[int]) -> int:
+        """
+        Records an archive file and removes its movements from the stock_movements table, in a
+        single transaction: the ledger_archives row is inserted, the net effect and number of
+        the movements are added to archived_balances, and the movements are deleted with one
+        DELETE per 1000 IDs.
+
+        :param archive: Dictionary with the columns of the ledger_archives row.
+        :param totals: Dictionary mapping input IDs to the (signed quantity, number of movements)
+            of the archived movements of the input.
+        :param movement_ids: IDs of the archived movements.
+        :return: Number of movements deleted.
+        :raises RuntimeError: If some movements were deleted by someone else meanwhile; nothing is changed.
+        """
+        movement_ids = list(movement_ids)
+        try:
+            self.session.execute(insert(LedgerArchive).values(**archive))
+            self._add_archived_totals(totals)
+            count = delete_by_ids(self.session, StockMovement, movement_ids)
+            if count != len(movement_ids):
+                raise RuntimeError(f'{len(movement_ids) - count} movements of {archive["file_name"]} '
+                                   f'were deleted while being archived')
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def _add_archived_totals(self, totals: dict[int, tuple[Decimal, int]]) -> None:
+        """
+        Adds to archived_balances, with one executemany UPDATE and one executemany INSERT for
+        the inputs without a row yet. Does not commit.
+        """
+        if not totals:
+            return
+        input_ids = list(totals)
+        existing = set()
+        for chunk in id_chunks(input_ids):
+            existing.update(self.session.scalars(
+                select(ArchivedBalance.input_id).where(ArchivedBalance.input_id.in_(chunk))
+            ))
+        table = ArchivedBalance.__table__
+        connection = self.session.connection()
+        if existing:
+            connection.execute(
+                update(table)
+                .where(table.c.input_id == bindparam('b_input_id'))
+                .values(quantity=table.c.quantity + bindparam('b_quantity'),
+                        movements=table.c.movements + bindparam('b_movements')),
+                [{'b_input_id': input_id, 'b_quantity': totals[input_id][0], 'b_movements': totals[input_id][1]}
+                 for input_id in existing],
+            )
+        missing = [input_id for input_id in input_ids if input_id not in existing]
+        if missing:
+            connection.execute(insert(table), [
+                {'input_id': input_id, 'quantity': totals[input_id][0], 'movements': totals[input_id][1]}
+                for input_id in missing
+            ])
+
+    def drop_empty_partitions(self, before: date) -> list[str]:
+        """
+        On Oracle, when stock_movements is interval-partitioned by movement_date (see
+        scripts/partition-stock-movements.sql), drops the partitions that only hold days before
+        a date and have no rows left, so archiving also gives their storage back. Dropping a
+        partition is DDL and commits on its own: call it after the archive transactions.
+
+        :param before: Only partitions whose upper bound is on or before this day are dropped.
+        :return: Names of the partitions dropped (none on other databases or unpartitioned tables).
+        """
+        if self.session.get_bind().dialect.name != 'oracle':
+            return []
+        # only interval partitions: the range partition the table was created with cannot be dropped
+        partitions = self.session.execute(text("""
+            SELECT partition_name, high_value
+            FROM all_tab_partitions
+            WHERE table_owner = SYS_CONTEXT('USERENV', 'CURRENT_SCHEMA')
+                AND table_name = 'STOCK_MOVEMENTS'
+                AND interval = 'YES'
+        """)).all()
+        dropped = []
+        for name, high_value in partitions:
+            bound = _PARTITION_BOUND.search(high_value or '')
+            if bound is None or datetime.strptime(bound.group(1), '%Y-%m-%d').date() > before:
+                continue
+            if self.session.scalar(text(f'SELECT COUNT(*) FROM stock_movements PARTITION ("{name}") '
+                                        f'WHERE ROWNUM = 1')):
+                continue
+            self.session.execute(text(f'ALTER TABLE stock_movements DROP PARTITION "{name}" UPDATE GLOBAL INDEXES'))
+            dropped.append(name)
+        return dropped
+
+
+def _as_date(value) -> Optional[date]:
+    """Converts the datetimes some drivers return for DATE columns into dates."""
+    return value.date() if isinstance(value, datetime) else value
@@ -0,0 +1,246 @@
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import RowMapping, delete, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models.models import Input, StockBalance, StockCheckpoint, StockMovement, Supplier
+from repository.bulk import id_chunks
+from repository.stock_movements import MOVEMENT_REPORT_RANGE_SQL
+
+
+async def _fetch_by_ids(session: AsyncSession, model, ids: Iterable[int]) -> list:
+    """
+    Retrieves the rows of a model by primary key, using one query per 1000 IDs
+    (Oracle's limit for IN lists).
+    """
+    found = []
+    for chunk in id_chunks(ids):
+        found.extend(await session.scalars(select(model).where(model.id.in_(chunk)).order_by(model.id)))
+    return found
+
+
+async def _add(session: AsyncSession, model) -> None:
+    """
+    Inserts an object and reloads it, so the values generated by the database (ID and
+    timestamps) can be read after the session is closed.
+    """
+    session.add(model)
+    await session.flush()
+    await session.refresh(model)
+
+
+async def _fetch_page(session: AsyncSession, model, after_id: Optional[int], limit: int) -> list:
+    query = select(model)
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    return list(await session.scalars(query.order_by(model.id).limit(limit)))
+
+
+class AsyncSupplierRepository:
+    """
+    Asyncio counterpart of SupplierRepository.
+
+    Every method runs in its own session, borrowed from the pool and returned when the
+    method finishes, so calls made concurrently (e.g. with asyncio.gather) do not share a
+    connection. Write methods commit their own transaction.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker):
+        """
+        Initializes the repository with a session factory.
+
+        :param session_factory: Factory of AsyncSession objects, created with expire_on_commit=False
+            so the returned objects can be read after their session is closed.
+        """
+        self.session_factory = session_factory
+
+    async def add_supplier(self, supplier: Supplier) -> None:
+        """
+        Adds a new supplier to the database.
+
+        :param supplier: Supplier object to be added.
+        """
+        async with self.session_factory.begin() as session:
+            await _add(session, supplier)
+
+    async def fetch_supplier_by_id(self, supplier_id: int) -> Optional[Supplier]:
+        """
+        Retrieves a supplier by its ID.
+
+        :param supplier_id: ID of the supplier to be retrieved.
+        :return: Supplier object corresponding to the provided ID, or None if not found.
+        """
+        async with self.session_factory() as session:
+            return await session.get(Supplier, supplier_id)
+
+    async def fetch_suppliers_by_ids(self, supplier_ids: Iterable[int]) -> list[Supplier]:
+        """
+        Retrieves many suppliers by ID, using one query per 1000 IDs.
+
+        :param supplier_ids: IDs of the suppliers to be retrieved.
+        :return: List of the Supplier objects found, ordered by ID.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_by_ids(session, Supplier, supplier_ids)
+
+    async def fetch_suppliers_page(self, after_id: Optional[int] = None, limit: int = 100) -> list[Supplier]:
+        """
+        Retrieves a page of suppliers ordered by ID using keyset pagination.
+
+        :param after_id: Only suppliers with an ID greater than this one are returned.
+        :param limit: Maximum number of suppliers in the page.
+        :return: List of Supplier objects.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_page(session, Supplier, after_id, limit)
+
+
+class AsyncInputRepository:
+    """
+    Asyncio counterpart of InputRepository. Every method runs in its own session.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker):
+        """
+        Initializes the repository with a session factory.
+
+        :param session_factory: Factory of AsyncSession objects, created with expire_on_commit=False.
+        """
+        self.session_factory = session_factory
+
+    async def add_input(self, input_item: Input) -> None:
+        """
+        Adds a new input to the database.
+
+        :param input_item: Input object to be added.
+        """
+        async with self.session_factory.begin() as session:
+            await _add(session, input_item)
+
+    async def get_input_by_id(self, input_id: int) -> Optional[Input]:
+        """
+        Retrieves an input by its ID.
+
+        :param input_id: ID of the input to be retrieved.
+        :return: Input object corresponding to the provided ID, or None if not found.
+        """
+        async with self.session_factory() as session:
+            return await session.get(Input, input_id)
+
+    async def get_inputs_by_ids(self, input_ids: Iterable[int]) -> list[Input]:
+        """
+        Retrieves many inputs by ID, using one query per 1000 IDs.
+
+        :param input_ids: IDs of the inputs to be retrieved.
+        :return: List of the Input objects found, ordered by ID.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_by_ids(session, Input, input_ids)
+
+    async def get_inputs_page(self, after_id: Optional[int] = None, limit: int = 100) -> list[Input]:
+        """
+        Retrieves a page of inputs ordered by ID using keyset pagination.
+
+        :param after_id: Only inputs with an ID greater than this one are returned.
+        :param limit: Maximum number of inputs in the page.
+        :return: List of Input objects.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_page(session, Input, after_id, limit)
+
+
+class AsyncStockMovementRepository:
+    """
+    Asyncio counterpart of StockMovementRepository. Every method runs in its own session.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker):
+        """
+        Initializes the repository with a session factory.
+
+        :param session_factory: Factory of AsyncSession objects, created with expire_on_commit=False.
+        """
+        self.session_factory = session_factory
+
+    async def add_stock_movement(self, stock_movement: StockMovement, balance_delta=None) -> None:
+        """
+        Adds a new stock movement to the database and, if given, applies its effect to the
+        stock balance of the input in the same transaction, dropping the balance checkpoints
+        a backdated movement makes stale.
+
+        :param stock_movement: StockMovement object to be added.
+        :param balance_delta: Signed quantity added to the balance of the input, or None to leave it.
+        """
+        async with self.session_factory.begin() as session:
+            if balance_delta is not None:
+                result = await session.execute(
+                    update(StockBalance)
+                    .where(StockBalance.input_id == stock_movement.input_id)
+                    .values(quantity=StockBalance.quantity + balance_delta)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 0:
+                    await session.execute(
+                        insert(StockBalance).values(input_id=stock_movement.input_id, quantity=balance_delta))
+                if stock_movement.movement_date < date.today():
+                    await session.execute(
+                        delete(StockCheckpoint)
+                        .where(StockCheckpoint.input_id == stock_movement.input_id,
+                               StockCheckpoint.checkpoint_date > stock_movement.movement_date)
+                    )
+            await _add(session, stock_movement)
+
+    async def get_stock_movement_by_id(self, movement_id: int) -> Optional[StockMovement]:
+        """
+        Retrieves a stock movement by its ID.
+
+        :param movement_id: ID of the stock movement to be retrieved.
+        :return: StockMovement object corresponding to the provided ID, or None if not found.
+        """
+        async with self.session_factory() as session:
+            return await session.get(StockMovement, movement_id)
+
+    async def get_stock_movements_by_ids(self, movement_ids: Iterable[int]) -> list[StockMovement]:
+        """
+        Retrieves many stock movements by ID, using one query per 1000 IDs.
+
+        :param movement_ids: IDs of the stock movements to be retrieved.
+        :return: List of the StockMovement objects found, ordered by ID.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_by_ids(session, StockMovement, movement_ids)
+
+    async def get_stock_movements_page(self, after_id: Optional[int] = None, limit: int = 100) -> list[StockMovement]:
+        """
+        Retrieves a page of stock movements ordered by ID using keyset pagination.
+
+        :param after_id: Only stock movements with an ID greater than this one are returned.
+        :param limit: Maximum number of stock movements in the page.
+        :return: List of StockMovement objects.
+        """
+        async with self.session_factory() as session:
+            return await _fetch_page(session, StockMovement, after_id, limit)
+
+    async def get_id_bounds(self) -> tuple[Optional[int], Optional[int]]:
+        """
+        Retrieves the lowest and highest stock movement IDs.
+
+        :return: Tuple with both IDs, or (None, None) if there are no movements.
+        """
+        async with self.session_factory() as session:
+            row = (await session.execute(select(func.min(StockMovement.id), func.max(StockMovement.id)))).one()
+            return row[0], row[1]
+
+    async def get_movement_report_range(self, low_id: int, high_id: int) -> list[RowMapping]:
+        """
+        Retrieves the movement report rows of the movements with IDs between low_id and high_id.
+
+        :param low_id: Lowest movement ID included.
+        :param high_id: Highest movement ID included.
+        :return: List of rows with movement_id, movement_quantity, movement_type, movement_date,
+            input_name and supplier_name keys, ordered by movement ID.
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(text(MOVEMENT_REPORT_RANGE_SQL), {'low_id': low_id, 'high_id': high_id})
+            return list(result.mappings())
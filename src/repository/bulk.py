@@ -0,0 +1,74 @@
+from typing import Iterable, Iterator
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+# Oracle refuses IN lists longer than 1000 items
+IN_LIST_LIMIT = 1000
+
+
+def id_chunks(ids: Iterable[int], size: int = IN_LIST_LIMIT) -> Iterator[list[int]]:
+    """
+    Splits IDs in lists usable in an IN clause, dropping duplicates.
+
+    :param ids: IDs, in any order.
+    :param size: Maximum number of IDs per list.
+    :return: Iterator of lists of distinct IDs.
+    """
+    unique = list(dict.fromkeys(int(item) for item in ids))
+    for start in range(0, len(unique), size):
+        yield unique[start:start + size]
+
+
+def check_bulk_values(values: dict, allowed: Iterable[str]) -> None:
+    """
+    Checks that the values of a bulk update set at least one column and only allowed ones.
+
+    :param values: Dictionary mapping column names to new values.
+    :param allowed: Names of the columns that may be set.
+    :raises ValueError: If values is empty or sets columns that are not allowed.
+    """
+    if not values:
+        raise ValueError('No fields to update')
+    unsupported = sorted(set(values) - set(allowed))
+    if unsupported:
+        raise ValueError(f"Unsupported fields: {', '.join(unsupported)} (use: {', '.join(allowed)})")
+
+
+def update_by_ids(session: Session, model, ids: Iterable[int], values: dict) -> int:
+    """
+    Sets the same values on the rows of a model with the given IDs, with one UPDATE per 1000
+    IDs and no objects loaded. Column onupdate defaults (updated_at) are applied. Does not commit.
+
+    :param session: SQLAlchemy session.
+    :param model: Mapped class with an id primary key.
+    :param ids: IDs of the rows to be updated.
+    :param values: Dictionary mapping column names to new values.
+    :return: Number of rows updated.
+    """
+    count = 0
+    for chunk in id_chunks(ids):
+        result = session.execute(
+            update(model).where(model.id.in_(chunk)).values(**values).execution_options(synchronize_session=False)
+        )
+        count += result.rowcount
+    return count
+
+
+def delete_by_ids(session: Session, model, ids: Iterable[int], *conditions) -> int:
+    """
+    Deletes the rows of a model with the given IDs, with one DELETE per 1000 IDs. Does not commit.
+
+    :param session: SQLAlchemy session.
+    :param model: Mapped class with an id primary key.
+    :param ids: IDs of the rows to be deleted.
+    :param conditions: Extra conditions a row must meet to be deleted.
+    :return: Number of rows deleted.
+    """
+    count = 0
+    for chunk in id_chunks(ids):
+        result = session.execute(
+            delete(model).where(model.id.in_(chunk), *conditions).execution_options(synchronize_session=False)
+        )
+        count += result.rowcount
+    return count
@@ -1,6 +1,19 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from models.models import Input
+from datetime import date, datetime
+from sqlalchemy import Row, and_, case, delete, exists, func, or_, select, update
+from sqlalchemy.orm import Session, joinedload
+from typing import Iterable, Iterator, List, Optional
+from models.models import (
+    ArchivedBalance, Input, ReorderForecast, StockBalance, StockCheckpoint, StockMovement, Supplier
+)
+from repository.bulk import id_chunks, update_by_ids
+from repository.transaction import commit, rollback
+
+# columns searched by the search fields
+SEARCH_COLUMNS = {
+    'name': Input.name,
+    'category': Input.category,
+    'supplier': Supplier.name,
+}
 
 class InputRepository:
     """
@@ -22,16 +35,20 @@ class InputRepository:
         :param input_item: Input object to be added.
         """
         self.session.add(input_item)
-        self.session.commit()
+        commit(self.session)
 
-    def get_input_by_id(self, input_id: int) -> Optional[Input]:
+    def get_input_by_id(self, input_id: int, with_supplier: bool = False) -> Optional[Input]:
         """
         Retrieves an input by its ID.
 
         :param input_id: ID of the input to be retrieved.
+        :param with_supplier: Also loads the supplier of the input, in the same query.
         :return: Input object corresponding to the provided ID, or None if not found.
         """
-        return self.session.query(Input).filter(Input.id == input_id).first()
+        query = self.session.query(Input)
+        if with_supplier:
+            query = query.options(joinedload(Input.supplier))
+        return query.filter(Input.id == input_id).first()
 
     def update_input(self, input_item: Input) -> None:
         """
@@ -40,7 +57,7 @@ class InputRepository:
         :param input_item: Input object with the updated data.
         """
         self.session.merge(input_item)
-        self.session.commit()
+        commit(self.session)
 
     def delete_input(self, input_item: Input) -> None:
         """
@@ -49,7 +66,25 @@ class InputRepository:
         :param input_item: Input object to be removed.
         """
         self.session.delete(input_item)
-        self.session.commit()
+        commit(self.session)
+
+    def get_inputs_page(self, after_id: Optional[int] = None, limit: int = 100,
+                        with_supplier: bool = False) -> List[Input]:
+        """
+        Retrieves a page of inputs ordered by ID using keyset pagination, so every
+        page costs the same regardless of how deep it is in the table.
+
+        :param after_id: Only inputs with an ID greater than this one are returned.
+        :param limit: Maximum number of inputs in the page.
+        :param with_supplier: Also loads the supplier of each input, joined in the same query.
+        :return: List of Input objects.
+        """
+        query = self.session.query(Input)
+        if with_supplier:
+            query = query.options(joinedload(Input.supplier))
+        if after_id is not None:
+            query = query.filter(Input.id > after_id)
+        return query.order_by(Input.id).limit(limit).all()
 
     def get_all_inputs(self) -> List[Input]:
         """
@@ -58,3 +93,270 @@ class InputRepository:
         :return: List of Input objects.
         """
         return self.session.query(Input).all()
+
+    def get_expiring_inputs(self, until: date, after: Optional[date] = None,
+                            chunk_size: int = 5000) -> Iterator[Row]:
+        """
+        Streams the inputs that expire on or before a date, soonest first. The date window is
+        filtered in the database through the expiration date index.
+
+        :param until: Last expiration date included.
+        :param after: If given, only inputs expiring after this date are returned.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of rows with id, name, category, expiration_date and supplier_id.
+        """
+        query = (
+            select(Input.id, Input.name, Input.category, Input.expiration_date, Input.supplier_id)
+            .where(Input.expiration_date <= until)
+            .order_by(Input.expiration_date, Input.id)
+        )
+        if after is not None:
+            query = query.where(Input.expiration_date > after)
+        yield from self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+
+    def get_low_stock_inputs(self, threshold, chunk_size: int = 5000) -> Iterator[Row]:
+        """
+        Streams the inputs whose maintained stock balance is at or below a threshold. Inputs without
+        movements count as having no stock.
+
+        :param threshold: Highest balance considered low.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of rows with id, name, category, supplier_id and balance.
+        """
+        balance = func.coalesce(StockBalance.quantity, 0)
+        query = (
+            select(Input.id, Input.name, Input.category, Input.supplier_id, balance.label('balance'))
+            .outerjoin(StockBalance, StockBalance.input_id == Input.id)
+            .where(balance <= threshold)
+            .order_by(Input.id)
+        )
+        yield from self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+
+    def get_inputs_updated_since(self, since: datetime) -> List[Row]:
+        """
+        Retrieves the inputs created or changed since a moment, using the updated_at index.
+
+        :param since: Only inputs with updated_at at or after this moment are returned.
+        :return: List of rows with id, name, category, expiration_date, supplier_id and updated_at.
+        """
+        query = (
+            select(Input.id, Input.name, Input.category, Input.expiration_date, Input.supplier_id, Input.updated_at)
+            .where(Input.updated_at >= since)
+        )
+        return list(self.session.execute(query))
+
+    def get_last_update(self) -> Optional[datetime]:
+        """
+        Retrieves the most recent updated_at of the inputs table.
+
+        :return: The latest updated_at, or None if the table is empty.
+        """
+        return self.session.scalar(select(func.max(Input.updated_at)))
+
+    def get_existing_ids(self, input_ids: Iterable[int]) -> set[int]:
+        """
+        Retrieves which of the given input IDs exist, using one query per 1000 IDs.
+
+        :param input_ids: IDs of the inputs to be checked.
+        :return: Set with the IDs that exist.
+        """
+        existing = set()
+        for chunk in id_chunks(input_ids):
+            existing.update(self.session.scalars(select(Input.id).where(Input.id.in_(chunk))))
+        return existing
+
+    def stream_search_rows(self, chunk_size: int = 10000) -> Iterator[Row]:
+        """
+        Streams the searchable columns of every input, without building ORM objects.
+
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of rows with id, name, category, supplier_id and supplier_name, ordered by ID.
+        """
+        query = self._search_rows_query().order_by(Input.id)
+        yield from self.session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+
+    def get_search_rows(self, input_ids: Iterable[int]) -> dict[int, Row]:
+        """
+        Retrieves the searchable columns of some inputs, using one query per 1000 IDs.
+
+        :param input_ids: IDs of the inputs.
+        :return: Dictionary mapping the IDs that exist to rows with id, name, category,
+            supplier_id and supplier_name.
+        """
+        rows = {}
+        for chunk in id_chunks(input_ids):
+            rows.update((row.id, row) for row in self.session.execute(self._search_rows_query().where(Input.id.in_(chunk))))
+        return rows
+
+    def get_search_rows_updated_since(self, since: datetime) -> list[Row]:
+        """
+        Retrieves the searchable columns of the inputs changed since a moment, and of the inputs
+        of the suppliers changed since then (a renamed supplier changes what its inputs match).
+        Two queries are used, so each can use its own index.
+
+        :param since: Only changes at or after this moment are returned.
+        :return: List of rows with id, name, category, supplier_id, supplier_name and updated_at
+            (the latest of the input and supplier updated_at). An input may appear twice.
+        """
+        updated_at = case((Supplier.updated_at > Input.updated_at, Supplier.updated_at), else_=Input.updated_at)
+        query = self._search_rows_query(updated_at.label('updated_at'))
+        changed_inputs = self.session.execute(query.where(Input.updated_at >= since)).all()
+        changed_suppliers = select(Supplier.id).where(Supplier.updated_at >= since)
+        return changed_inputs + self.session.execute(query.where(Input.supplier_id.in_(changed_suppliers))).all()
+
+    def get_search_watermark(self) -> Optional[datetime]:
+        """
+        Retrieves the most recent updated_at of the inputs and suppliers tables.
+
+        :return: The latest updated_at, or None if both tables are empty.
+        """
+        moments = [self.get_last_update(), self.session.scalar(select(func.max(Supplier.updated_at)))]
+        return max((moment for moment in moments if moment is not None), default=None)
+
+    def get_database_time(self) -> datetime:
+        """
+        Retrieves the current time of the database, the clock updated_at is stamped with.
+
+        :return: The CURRENT_TIMESTAMP of the database.
+        """
+        return self.session.scalar(select(func.current_timestamp()))
+
+    def count_inputs(self) -> int:
+        """
+        Counts the inputs.
+
+        :return: Number of inputs.
+        """
+        return self.session.scalar(select(func.count(Input.id)))
+
+    def stream_input_ids(self, chunk_size: int = 50000) -> Iterator[int]:
+        """
+        Streams the IDs of all inputs.
+
+        :param chunk_size: Number of IDs fetched per round-trip.
+        :return: Iterator of input IDs.
+        """
+        yield from self.session.scalars(select(Input.id),
+                                        execution_options={'stream_results': True, 'yield_per': chunk_size})
+
+    def search_inputs(self, query: str, mode: str, fields: Iterable[str], limit: int) -> list[Row]:
+        """
+        Searches the inputs with LIKE conditions on the lower-cased columns, without any index
+        beyond the primary key: every search scans the inputs (joined to their suppliers).
+
+        :param query: Lower-cased text searched, with single spaces between words.
+        :param mode: 'prefix' (a column starts with the text), 'substring' (a column contains it)
+            or 'token' (every word of the text starts a word of one of the columns).
+        :param fields: Fields searched, among the keys of SEARCH_COLUMNS.
+        :param limit: Maximum number of inputs returned.
+        :return: List of rows with id, name, category, supplier_id and supplier_name, ordered by ID.
+        """
+        columns = [func.lower(SEARCH_COLUMNS[field]) for field in fields]
+        if mode == 'token':
+            condition = and_(*(
+                or_(*(or_(column.like(f'{_escape_like(token)}%', escape='\\'),
+                          column.like(f'% {_escape_like(token)}%', escape='\\')) for column in columns))
+                for token in query.split()
+            ))
+        else:
+            pattern = f'{_escape_like(query)}%' if mode == 'prefix' else f'%{_escape_like(query)}%'
+            condition = or_(*(column.like(pattern, escape='\\') for column in columns))
+        return self.session.execute(self._search_rows_query().where(condition).order_by(Input.id).limit(limit)).all()
+
+    @staticmethod
+    def _search_rows_query(*extra_columns):
+        return (
+            select(Input.id, Input.name, Input.category, Input.supplier_id, Supplier.name.label('supplier_name'),
+                   *extra_columns)
+            .outerjoin(Supplier, Input.supplier_id == Supplier.id)
+        )
+
+    def update_inputs_by_ids(self, input_ids: Iterable[int], values: dict) -> int:
+        """
+        Sets the same values on many inputs with one UPDATE per 1000 IDs and a single commit,
+        without loading them.
+
+        :param input_ids: IDs of the inputs to be updated.
+        :param values: Dictionary mapping column names to new values.
+        :return: Number of inputs updated.
+        """
+        try:
+            count = update_by_ids(self.session, Input, input_ids, values)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def update_inputs_by_category(self, category: str, values: dict) -> int:
+        """
+        Sets the same values on all the inputs of a category with a single UPDATE and commits.
+
+        :param category: Category of the inputs to be updated.
+        :param values: Dictionary mapping column names to new values.
+        :return: Number of inputs updated.
+        """
+        try:
+            result = self.session.execute(
+                update(Input).where(Input.category == category).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return result.rowcount
+
+    def delete_inputs_by_ids(self, input_ids: Iterable[int]) -> int:
+        """
+        Deletes many inputs with one DELETE per 1000 IDs and a single commit. Inputs that still
+        have stock movements are kept.
+
+        :param input_ids: IDs of the inputs to be deleted.
+        :return: Number of inputs deleted.
+        """
+        try:
+            count = sum(self._delete_inputs(Input.id.in_(chunk)) for chunk in id_chunks(input_ids))
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def delete_inputs_by_category(self, category: str) -> int:
+        """
+        Deletes all the inputs of a category that have no stock movements, and commits.
+
+        :param category: Category of the inputs to be deleted.
+        :return: Number of inputs deleted.
+        """
+        try:
+            count = self._delete_inputs(Input.category == category)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def _delete_inputs(self, condition) -> int:
+        """
+        Deletes the inputs meeting a condition and without stock movements (archived ones
+        included), along with their balance rows, checkpoints and reorder forecasts (the foreign keys cascade on
+        Oracle, but SQLite does not enforce them). Does not commit.
+        """
+        unused = and_(~exists().where(StockMovement.input_id == Input.id),
+                      ~exists().where(ArchivedBalance.input_id == Input.id))
+        deletable = select(Input.id).where(condition, unused)
+        for model in (StockCheckpoint, StockBalance, ReorderForecast):
+            self.session.execute(
+                delete(model).where(model.input_id.in_(deletable)).execution_options(synchronize_session=False)
+            )
+        result = self.session.execute(
+            delete(Input).where(condition, unused).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+
+def _escape_like(text: str) -> str:
+    """Escapes the LIKE wildcards of a text, with a backslash as the escape character."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,299 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from typing import Iterator, Optional
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.models import ArchivedBalance, StockBalance, StockCheckpoint, StockMovement
+from repository.analytics import PERIOD_FUNCTIONS
+from repository.bulk import id_chunks
+from repository.transaction import commit, rollback
+
+
+class StockBalanceRepository:
+    """
+    Repository for managing the on-hand stock balance of each input.
+
+    Write methods do not commit: they run inside the transaction of the stock movement
+    that changes the balance, so the ledger and the balance are committed together.
+    """
+
+    def __init__(self, session: Session):
+        """
+        Initializes the repository with a database session.
+
+        :param session: SQLAlchemy session for interacting with the database.
+        """
+        self.session = session
+
+    def get_balance_by_input_id(self, input_id: int) -> Optional[StockBalance]:
+        """
+        Retrieves the balance of an input by primary key.
+
+        :param input_id: ID of the input.
+        :return: StockBalance object, or None if the input has no movements yet.
+        """
+        return self.session.get(StockBalance, input_id)
+
+    def apply_delta(self, input_id: int, delta) -> None:
+        """
+        Adds a signed quantity to the balance of an input, creating the balance row if needed.
+
+        :param input_id: ID of the input.
+        :param delta: Quantity to be added (negative for OUT movements).
+        """
+        result = self.session.execute(
+            update(StockBalance)
+            .where(StockBalance.input_id == input_id)
+            .values(quantity=StockBalance.quantity + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            self.session.execute(insert(StockBalance).values(input_id=input_id, quantity=delta))
+
+    def try_debit(self, input_id: int, quantity) -> bool:
+        """
+        Subtracts a quantity from the balance of an input only if the balance covers it, with a
+        single conditional UPDATE. The check and the debit are atomic: the statement locks only
+        the balance row of the input (on Oracle, a concurrent debit of the same input waits for
+        it and re-evaluates the condition), so debits of different inputs never wait on each
+        other and concurrent debits of the same input cannot overdraw it. Does not commit.
+
+        :param input_id: ID of the input.
+        :param quantity: Quantity to be subtracted.
+        :return: True if the balance was debited, False if it does not cover the quantity or the
+            input has no balance row.
+        """
+        result = self.session.execute(
+            update(StockBalance)
+            .where(StockBalance.input_id == input_id, StockBalance.quantity >= quantity)
+            .values(quantity=StockBalance.quantity - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def apply_deltas(self, deltas: dict[int, Decimal]) -> None:
+        """
+        Adds signed quantities to the balances of many inputs with a single executemany UPDATE
+        and a single executemany INSERT for the inputs that have no balance row yet.
+
+        :param deltas: Dictionary mapping input IDs to the quantity to be added.
+        """
+        if not deltas:
+            return
+        input_ids = list(deltas)
+        existing = set()
+        for chunk in id_chunks(input_ids):
+            existing.update(self.session.scalars(select(StockBalance.input_id).where(StockBalance.input_id.in_(chunk))))
+        table = StockBalance.__table__
+        connection = self.session.connection()
+        if existing:
+            connection.execute(
+                update(table)
+                .where(table.c.input_id == bindparam('b_input_id'))
+                .values(quantity=table.c.quantity + bindparam('b_delta')),
+                [{'b_input_id': input_id, 'b_delta': deltas[input_id]} for input_id in existing],
+            )
+        missing = [input_id for input_id in input_ids if input_id not in existing]
+        if missing:
+            connection.execute(insert(table), [{'input_id': input_id, 'quantity': deltas[input_id]}
+                                               for input_id in missing])
+
+    def get_movement_effects(self, movement_ids: list[int]) -> dict[int, tuple[Decimal, date]]:
+        """
+        Computes, with a single GROUP BY query, what some stock movements add to the balance of
+        each of their inputs, and their earliest date.
+
+        :param movement_ids: IDs of the stock movements, at most 1000.
+        :return: Dictionary mapping input IDs to (signed quantity, earliest movement date) pairs.
+        """
+        query = (
+            select(StockMovement.input_id, func.sum(_signed_quantity()), func.min(StockMovement.movement_date))
+            .where(StockMovement.id.in_(movement_ids))
+            .group_by(StockMovement.input_id)
+        )
+        return {input_id: (total, earliest) for input_id, total, earliest in self.session.execute(query).tuples()}
+
+    def ledger_balances(self, include_archived: bool = False) -> Iterator[tuple[int, Decimal]]:
+        """
+        Computes the balance of every input from the stock movements ledger, in the database.
+
+        :param include_archived: Add the net effect of the archived movements kept in archived_balances.
+        :return: Iterator of (input_id, balance) pairs.
+        """
+        return iter(self.session.execute(self._ledger_balances_query(include_archived)).tuples())
+
+    def get_all_balances(self) -> dict[int, Decimal]:
+        """
+        Retrieves the maintained balance of every input.
+
+        :return: Dictionary mapping input IDs to balances.
+        """
+        return dict(self.session.execute(select(StockBalance.input_id, StockBalance.quantity)).tuples().all())
+
+    def rebuild_from_ledger(self, include_archived: bool = False) -> None:
+        """
+        Replaces all maintained balances with the ones computed from the ledger and commits.
+
+        :param include_archived: Add the net effect of the archived movements kept in archived_balances.
+        """
+        try:
+            self.session.execute(delete(StockBalance))
+            self.session.execute(
+                insert(StockBalance).from_select(['input_id', 'quantity'],
+                                                 self._ledger_balances_query(include_archived))
+            )
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+
+    def get_checkpoint(self, input_id: int, as_of: date) -> Optional[StockCheckpoint]:
+        """
+        Retrieves the latest balance checkpoint of an input taken on or before a date, through
+        the primary key index.
+
+        :param input_id: ID of the input.
+        :param as_of: Latest checkpoint date accepted.
+        :return: StockCheckpoint object, or None if the input has no checkpoint that old.
+        """
+        return self.session.scalars(
+            select(StockCheckpoint)
+            .where(StockCheckpoint.input_id == input_id, StockCheckpoint.checkpoint_date <= as_of)
+            .order_by(StockCheckpoint.checkpoint_date.desc())
+            .limit(1)
+        ).first()
+
+    def sum_movements(self, input_id: int, start: Optional[date], end: date) -> Decimal:
+        """
+        Adds up the signed quantities of the movements of an input in a date range, through
+        the (input_id, movement_date) index.
+
+        :param input_id: ID of the input.
+        :param start: First movement date included, or None to start from the first movement.
+        :param end: Last movement date included.
+        :return: Net change of the stock of the input in the range.
+        """
+        query = (
+            select(func.sum(_signed_quantity()))
+            .where(StockMovement.input_id == input_id, StockMovement.movement_date <= end)
+        )
+        if start is not None:
+            query = query.where(StockMovement.movement_date >= start)
+        return self.session.scalar(query) or Decimal(0)
+
+    def delete_stale_checkpoints(self, movement_dates: dict[int, date]) -> None:
+        """
+        Deletes the checkpoints made stale by movements written with an earlier date: those
+        of the same input dated after the movement. Checkpoints are never taken after today,
+        so movements dated today or later need no statement at all. Does not commit.
+
+        :param movement_dates: Dictionary mapping input IDs to the earliest movement date (or datetime) written.
+        """
+        today = date.today()
+        stale = []
+        for input_id, movement_date in movement_dates.items():
+            if isinstance(movement_date, datetime):
+                movement_date = movement_date.date()
+            if movement_date < today:
+                stale.append({'b_input_id': input_id, 'b_date': movement_date})
+        if not stale:
+            return
+        table = StockCheckpoint.__table__
+        self.session.connection().execute(
+            delete(table)
+            .where(table.c.input_id == bindparam('b_input_id'), table.c.checkpoint_date > bindparam('b_date')),
+            stale,
+        )
+
+    def rebuild_checkpoints(self, interval: str = 'month', batch_size: int = 1000,
+                            archive_cutoff: Optional[date] = None) -> int:
+        """
+        Replaces all balance checkpoints and commits. The net change of every input per period
+        is computed by a single GROUP BY query, and a running total per input gives the balance
+        at the start of each following period that has already begun. Only periods with
+        movements get a checkpoint, so a balance lookup never sums more than one period of
+        movements of the input.
+
+        Once movements are archived, the running totals start from archived_balances, which
+        only gives the right balance from the archive cutoff on: earlier checkpoints are skipped.
+
+        :param interval: Checkpoint interval: 'day', 'week' or 'month'.
+        :param batch_size: Number of checkpoints inserted per executemany round-trip.
+        :param archive_cutoff: Day before which the movements were archived, if any were.
+        :return: Number of checkpoints written.
+        """
+        bucket = PERIOD_FUNCTIONS[interval](StockMovement.movement_date)
+        query = (
+            select(StockMovement.input_id, bucket, func.sum(_signed_quantity()))
+            .group_by(StockMovement.input_id, bucket)
+            .order_by(StockMovement.input_id, bucket)
+        )
+        today = date.today()
+        opening = {}
+        if archive_cutoff is not None:
+            opening = dict(
+                self.session.execute(select(ArchivedBalance.input_id, ArchivedBalance.quantity)).tuples().all()
+            )
+        table = StockCheckpoint.__table__
+        count = 0
+        try:
+            self.session.execute(delete(StockCheckpoint))
+            connection = self.session.connection()
+            batch = []
+            rows = self.session.execute(query, execution_options={'stream_results': True, 'yield_per': batch_size})
+            for input_id, periods in groupby(rows.tuples(), key=lambda row: row[0]):
+                balance = opening.get(input_id, Decimal(0))
+                for _, period_start, net_change in periods:
+                    balance += net_change
+                    checkpoint_date = _next_period_start(period_start, interval)
+                    if checkpoint_date > today:
+                        break
+                    if archive_cutoff is not None and checkpoint_date < archive_cutoff:
+                        continue
+                    batch.append({'input_id': input_id, 'checkpoint_date': checkpoint_date, 'quantity': balance})
+                if len(batch) >= batch_size:
+                    connection.execute(insert(table), batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                connection.execute(insert(table), batch)
+                count += len(batch)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    @staticmethod
+    def _ledger_balances_query(include_archived: bool = False):
+        if not include_archived:
+            return (
+                select(StockMovement.input_id, func.sum(_signed_quantity()))
+                .group_by(StockMovement.input_id)
+            )
+        effects = (
+            select(StockMovement.input_id, _signed_quantity().label('quantity'))
+            .union_all(select(ArchivedBalance.input_id, ArchivedBalance.quantity))
+            .subquery()
+        )
+        return select(effects.c.input_id, func.sum(effects.c.quantity)).group_by(effects.c.input_id)
+
+
+def _signed_quantity():
+    """Quantity of a movement with the sign of its effect on the stock: positive for IN, negative for OUT."""
+    return case(
+        (StockMovement.movement_type == 'IN', StockMovement.quantity),
+        else_=-StockMovement.quantity,
+    )
+
+
+def _next_period_start(period_start: date, interval: str) -> date:
+    """Returns the first day of the period following the one starting on period_start."""
+    if interval == 'day':
+        return period_start + timedelta(days=1)
+    if interval == 'week':
+        return period_start + timedelta(days=7)
+    return (period_start + timedelta(days=32)).replace(day=1)
@@ -1,7 +1,73 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import Optional, Type
-from models.models import StockMovement
+from sqlalchemy import DateTime, RowMapping, bindparam, func, insert, select, text
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Type
+from models.models import Input, StockMovement
+from repository.bulk import delete_by_ids, id_chunks, update_by_ids
+from repository.transaction import commit, rollback
+
+MOVEMENT_REPORT_SELECT = """
+    SELECT 
+        sm.id AS movement_id,
+        sm.quantity AS movement_quantity,
+        sm.movement_type AS movement_type,
+        sm.movement_date AS movement_date,
+        i.name AS input_name,
+        s.name AS supplier_name
+    FROM 
+        stock_movements sm
+    JOIN 
+        inputs i ON sm.input_id = i.id
+    JOIN 
+        suppliers s ON i.supplier_id = s.id
+"""
+
+MOVEMENT_REPORT_SQL = MOVEMENT_REPORT_SELECT + """
+    ORDER BY
+        sm.id
+"""
+
+# one slice of the report, so partitions can be fetched independently and concatenated in order
+MOVEMENT_REPORT_RANGE_SQL = MOVEMENT_REPORT_SELECT + """
+    WHERE
+        sm.id BETWEEN :low_id AND :high_id
+    ORDER BY
+        sm.id
+"""
+
+# report rows with the updated_at of the movements, kept by the ORM and the Oracle triggers
+MOVEMENT_REPORT_UPDATED_SELECT = """
+    SELECT
+        sm.id AS movement_id,
+        sm.quantity AS movement_quantity,
+        sm.movement_type AS movement_type,
+        sm.movement_date AS movement_date,
+        i.name AS input_name,
+        s.name AS supplier_name,
+        sm.updated_at AS updated_at
+    FROM
+        stock_movements sm
+    JOIN
+        inputs i ON sm.input_id = i.id
+    JOIN
+        suppliers s ON i.supplier_id = s.id
+"""
+
+# movements changed after they were exported
+MOVEMENT_REPORT_CHANGES_SQL = MOVEMENT_REPORT_UPDATED_SELECT + """
+    WHERE
+        sm.updated_at BETWEEN :since AND :until
+        AND sm.id <= :last_id
+    ORDER BY
+        sm.id
+"""
+
+MOVEMENT_REPORT_RANGE_UPDATED_SQL = MOVEMENT_REPORT_UPDATED_SELECT + """
+    WHERE
+        sm.id BETWEEN :low_id AND :high_id
+    ORDER BY
+        sm.id
+"""
 
 class StockMovementRepository:
     """
@@ -23,7 +89,40 @@ class StockMovementRepository:
         :param stock_movement: StockMovement object to be added.
         """
         self.session.add(stock_movement)
-        self.session.commit()
+        commit(self.session)
+
+    def bulk_add_stock_movements(self, rows: list[dict]) -> int:
+        """
+        Adds many stock movements at once using a multi-row INSERT and a single commit.
+
+        If the batch fails, the transaction is rolled back and the error is re-raised,
+        leaving the session ready for the next batch.
+
+        :param rows: List of dictionaries with input_id, quantity, movement_type and movement_date keys.
+        :return: Number of stock movements inserted.
+        """
+        if not rows:
+            return 0
+        try:
+            self.session.execute(insert(StockMovement), rows)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return len(rows)
+
+    def get_existing_input_ids(self, input_ids: Iterable[int]) -> set[int]:
+        """
+        Retrieves which of the given input IDs exist in the database, using one query
+        per 1000 IDs (Oracle's limit for IN lists).
+
+        :param input_ids: IDs of the inputs to be checked.
+        :return: Set with the IDs that exist.
+        """
+        existing = set()
+        for chunk in id_chunks(input_ids):
+            existing.update(self.session.scalars(select(Input.id).where(Input.id.in_(chunk))))
+        return existing
 
     def get_stock_movement_by_id(self, movement_id: int) -> Optional[StockMovement]:
         """
@@ -41,7 +140,7 @@ class StockMovementRepository:
         :param stock_movement: StockMovement object with the updated data.
         """
         self.session.merge(stock_movement)
-        self.session.commit()
+        commit(self.session)
 
     def delete_stock_movement(self, stock_movement: StockMovement) -> None:
         """
@@ -50,7 +149,54 @@ class StockMovementRepository:
         :param stock_movement: StockMovement object to be removed.
         """
         self.session.delete(stock_movement)
-        self.session.commit()
+        commit(self.session)
+
+    def update_stock_movements_by_ids(self, movement_ids: Iterable[int], values: dict) -> int:
+        """
+        Sets the same values on many stock movements with one UPDATE per 1000 IDs and a single
+        commit, without loading them. The maintained balances are not touched.
+
+        :param movement_ids: IDs of the stock movements to be updated.
+        :param values: Dictionary mapping column names to new values.
+        :return: Number of stock movements updated.
+        """
+        try:
+            count = update_by_ids(self.session, StockMovement, movement_ids, values)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def delete_stock_movements_by_ids(self, movement_ids: Iterable[int]) -> int:
+        """
+        Deletes many stock movements with one DELETE per 1000 IDs and a single commit. The
+        maintained balances are not touched.
+
+        :param movement_ids: IDs of the stock movements to be deleted.
+        :return: Number of stock movements deleted.
+        """
+        try:
+            count = delete_by_ids(self.session, StockMovement, movement_ids)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def get_stock_movements_page(self, after_id: Optional[int] = None, limit: int = 100) -> list[StockMovement]:
+        """
+        Retrieves a page of stock movements ordered by ID using keyset pagination, so every
+        page costs the same regardless of how deep it is in the table.
+
+        :param after_id: Only stock movements with an ID greater than this one are returned.
+        :param limit: Maximum number of stock movements in the page.
+        :return: List of StockMovement objects.
+        """
+        query = self.session.query(StockMovement)
+        if after_id is not None:
+            query = query.filter(StockMovement.id > after_id)
+        return query.order_by(StockMovement.id).limit(limit).all()
 
     def get_all_stock_movements(self) -> list[Type[StockMovement]]:
         """
@@ -60,29 +206,104 @@ class StockMovementRepository:
         """
         return self.session.query(StockMovement).all()
 
-    def generate_movement_report(self):
-        sql = text("""
-            SELECT 
-                sm.id AS movement_id,
-                sm.quantity AS movement_quantity,
-                sm.movement_type AS movement_type,
-                sm.movement_date AS movement_date,
-                i.name AS input_name,
-                s.name AS supplier_name
-            FROM 
-                stock_movements sm
-            JOIN 
-                inputs i ON sm.input_id = i.id
-            JOIN 
-                suppliers s ON i.supplier_id = s.id
-        """)
-        result = self.session.execute(sql).mappings().all()
-        print(result)
-        return [{
-            'movement_id': row['movement_id'],
-            'movement_quantity': row['movement_quantity'],
-            'movement_type': row['movement_type'],
-            'movement_date': row['movement_date'],
-            'input_name': row['input_name'],
-            'supplier_name': row['supplier_name'],
-        } for row in result]
+    def stream_movement_report(self, chunk_size: int = 1000) -> Iterator[RowMapping]:
+        """
+        Streams the movement report rows (movement joined with its input and supplier),
+        using a server-side cursor that fetches chunk_size rows per round-trip.
+
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of rows with movement_id, movement_quantity, movement_type,
+            movement_date, input_name and supplier_name keys.
+        """
+        sql = text(MOVEMENT_REPORT_SQL)
+        result = self.session.execute(sql, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        try:
+            yield from result.mappings()
+        finally:
+            result.close()
+
+    def get_id_bounds(self) -> tuple[Optional[int], Optional[int]]:
+        """
+        Retrieves the lowest and highest stock movement IDs.
+
+        :return: Tuple with both IDs, or (None, None) if there are no movements.
+        """
+        row = self.session.execute(select(func.min(StockMovement.id), func.max(StockMovement.id))).one()
+        return row[0], row[1]
+
+    def stream_movement_report_range(self, low_id: int, high_id: int, chunk_size: int = 1000,
+                                     with_updated_at: bool = False) -> Iterator[RowMapping]:
+        """
+        Streams the movement report rows of the movements with IDs between low_id and high_id,
+        through the primary key index.
+
+        :param low_id: Lowest movement ID included.
+        :param high_id: Highest movement ID included.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :param with_updated_at: Add an updated_at key to the rows.
+        :return: Iterator of report rows, ordered by movement ID.
+        """
+        if with_updated_at:
+            sql = text(MOVEMENT_REPORT_RANGE_UPDATED_SQL).columns(updated_at=DateTime())
+        else:
+            sql = text(MOVEMENT_REPORT_RANGE_SQL)
+        result = self.session.execute(
+            sql, {'low_id': low_id, 'high_id': high_id},
+            execution_options={'stream_results': True, 'yield_per': chunk_size},
+        )
+        try:
+            yield from result.mappings()
+        finally:
+            result.close()
+
+    def get_change_watermark(self) -> tuple[Optional[int], Optional[datetime]]:
+        """
+        Retrieves the highest stock movement ID and the latest updated_at.
+
+        :return: Tuple with both values, or (None, None) if there are no movements.
+        """
+        row = self.session.execute(select(func.max(StockMovement.id), func.max(StockMovement.updated_at))).one()
+        return row[0], row[1]
+
+    def get_database_time(self) -> datetime:
+        """
+        Retrieves the current time of the database, the clock updated_at is stamped with.
+
+        :return: The CURRENT_TIMESTAMP of the database.
+        """
+        return self.session.scalar(select(func.current_timestamp()))
+
+    def stream_movement_report_changes(self, since: datetime, until: datetime, last_id: int,
+                                       chunk_size: int = 1000) -> Iterator[RowMapping]:
+        """
+        Streams the report rows of the movements up to last_id with updated_at in a range,
+        through the updated_at index.
+
+        :param since: Earliest updated_at included.
+        :param until: Latest updated_at included.
+        :param last_id: Highest movement ID included.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Iterator of report rows, with an extra updated_at key, ordered by movement ID.
+        """
+        sql = (
+            text(MOVEMENT_REPORT_CHANGES_SQL)
+            .bindparams(bindparam('since', type_=DateTime()), bindparam('until', type_=DateTime()))
+            .columns(updated_at=DateTime())
+        )
+        result = self.session.execute(
+            sql, {'since': since, 'until': until, 'last_id': last_id},
+            execution_options={'stream_results': True, 'yield_per': chunk_size},
+        )
+        try:
+            yield from result.mappings()
+        finally:
+            result.close()
+
+    def generate_movement_report(self) -> list[dict]:
+        """
+        Retrieves the whole movement report as a list. Prefer stream_movement_report
+        for large ledgers.
+
+        :return: List of dictionaries with the report rows.
+        """
+        return [dict(row) for row in self.stream_movement_report()]
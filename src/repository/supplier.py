@@ -1,6 +1,9 @@
-from sqlalchemy.orm import Session
-from typing import Optional, Type
-from models.models import Supplier
+from sqlalchemy import exists
+from sqlalchemy.orm import Session, selectinload
+from typing import Iterable, Optional, Type
+from models.models import Input, Supplier
+from repository.bulk import delete_by_ids, update_by_ids
+from repository.transaction import commit, rollback
 
 
 class SupplierRepository:
@@ -23,21 +26,20 @@ class SupplierRepository:
         :param supplier: Supplier object to be added.
         """
         self.session.add(supplier)
-        self.session.commit()
+        commit(self.session)
 
-    def fetch_supplier_by_id(self, supplier_id: int) -> Optional[Supplier]:
+    def fetch_supplier_by_id(self, supplier_id: int, with_inputs: bool = False) -> Optional[Supplier]:
         """
         Retrieves a supplier by its ID.
 
         :param supplier_id: ID of the supplier to be retrieved.
+        :param with_inputs: Also loads the inputs of the supplier, with a single extra query.
         :return: Supplier object corresponding to the provided ID, or None if not found.
         """
-        return (
-            self.session
-                .query(Supplier)
-                .filter(Supplier.id == supplier_id)
-                .first()
-        )
+        query = self.session.query(Supplier)
+        if with_inputs:
+            query = query.options(selectinload(Supplier.inputs))
+        return query.filter(Supplier.id == supplier_id).first()
 
     def fetch_all_suppliers(self) -> list[Type[Supplier]]:
         """
@@ -51,6 +53,25 @@ class SupplierRepository:
                 .all()
         )
 
+    def fetch_suppliers_page(self, after_id: Optional[int] = None, limit: int = 100,
+                             with_inputs: bool = False) -> list[Supplier]:
+        """
+        Retrieves a page of suppliers ordered by ID using keyset pagination, so every
+        page costs the same regardless of how deep it is in the table.
+
+        :param after_id: Only suppliers with an ID greater than this one are returned.
+        :param limit: Maximum number of suppliers in the page.
+        :param with_inputs: Also loads the inputs of the suppliers, with one extra query per
+            page (SQLAlchemy splits its IN list in batches of 500 IDs) instead of one per supplier.
+        :return: List of Supplier objects.
+        """
+        query = self.session.query(Supplier)
+        if with_inputs:
+            query = query.options(selectinload(Supplier.inputs))
+        if after_id is not None:
+            query = query.filter(Supplier.id > after_id)
+        return query.order_by(Supplier.id).limit(limit).all()
+
     def update_supplier(self, supplier: Supplier) -> None:
         """
         Updates the information of an existing supplier.
@@ -58,7 +79,7 @@ class SupplierRepository:
         :param supplier: Supplier object with the updated data.
         """
         self.session.merge(supplier)
-        self.session.commit()
+        commit(self.session)
 
     def delete_supplier(self, supplier: Supplier) -> None:
         """
@@ -67,4 +88,38 @@ class SupplierRepository:
         :param supplier: Supplier object to be removed.
         """
         self.session.delete(supplier)
-        self.session.commit()
+        commit(self.session)
+
+    def update_suppliers_by_ids(self, supplier_ids: Iterable[int], values: dict) -> int:
+        """
+        Sets the same values on many suppliers with one UPDATE per 1000 IDs and a single commit,
+        without loading them.
+
+        :param supplier_ids: IDs of the suppliers to be updated.
+        :param values: Dictionary mapping column names to new values.
+        :return: Number of suppliers updated.
+        """
+        try:
+            count = update_by_ids(self.session, Supplier, supplier_ids, values)
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
+
+    def delete_suppliers_by_ids(self, supplier_ids: Iterable[int]) -> int:
+        """
+        Deletes many suppliers with one DELETE per 1000 IDs and a single commit. Suppliers that
+        still have inputs are kept.
+
+        :param supplier_ids: IDs of the suppliers to be deleted.
+        :return: Number of suppliers deleted.
+        """
+        try:
+            count = delete_by_ids(self.session, Supplier, supplier_ids,
+                                  ~exists().where(Input.supplier_id == Supplier.id))
+            commit(self.session)
+        except Exception:
+            rollback(self.session)
+            raise
+        return count
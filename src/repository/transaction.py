@@ -0,0 +1,37 @@
+from sqlalchemy.orm import Session
+
+UNIT_OF_WORK_KEY = 'unit_of_work'
+
+
+def in_unit_of_work(session: Session) -> bool:
+    """
+    Checks whether a unit of work is open on a session.
+
+    :param session: SQLAlchemy session.
+    :return: True if the writes of the repositories are deferred to a unit of work.
+    """
+    return bool(session.info.get(UNIT_OF_WORK_KEY))
+
+
+def commit(session: Session) -> None:
+    """
+    Ends the write of a repository method. Outside a unit of work the session is committed, so
+    every call is its own transaction. Inside one, the changes stay pending in the session and
+    are flushed together (or earlier, by autoflush, before a query needs them) and committed, or
+    rolled back, with the unit of work.
+
+    :param session: SQLAlchemy session.
+    """
+    if not in_unit_of_work(session):
+        session.commit()
+
+
+def rollback(session: Session) -> None:
+    """
+    Undoes a failed repository write. Inside a unit of work nothing is done here: the error
+    propagates to the enclosing savepoint or unit of work, which decides what to roll back.
+
+    :param session: SQLAlchemy session.
+    """
+    if not in_unit_of_work(session):
+        session.rollback()
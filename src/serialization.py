@@ -0,0 +1,124 @@
+import json
+import operator
+from datetime import date
+
+
+def serialize_model(model, relationships=()):
+    """
+    Converts a SQLAlchemy object into a dictionary, excluding unwanted attributes.
+
+    Relationships are left out unless named in relationships, in which case the related
+    objects are converted as well. They should be eagerly loaded, or each one costs a query.
+    """
+    related = type(model).__mapper__.relationships.keys()
+    data = {key: value for key, value in model.__dict__.items() if not key.startswith('_') and key not in related}
+    for name in relationships:
+        value = getattr(model, name)
+        if value is None:
+            data[name] = None
+        elif isinstance(value, list):
+            data[name] = [serialize_model(item) for item in value]
+        else:
+            data[name] = serialize_model(value)
+    return data
+
+
+# encoders are built once: json.dumps builds a new one on every call that passes options
+compact_encoder = json.JSONEncoder(separators=(',', ':'), default=str)
+indented_encoder = json.JSONEncoder(indent=4, default=str)
+
+_JSON_TYPES = (int, float, str, bool)
+_serializers = {}
+
+
+def _memoized_str(limit: int = 4096):
+    """
+    Returns a str() replacement that remembers its results. Formatting a datetime costs more
+    than a dictionary lookup, and the dates of a listing repeat a lot (movement dates,
+    timestamps written by the same batch). The memo is dropped when it reaches limit entries.
+    """
+    memo = {}
+
+    def convert(value) -> str:
+        text = memo.get(value)
+        if text is None:
+            if len(memo) >= limit:
+                memo.clear()
+            text = memo[value] = str(value)
+        return text
+
+    return convert
+
+
+def _column_converter(column):
+    """
+    Chooses how a column value is turned into a JSON value: None for the types JSON handles
+    natively, or a function returning the same text json.dumps(default=str) writes for dates,
+    datetimes and Decimals.
+    """
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return str
+    if issubclass(python_type, _JSON_TYPES):
+        return None
+    if issubclass(python_type, date):
+        return _memoized_str()
+    return str
+
+
+def compile_serializer(model_class):
+    """
+    Builds a serializer for a mapped class from its column attributes. It produces the same
+    dictionary as serialize_model (the loaded columns, relationships left out), in column order
+    and with dates, datetimes and Decimals already converted to text, so the result can be
+    encoded without the default=str fallback.
+
+    :param model_class: Mapped class.
+    :return: Function converting an instance of the class into a dictionary.
+    """
+    attributes = model_class.__mapper__.column_attrs
+    keys = tuple(attribute.key for attribute in attributes)
+    converters = tuple((attribute.key, convert) for attribute in attributes
+                       if (convert := _column_converter(attribute.columns[0])) is not None)
+    read_all = operator.itemgetter(*keys)
+
+    def serialize(model) -> dict:
+        loaded = model.__dict__
+        try:
+            values = read_all(loaded)
+            data = dict(zip(keys, values if len(keys) > 1 else (values,)))
+        except KeyError:
+            # deferred or expired columns are left out, like serialize_model does
+            data = {key: loaded[key] for key in keys if key in loaded}
+        for key, convert in converters:
+            value = data.get(key)
+            if value is not None:
+                data[key] = convert(value)
+        return data
+
+    return serialize
+
+
+def to_dict(model, relationships=()) -> dict:
+    """
+    Converts a SQLAlchemy object into a dictionary with the serializer precompiled for its class.
+
+    :param model: Mapped object.
+    :param relationships: Names of the (eagerly loaded) relationships to be included.
+    :return: Dictionary with the loaded columns and the requested relationships.
+    """
+    model_class = type(model)
+    serializer = _serializers.get(model_class)
+    if serializer is None:
+        serializer = _serializers[model_class] = compile_serializer(model_class)
+    data = serializer(model)
+    for name in relationships:
+        value = getattr(model, name)
+        if value is None:
+            data[name] = None
+        elif isinstance(value, list):
+            data[name] = [to_dict(item) for item in value]
+        else:
+            data[name] = to_dict(value)
+    return data
@@ -0,0 +1,358 @@
+import json
+import os
+import re
+import socketserver
+from dataclasses import asdict
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy.orm import sessionmaker
+
+from context import AppContext
+from database import warm_pool
+from serialization import compact_encoder, to_dict
+from service.cache import cache_stats
+from service.search_index import SEARCH_FIELDS
+from service.stock_movements import InsufficientStockError
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+ROUTES = []
+
+
+class ApiError(Exception):
+    """
+    Error returned to the client with the given HTTP status.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def route(method: str, pattern: str):
+    """Registers a handler for the given HTTP method and path pattern."""
+    def decorator(handler):
+        ROUTES.append((method, re.compile(f'^{pattern}$'), handler))
+        return handler
+    return decorator
+
+
+def _page_params(params: dict) -> tuple[int, Optional[int]]:
+    try:
+        limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        after = int(params['after']) if 'after' in params else None
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "'limit' and 'after' must be integers")
+    return limit, after
+
+
+def _required(body: dict, *fields: str) -> list:
+    missing = [name for name in fields if body.get(name) in (None, '')]
+    if missing:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"Missing fields: {', '.join(missing)}")
+    return [body[name] for name in fields]
+
+
+def _parse_int(value, name: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{name}' must be an integer")
+
+
+def _parse_date(value, name: str):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"'{name}' is not in the correct format (YYYY-MM-DD)")
+
+
+def _serialize(model) -> dict:
+    # reading the primary key reloads the attributes expired by a commit
+    model.id
+    return to_dict(model)
+
+
+def _found(model, name: str) -> dict:
+    if model is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f'{name} not found!')
+    return _serialize(model)
+
+
+@route('GET', '/health')
+def health(context, params, body):
+    return HTTPStatus.OK, {'status': 'ok'}
+
+
+@route('GET', '/suppliers')
+def list_suppliers(context, params, body):
+    limit, after = _page_params(params)
+    return HTTPStatus.OK, [to_dict(item) for item in context.supplier_service.iter_suppliers(after, limit)]
+
+
+@route('GET', r'/suppliers/(?P<supplier_id>\d+)')
+def get_supplier(context, params, body, supplier_id):
+    return HTTPStatus.OK, _found(context.supplier_service.fetch_supplier(int(supplier_id)), 'Supplier')
+
+
+@route('POST', '/suppliers')
+def create_supplier(context, params, body):
+    name, = _required(body, 'name')
+    supplier = context.supplier_service.create_supplier(name, body.get('contact_info'), body.get('address'))
+    return HTTPStatus.CREATED, _serialize(supplier)
+
+
+@route('GET', '/inputs')
+def list_inputs(context, params, body):
+    limit, after = _page_params(params)
+    return HTTPStatus.OK, [to_dict(item) for item in context.input_service.iter_inputs(after, limit)]
+
+
+@route('GET', '/inputs/search')
+def search_inputs(context, params, body):
+    if not params.get('q', '').strip():
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Missing parameter: 'q'")
+    fields = [field for field in params['fields'].split(',') if field] if params.get('fields') else SEARCH_FIELDS
+    limit = min(_parse_int(params.get('limit', 20), 'limit'), MAX_PAGE_SIZE)
+    try:
+        hits = context.search_service.search(params['q'], params.get('mode', 'prefix'), fields, limit)
+    except ValueError as error:
+        raise ApiError(HTTPStatus.BAD_REQUEST, str(error))
+    return HTTPStatus.OK, [asdict(hit) for hit in hits]
+
+
+@route('GET', r'/inputs/(?P<input_id>\d+)')
+def get_input(context, params, body, input_id):
+    return HTTPStatus.OK, _found(context.input_service.get_input(int(input_id)), 'Input')
+
+
+def _input_fields(body: dict) -> tuple:
+    name, category, quantity, expiration_date, supplier_id = _required(
+        body, 'name', 'category', 'quantity', 'expiration_date', 'supplier_id')
+    return (name, category, _parse_int(quantity, 'quantity'), _parse_date(expiration_date, 'expiration_date'),
+            _parse_int(supplier_id, 'supplier_id'))
+
+
+@route('POST', '/inputs')
+def create_input(context, params, body):
+    new_input = context.input_service.create_input(*_input_fields(body))
+    if new_input is None:
+        raise ApiError(HTTPStatus.UNPROCESSABLE_ENTITY, 'Supplier not found!')
+    return HTTPStatus.CREATED, _serialize(new_input)
+
+
+@route('PUT', r'/inputs/(?P<input_id>\d+)')
+def update_input(context, params, body, input_id):
+    updated_input = context.input_service.update_input(int(input_id), *_input_fields(body))
+    return HTTPStatus.OK, _found(updated_input, 'Input')
+
+
+@route('DELETE', r'/inputs/(?P<input_id>\d+)')
+def delete_input(context, params, body, input_id):
+    if not context.input_service.delete_input(int(input_id)):
+        raise ApiError(HTTPStatus.NOT_FOUND, 'Input not found!')
+    return HTTPStatus.OK, {'message': 'Input successfully deleted!'}
+
+
+@route('GET', '/stock-movements')
+def list_stock_movements(context, params, body):
+    limit, after = _page_params(params)
+    movements = context.stock_movement_service.iter_stock_movements(after, limit)
+    return HTTPStatus.OK, [to_dict(item) for item in movements]
+
+
+@route('GET', r'/stock-movements/(?P<movement_id>\d+)')
+def get_stock_movement(context, params, body, movement_id):
+    return HTTPStatus.OK, _found(context.stock_movement_service.get_stock_movement(int(movement_id)), 'Movement')
+
+
+@route('POST', '/stock-movements')
+def create_stock_movement(context, params, body):
+    input_id, quantity, movement_type = _required(body, 'input_id', 'quantity', 'movement_type')
+    movement_type = str(movement_type).upper()
+    if movement_type not in ('IN', 'OUT'):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "'movement_type' must be 'IN' or 'OUT'")
+    movement_date = _parse_date(body['movement_date'], 'movement_date') if body.get('movement_date') \
+        else datetime.now().date()
+    input_id, quantity = _parse_int(input_id, 'input_id'), _parse_int(quantity, 'quantity')
+    if body.get('check_stock') and movement_type == 'OUT':
+        try:
+            movement = context.stock_movement_service.debit_stock(input_id, quantity, movement_date)
+        except InsufficientStockError as error:
+            raise ApiError(HTTPStatus.CONFLICT, str(error))
+    else:
+        movement = context.stock_movement_service.create_stock_movement(input_id, quantity, movement_type,
+                                                                        movement_date)
+    return HTTPStatus.CREATED, _serialize(movement)
+
+
+@route('GET', r'/stock-balances/(?P<input_id>\d+)')
+def get_stock_balance(context, params, body, input_id):
+    return HTTPStatus.OK, {'input_id': int(input_id),
+                           'balance': context.stock_balance_service.get_balance(int(input_id))}
+
+
+@route('GET', '/cache/stats')
+def get_cache_stats(context, params, body):
+    return HTTPStatus.OK, cache_stats()
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    Dispatches the HTTP requests to the services. Each request runs on its own session,
+    which borrows a connection from the engine pool and gives it back when done.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FarmTechAgro'
+    # headers and body are written separately; without TCP_NODELAY each keep-alive response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        raw_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            handler, path_params = self._resolve(method, url.path)
+            body = self._parse_body(raw_body)
+            status, payload = self._run(handler, params, body, path_params)
+        except ApiError as error:
+            status, payload = error.status, {'error': error.message}
+        self._send_json(status, payload)
+
+    def _resolve(self, method: str, path: str):
+        allowed = False
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path.rstrip('/') or '/')
+            if match:
+                if route_method == method:
+                    return handler, match.groupdict()
+                allowed = True
+        if allowed:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f'Method {method} not allowed')
+        raise ApiError(HTTPStatus.NOT_FOUND, f'Path {path} not found')
+
+    @staticmethod
+    def _parse_body(raw_body: bytes) -> dict:
+        if not raw_body:
+            return {}
+        try:
+            body = json.loads(raw_body)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Request body is not valid JSON')
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Request body must be a JSON object')
+        return body
+
+    def _run(self, handler, params: dict, body: dict, path_params: dict):
+        session = self.server.session_factory()
+        try:
+            return handler(AppContext(session=session), params, body, **path_params)
+        except ApiError:
+            session.rollback()
+            raise
+        except Exception as error:
+            session.rollback()
+            self.log_error('Error handling %s %s: %r', self.command, self.path, error)
+            raise ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, 'Internal server error')
+        finally:
+            session.close()
+
+    def _send_json(self, status: HTTPStatus, payload) -> None:
+        data = compact_encoder.encode(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_request(self, code='-', size='-') -> None:
+        if self.server.verbose:
+            super().log_request(code, size)
+
+
+class UnixApiRequestHandler(ApiRequestHandler):
+    """
+    Request handler for Unix sockets, which do not support TCP options.
+    """
+    disable_nagle_algorithm = False
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server over TCP.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], session_factory, verbose: bool = False):
+        super().__init__(address, ApiRequestHandler)
+        self.session_factory = session_factory
+        self.verbose = verbose
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+class UnixApiServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Threaded HTTP server over a Unix socket.
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, session_factory, verbose: bool = False):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, UnixApiRequestHandler)
+        self.session_factory = session_factory
+        self.verbose = verbose
+
+    @property
+    def address(self) -> str:
+        return f'unix:{self.server_address}'
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def create_server(engine, host: str = '127.0.0.1', port: int = 8080, socket_path: Optional[str] = None,
+                  verbose: bool = False):
+    """
+    Creates the API server on top of a pooled engine and opens the pool connections up front.
+
+    :param engine: SQLAlchemy engine whose pool is shared by all requests.
+    :param host: Host to listen on, when serving over TCP.
+    :param port: Port to listen on, when serving over TCP (0 picks a free port).
+    :param socket_path: Path of a Unix socket to listen on instead of TCP.
+    :param verbose: Whether to log every request.
+    :return: The server, ready for serve_forever().
+    """
+    session_factory = sessionmaker(bind=engine)
+    pool_size = engine.pool.size() if callable(getattr(engine.pool, 'size', None)) else 1
+    warm_pool(engine, pool_size)
+    if socket_path:
+        return UnixApiServer(socket_path, session_factory, verbose)
+    return ApiServer((host, port), session_factory, verbose)
@@ -0,0 +1,198 @@
+import heapq
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from repository.inputs import InputRepository
+from service.watermark import DEFAULT_SETTLE_SECONDS, MARGIN, settled_watermark
+
+
+@dataclass
+class ExpirationAlert:
+    """
+    An input that expires within the warning window (or has already expired).
+    """
+    input_id: int
+    name: str
+    category: str
+    supplier_id: Optional[int]
+    expiration_date: date
+    days_left: int
+
+
+@dataclass
+class LowStockAlert:
+    """
+    An input whose stock balance is at or below the threshold.
+    """
+    input_id: int
+    name: str
+    category: str
+    supplier_id: Optional[int]
+    balance: float
+    threshold: float
+
+
+def _expiration_alert(row, today: date) -> ExpirationAlert:
+    return ExpirationAlert(
+        input_id=row.id,
+        name=row.name,
+        category=row.category,
+        supplier_id=row.supplier_id,
+        expiration_date=row.expiration_date,
+        days_left=(row.expiration_date - today).days,
+    )
+
+
+class AlertService:
+    """
+    Service for finding inputs close to expiration or low on stock. The filters run in the
+    database, so only the inputs that raise an alert are transferred.
+    """
+
+    def __init__(self, repository: InputRepository):
+        """
+        Initializes the AlertService with the given repository.
+
+        :param repository: Repository for managing input records.
+        """
+        self.repository = repository
+
+    def expiration_alerts(self, days: int, today: Optional[date] = None) -> Iterator[ExpirationAlert]:
+        """
+        Finds the inputs that expire within the next days, including the ones already expired.
+
+        :param days: Size of the warning window, in days.
+        :param today: Reference date. Defaults to the current date.
+        :return: Iterator of ExpirationAlert, soonest first.
+        """
+        today = today or date.today()
+        for row in self.repository.get_expiring_inputs(today + timedelta(days=days)):
+            yield _expiration_alert(row, today)
+
+    def low_stock_alerts(self, threshold) -> Iterator[LowStockAlert]:
+        """
+        Finds the inputs whose stock balance is at or below a threshold.
+
+        :param threshold: Highest balance considered low.
+        :return: Iterator of LowStockAlert, ordered by input ID.
+        """
+        for row in self.repository.get_low_stock_inputs(threshold):
+            yield LowStockAlert(
+                input_id=row.id,
+                name=row.name,
+                category=row.category,
+                supplier_id=row.supplier_id,
+                balance=row.balance,
+                threshold=threshold,
+            )
+
+
+class ExpirationScheduler:
+    """
+    Emits each expiration alert once, when the input enters the warning window, without
+    polling the whole table.
+
+    The inputs expiring up to warning_days + lookahead_days ahead are loaded once into a
+    min-heap ordered by expiration date. Each poll only reads the inputs changed since the
+    previous one (by updated_at), extends the loaded window when the days go by, and pops the
+    heap entries that became due. Entries made stale by a change are skipped when popped.
+    Like the search index, the watermark stays settle_seconds behind the database time and
+    the changes are read from slightly before it, so rows committed late are not missed;
+    reading a change again only pushes a heap entry when the expiration date moved.
+    The alerts emitted are remembered until the expiration date passes, so an input changed
+    after it expired is alerted again.
+    """
+
+    def __init__(self, repository: InputRepository, warning_days: int = 30, lookahead_days: int = 30,
+                 clock: Callable[[], date] = date.today, settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        """
+        Initializes the scheduler. Nothing is loaded until the first poll.
+
+        :param repository: Repository for managing input records.
+        :param warning_days: Days before the expiration date when the alert is emitted.
+        :param lookahead_days: Extra days loaded beyond the warning window, so the window does not
+            have to be extended on every poll.
+        :param clock: Function returning the current date.
+        :param settle_seconds: Seconds the watermark of the changes stays behind the database time.
+        """
+        self.repository = repository
+        self.warning_days = warning_days
+        self.lookahead_days = lookahead_days
+        self.clock = clock
+        self.settle_seconds = settle_seconds
+        self.heap = []
+        self.tracked = {}
+        self.alerted = {}
+        self.loaded_until = None
+        self.watermark = None
+
+    def poll(self) -> list[ExpirationAlert]:
+        """
+        Refreshes the scheduler and returns the alerts that became due since the previous poll.
+
+        :return: List of new ExpirationAlert, soonest first.
+        """
+        today = self.clock()
+        due_until = today + timedelta(days=self.warning_days)
+        if self.loaded_until is None:
+            self.watermark = self._settled(self.repository.get_last_update())
+            self._load(None, due_until + timedelta(days=self.lookahead_days))
+        else:
+            self._refresh_changes()
+            if due_until > self.loaded_until:
+                self._load(self.loaded_until, due_until + timedelta(days=self.lookahead_days))
+        return self._pop_due(today, due_until)
+
+    def _load(self, after: Optional[date], until: date) -> None:
+        for row in self.repository.get_expiring_inputs(until, after):
+            self._track(row)
+        self.loaded_until = until
+
+    def _track(self, row) -> None:
+        self.tracked[row.id] = row
+        heapq.heappush(self.heap, (row.expiration_date, row.id))
+
+    def _refresh_changes(self) -> None:
+        if self.watermark is None:
+            self.watermark = self._settled(self.repository.get_last_update())
+            return
+        latest = self.watermark
+        for row in self.repository.get_inputs_updated_since(self.watermark - MARGIN):
+            latest = max(latest, row.updated_at)
+            current = self.tracked.get(row.id)
+            if row.expiration_date <= self.loaded_until:
+                if current is None or current.expiration_date != row.expiration_date:
+                    self._track(row)
+                else:
+                    self.tracked[row.id] = row
+            elif current is not None:
+                del self.tracked[row.id]
+        self.watermark = max(self.watermark, self._settled(latest))
+
+    def _settled(self, moment: Optional[datetime]) -> Optional[datetime]:
+        return settled_watermark(self.repository, moment, self.settle_seconds)
+
+    def _pop_due(self, today: date, due_until: date) -> list[ExpirationAlert]:
+        due = []
+        while self.heap and self.heap[0][0] <= due_until:
+            expiration_date, input_id = heapq.heappop(self.heap)
+            row = self.tracked.get(input_id)
+            if row is None or row.expiration_date != expiration_date:
+                continue
+            if self.alerted.get(input_id) != expiration_date:
+                due.append(row)
+            else:
+                del self.tracked[input_id]
+        self.alerted = {input_id: expiration_date for input_id, expiration_date in self.alerted.items()
+                        if expiration_date >= today}
+        if not due:
+            return []
+        existing = self.repository.get_existing_ids(row.id for row in due)
+        alerts = []
+        for row in due:
+            if row.id in existing:
+                self.alerted[row.id] = row.expiration_date
+                alerts.append(_expiration_alert(row, today))
+            self.tracked.pop(row.id, None)
+        return alerts
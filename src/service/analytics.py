@@ -0,0 +1,158 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from repository.analytics import AnalyticsRepository
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+    from service.reorder_forecast import ReorderForecastResult
+
+PERIODS = ('day', 'week', 'month')
+GROUPINGS = ('input', 'category', 'supplier')
+
+GROUP_FIELDS = {
+    'input': ['input_id', 'input_name'],
+    'category': ['category'],
+    'supplier': ['supplier_id', 'supplier_name'],
+}
+TOTAL_FIELDS = ['total_in', 'total_out', 'net_change', 'movements']
+
+# first day of the bucket of a date, as computed in the database by repository.analytics.PERIOD_FUNCTIONS
+PERIOD_STARTS = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+
+
+def consumption_fields(group_by: str) -> list[str]:
+    """
+    Returns the fields of the consumption report rows for a grouping, in output order.
+
+    :param group_by: 'input', 'category' or 'supplier'.
+    :return: List of field names.
+    """
+    return ['period', *GROUP_FIELDS[group_by], *TOTAL_FIELDS]
+
+
+class AnalyticsService:
+    """
+    Service for the consumption analytics computed from the stock movements ledger.
+    """
+
+    def __init__(self, repository: AnalyticsRepository, archive: Optional['LedgerArchiveService'] = None):
+        """
+        Initializes the AnalyticsService with the given repository.
+
+        :param repository: Repository for the aggregate queries.
+        :param archive: Service of the ledger archive, whose movements the analytics include.
+            Only the stock_movements table is read when omitted.
+        """
+        self.repository = repository
+        self.archive = archive
+
+    def consumption_report(self, period: str = 'month', group_by: str = 'input', start: Optional[date] = None,
+                           end: Optional[date] = None) -> Iterator[dict]:
+        """
+        Computes the IN and OUT totals and the net change of stock per time bucket and group.
+        When archived movements fall in the date range, they are totalled from the archive files
+        and added to the totals of the database, and the rows are sorted in memory.
+
+        :param period: 'day', 'week' (starting on Monday) or 'month'.
+        :param group_by: 'input', 'category' or 'supplier'.
+        :param start: First movement date included, if given.
+        :param end: Last movement date included, if given.
+        :return: Iterator of dictionaries keyed by consumption_fields(group_by), ordered by period.
+        :raises ValueError: If the period or the grouping is not supported, or start is after end.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unsupported period '{period}', use one of: {', '.join(PERIODS)}")
+        if group_by not in GROUPINGS:
+            raise ValueError(f"Unsupported grouping '{group_by}', use one of: {', '.join(GROUPINGS)}")
+        if start is not None and end is not None and start > end:
+            raise ValueError('The start date must not be after the end date')
+        fields = consumption_fields(group_by)
+        rows = self.repository.aggregate_movements(period, group_by, start, end)
+        if self.archive is not None and self.archive.has_archives(start, end):
+            rows = self._add_archived_totals(rows, period, group_by, start, end)
+        return ({field: row[field] for field in fields} for row in rows)
+
+    def _add_archived_totals(self, rows: Iterator, period: str, group_by: str, start: Optional[date],
+                             end: Optional[date]) -> list[dict]:
+        """Adds the archived movements of a date range to the consumption totals of the database."""
+        group_fields = GROUP_FIELDS[group_by]
+        totals = {}
+        for row in rows:
+            period_start = row['period'].date() if isinstance(row['period'], datetime) else row['period']
+            key = (period_start, *(row[field] for field in group_fields))
+            totals[key] = [row['total_in'], row['total_out'], row['movements']]
+
+        inputs = self.archive.input_details()
+        bucket = PERIOD_STARTS[period]
+        groups = {
+            'input': lambda details: (details.id, details.name),
+            'category': lambda details: (details.category,),
+            'supplier': lambda details: (details.supplier_id, details.supplier_name),
+        }[group_by]
+        for movement in self.archive.movements(start, end):
+            details = inputs.get(movement.input_id)
+            # the database totals join the movements with their input
+            if details is None:
+                continue
+            key = (bucket(movement.movement_date), *groups(details))
+            total = totals.setdefault(key, [Decimal(0), Decimal(0), 0])
+            total[0 if movement.movement_type == 'IN' else 1] += movement.quantity
+            total[2] += 1
+
+        merged = []
+        for key in sorted(totals, key=lambda key: [(value is None, value) for value in key]):
+            total_in, total_out, movements = totals[key]
+            merged.append({
+                'period': key[0], **dict(zip(group_fields, key[1:])), 'total_in': total_in, 'total_out': total_out,
+                'net_change': total_in - total_out, 'movements': movements,
+            })
+        return merged
+
+    def ledger_snapshot(self, use_numpy: Optional[bool] = None) -> 'LedgerSnapshot':
+        """
+        Loads the stock movements ledger into a compact columnar snapshot, for repeated
+        aggregates (balances, period totals, top consumers) computed in memory. Archived
+        movements come first, followed by the ones of the database.
+
+        :param use_numpy: Whether to use numpy: None uses it when installed, False never does.
+        :return: LedgerSnapshot of all the movements.
+        """
+        from service.ledger_snapshot import LedgerSnapshot
+
+        rows = self.repository.stream_ledger()
+        if self.archive is not None and self.archive.has_archives():
+            rows = chain(self.archive.ledger_rows(), rows)
+        return LedgerSnapshot.from_rows(rows, use_numpy)
+
+    def reorder_forecast(self, parameters: Optional['ForecastParameters'] = None,
+                         use_numpy: Optional[bool] = None) -> 'ReorderForecastResult':
+        """
+        Computes the reorder suggestions of every input from its OUT history: average daily
+        consumption, days of cover, safety stock, reorder point and suggested order quantity.
+
+        :param parameters: Settings of the forecast. The defaults of ForecastParameters when omitted.
+        :param use_numpy: Whether to use numpy: None uses it when installed, False never does.
+        :return: ReorderForecastResult of all the inputs.
+        :raises ValueError: If the parameters are out of range.
+        """
+        from service.reorder_forecast import ForecastParameters, ReorderForecaster
+
+        forecaster = ReorderForecaster(self.repository, archive=self.archive)
+        return forecaster.forecast(parameters or ForecastParameters(), use_numpy)
+
+    def save_reorder_forecast(self, forecast: 'ReorderForecastResult') -> int:
+        """
+        Replaces the contents of the reorder_forecasts table with a forecast.
+
+        :param forecast: ReorderForecastResult to be saved.
+        :return: Number of rows written.
+        """
+        rows = ({**row, 'computed_on': forecast.computed_on} for row in forecast.rows())
+        return self.repository.replace_reorder_forecasts(rows)
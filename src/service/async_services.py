@@ -0,0 +1,304 @@
+import asyncio
+from collections import deque
+from datetime import date
+from itertools import islice
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Optional
+
+from models.models import Input, StockMovement, Supplier
+from repository.async_repositories import AsyncInputRepository, AsyncStockMovementRepository, AsyncSupplierRepository
+from service.cache import LRUCache, detached_copy
+from service.pagination import aiter_keyset, split_range
+from service.stock_movements import signed_quantity
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+
+# archived report rows read per call in a worker thread, so the archive files do not block the event loop
+ARCHIVE_BATCH_SIZE = 10000
+
+
+class AsyncSupplierService:
+    """
+    Asyncio counterpart of SupplierService.
+    """
+
+    def __init__(self, repository: AsyncSupplierRepository, cache: Optional[LRUCache] = None):
+        """
+        Initializes the AsyncSupplierService with the given repository.
+
+        :param repository: Async repository for managing supplier records.
+        :param cache: Read-through cache for suppliers fetched by ID. Lookups always hit the database when omitted.
+        """
+        self.repository = repository
+        self.cache = cache
+
+    async def create_supplier(self, name: str, contact_info: str, address: str) -> Supplier:
+        """
+        Creates a new supplier.
+
+        :param name: Name of the supplier.
+        :param contact_info: Contact information of the supplier.
+        :param address: Address of the supplier.
+        :return: The created Supplier object.
+        """
+        new_supplier = Supplier(name=name, contact_info=contact_info, address=address)
+        await self.repository.add_supplier(new_supplier)
+        return new_supplier
+
+    async def fetch_supplier(self, supplier_id: int) -> Optional[Supplier]:
+        """
+        Retrieves a supplier by its ID.
+
+        :param supplier_id: ID of the supplier to be retrieved.
+        :return: Supplier object if found, or None if not found. When the cache is enabled, the
+            object is a new copy of the cached one, not bound to the session.
+        """
+        if self.cache is None:
+            return await self.repository.fetch_supplier_by_id(supplier_id)
+        supplier = self.cache.get(int(supplier_id))
+        if supplier is None:
+            supplier = detached_copy(await self.repository.fetch_supplier_by_id(supplier_id))
+            if supplier is not None:
+                self.cache.put(int(supplier_id), supplier)
+        return detached_copy(supplier)
+
+    async def fetch_suppliers(self, supplier_ids: Iterable[int]) -> list[Supplier]:
+        """
+        Retrieves many suppliers by ID with one query per 1000 IDs.
+
+        :param supplier_ids: IDs of the suppliers to be retrieved.
+        :return: List of the suppliers found, ordered by ID.
+        """
+        return await self.repository.fetch_suppliers_by_ids(supplier_ids)
+
+    def iter_suppliers(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                       page_size: int = 500) -> AsyncIterator[Supplier]:
+        """
+        Iterates over the suppliers ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only suppliers with an ID greater than this one are returned.
+        :param limit: Maximum number of suppliers, or None for all of them.
+        :param page_size: Number of suppliers fetched per query.
+        :return: Async iterator of Supplier objects.
+        """
+        return aiter_keyset(self.repository.fetch_suppliers_page, after_id, limit, page_size)
+
+
+class AsyncInputService:
+    """
+    Asyncio counterpart of InputService.
+    """
+
+    def __init__(self, repository: AsyncInputRepository, supplier_service: AsyncSupplierService,
+                 cache: Optional[LRUCache] = None):
+        """
+        Initializes the AsyncInputService with the given repository and supplier service.
+
+        :param repository: Async repository for managing input records.
+        :param supplier_service: Async service for managing supplier-related operations.
+        :param cache: Read-through cache for inputs fetched by ID. Lookups always hit the database when omitted.
+        """
+        self.repository = repository
+        self.supplier_service = supplier_service
+        self.cache = cache
+
+    async def create_input(self, name: str, category: str, quantity: int, expiration_date: date,
+                           supplier_id: int) -> Optional[Input]:
+        """
+        Creates a new input if the supplier exists.
+
+        :param name: Name of the input.
+        :param category: Category of the input.
+        :param quantity: Quantity of the input.
+        :param expiration_date: Expiration date of the input.
+        :param supplier_id: ID of the supplier associated with the input.
+        :return: The created Input object if successful, or None if the supplier does not exist.
+        """
+        if await self.supplier_service.fetch_supplier(supplier_id) is None:
+            return None
+        new_input = Input(
+            name=name,
+            category=category,
+            quantity=quantity,
+            expiration_date=expiration_date,
+            supplier_id=supplier_id
+        )
+        await self.repository.add_input(new_input)
+        return new_input
+
+    async def get_input(self, input_id: int) -> Optional[Input]:
+        """
+        Retrieves an input by its ID.
+
+        :param input_id: ID of the input to be retrieved.
+        :return: Input object if found, or None if not found. When the cache is enabled, the
+            object is a new copy of the cached one, not bound to the session.
+        """
+        if self.cache is None:
+            return await self.repository.get_input_by_id(input_id)
+        input_item = self.cache.get(int(input_id))
+        if input_item is None:
+            input_item = detached_copy(await self.repository.get_input_by_id(input_id))
+            if input_item is not None:
+                self.cache.put(int(input_id), input_item)
+        return detached_copy(input_item)
+
+    async def get_inputs(self, input_ids: Iterable[int]) -> list[Input]:
+        """
+        Retrieves many inputs by ID with one query per 1000 IDs.
+
+        :param input_ids: IDs of the inputs to be retrieved.
+        :return: List of the inputs found, ordered by ID.
+        """
+        return await self.repository.get_inputs_by_ids(input_ids)
+
+    def iter_inputs(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                    page_size: int = 500) -> AsyncIterator[Input]:
+        """
+        Iterates over the inputs ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only inputs with an ID greater than this one are returned.
+        :param limit: Maximum number of inputs, or None for all of them.
+        :param page_size: Number of inputs fetched per query.
+        :return: Async iterator of Input objects.
+        """
+        return aiter_keyset(self.repository.get_inputs_page, after_id, limit, page_size)
+
+
+class AsyncStockMovementService:
+    """
+    Asyncio counterpart of StockMovementService.
+    """
+
+    def __init__(self, repository: AsyncStockMovementRepository, maintain_balances: bool = True,
+                 archive: Optional['LedgerArchiveService'] = None):
+        """
+        Initializes the AsyncStockMovementService with the given repository.
+
+        :param repository: Async repository for managing stock movement records.
+        :param maintain_balances: Whether new movements update the stock balances in their transaction.
+        :param archive: Service of the ledger archive, whose movements are merged into the report.
+        """
+        self.repository = repository
+        self.maintain_balances = maintain_balances
+        self.archive = archive
+
+    async def create_stock_movement(self, input_id: int, quantity: int, movement_type: str,
+                                    movement_date: Optional[date] = None) -> StockMovement:
+        """
+        Creates a new stock movement.
+
+        :param input_id: ID of the input associated with the stock movement.
+        :param quantity: Quantity of the stock movement.
+        :param movement_type: Type of the stock movement (IN or OUT).
+        :param movement_date: Date of the stock movement. Defaults to today's date.
+        :return: The created StockMovement object.
+        """
+        new_movement = StockMovement(
+            input_id=input_id,
+            quantity=quantity,
+            movement_type=movement_type,
+            movement_date=movement_date or date.today()
+        )
+        delta = signed_quantity(movement_type, quantity) if self.maintain_balances else None
+        await self.repository.add_stock_movement(new_movement, delta)
+        return new_movement
+
+    async def get_stock_movement(self, movement_id: int) -> Optional[StockMovement]:
+        """
+        Retrieves a stock movement by its ID.
+
+        :param movement_id: ID of the stock movement to be retrieved.
+        :return: StockMovement object if found, or None if not found.
+        """
+        return await self.repository.get_stock_movement_by_id(movement_id)
+
+    async def get_stock_movements(self, movement_ids: Iterable[int]) -> list[StockMovement]:
+        """
+        Retrieves many stock movements by ID with one query per 1000 IDs.
+
+        :param movement_ids: IDs of the stock movements to be retrieved.
+        :return: List of the stock movements found, ordered by ID.
+        """
+        return await self.repository.get_stock_movements_by_ids(movement_ids)
+
+    def iter_stock_movements(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                             page_size: int = 500) -> AsyncIterator[StockMovement]:
+        """
+        Iterates over the stock movements ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only stock movements with an ID greater than this one are returned.
+        :param limit: Maximum number of stock movements, or None for all of them.
+        :param page_size: Number of stock movements fetched per query.
+        :return: Async iterator of StockMovement objects.
+        """
+        return aiter_keyset(self.repository.get_stock_movements_page, after_id, limit, page_size)
+
+    async def stream_movement_report(self, partitions: int = 16, concurrency: int = 4) -> AsyncIterator[dict]:
+        """
+        Streams the movement report, split in ID ranges that are queried concurrently, each on
+        its own connection. Up to concurrency ranges are fetched ahead of the one being consumed,
+        so memory usage is bounded by concurrency / partitions of the report.
+
+        Archived movements are merged in by movement ID, like in the synchronous report. The
+        archive files are read ARCHIVE_BATCH_SIZE rows at a time in a worker thread.
+
+        :param partitions: Number of ID ranges the report is split in.
+        :param concurrency: Maximum number of ranges fetched at the same time.
+        :return: Async iterator of report rows, ordered by movement ID.
+        """
+        rows = self._stream_table_report(partitions, concurrency)
+        try:
+            if self.archive is None or not await asyncio.to_thread(self.archive.has_archives):
+                async for row in rows:
+                    yield row
+                return
+            archived = self.archive.report_rows()
+            pending = deque(await asyncio.to_thread(list, islice(archived, ARCHIVE_BATCH_SIZE)))
+            async for row in rows:
+                while pending and pending[0]['movement_id'] < row['movement_id']:
+                    yield pending.popleft()
+                    if not pending:
+                        pending.extend(await asyncio.to_thread(list, islice(archived, ARCHIVE_BATCH_SIZE)))
+                yield row
+            while pending:
+                yield pending.popleft()
+                if not pending:
+                    pending.extend(await asyncio.to_thread(list, islice(archived, ARCHIVE_BATCH_SIZE)))
+        finally:
+            await rows.aclose()
+
+    async def _stream_table_report(self, partitions: int, concurrency: int) -> AsyncIterator[dict]:
+        """Streams the report rows of the stock_movements table, fetching its ID ranges concurrently."""
+        low_id, high_id = await self.repository.get_id_bounds()
+        if low_id is None:
+            return
+        ranges = iter(split_range(low_id, high_id, partitions))
+        pending = deque()
+
+        def fetch_next() -> None:
+            bounds = next(ranges, None)
+            if bounds is not None:
+                pending.append(asyncio.ensure_future(self.repository.get_movement_report_range(*bounds)))
+
+        try:
+            for _ in range(max(1, concurrency)):
+                fetch_next()
+            while pending:
+                rows = await pending.popleft()
+                fetch_next()
+                for row in rows:
+                    yield dict(row)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_movement_report(self, partitions: int = 16, concurrency: int = 4) -> list[dict]:
+        """
+        Retrieves the whole movement report as a list, fetching its ID ranges concurrently.
+
+        :param partitions: Number of ID ranges the report is split in.
+        :param concurrency: Maximum number of ranges fetched at the same time.
+        :return: List of dictionaries with the report rows, ordered by movement ID.
+        """
+        return [row async for row in self.stream_movement_report(partitions, concurrency)]
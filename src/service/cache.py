@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy import inspect
+
+
+class LRUCache:
+    """
+    Thread-safe cache bounded by size (least recently used entries are evicted first)
+    and by age (entries expire ttl_seconds after being stored).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes an empty cache.
+
+        :param max_size: Maximum number of entries. A size of 0 disables the cache.
+        :param ttl_seconds: Time, in seconds, an entry stays valid.
+        :param clock: Function returning the current time, in seconds.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Retrieves a valid entry and marks it as recently used.
+
+        :param key: Key of the entry.
+        :return: The cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores an entry, evicting the least recently used ones when the cache is full.
+
+        :param key: Key of the entry.
+        :param value: Value to be cached.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Retrieves an entry, calling loader and caching its result on a miss.
+        None results are not cached.
+
+        :param key: Key of the entry.
+        :param loader: Function loading the value from the source.
+        :return: The cached or loaded value.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Removes an entry, if present.
+
+        :param key: Key of the entry.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the usage counters of the cache.
+
+        :return: Dictionary with size, max_size, hits, misses, evictions and hit_rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def detached_copy(model):
+    """
+    Copies the column values of a mapped object into a new instance that is not bound
+    to any session, so it can be cached and read after the session is closed or committed.
+
+    :param model: Mapped object, or None.
+    :return: The copy, or None.
+    """
+    if model is None:
+        return None
+    mapper = inspect(model).mapper
+    return mapper.class_(**{attribute.key: getattr(model, attribute.key) for attribute in mapper.column_attrs})
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> LRUCache:
+    """
+    Returns the process-wide cache with the given name, creating it on first use with the
+    size and TTL set by the CACHE_MAX_SIZE and CACHE_TTL_SECONDS environment variables.
+
+    :param name: Name of the cache.
+    :return: The cache.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(
+                max_size=int(os.getenv('CACHE_MAX_SIZE', 1024)),
+                ttl_seconds=float(os.getenv('CACHE_TTL_SECONDS', 300)),
+            )
+        return _caches[name]
+
+
+def cache_stats() -> dict:
+    """
+    Returns the usage counters of every cache created so far.
+
+    :return: Dictionary mapping cache names to their stats.
+    """
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
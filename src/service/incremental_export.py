@@ -0,0 +1,233 @@
+import heapq
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from itertools import chain
+from operator import itemgetter
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from repository.stock_movements import StockMovementRepository
+from service.movement_io import write_movement_report
+from service.watermark import DEFAULT_SETTLE_SECONDS, settled_watermark
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+
+# SQLite keeps CURRENT_TIMESTAMP as text with second precision, which does not compare equal to a
+# bound datetime; the change queries are widened by this margin and the rows filtered exactly here
+_MARGIN = timedelta(seconds=1)
+
+
+def state_path(output: str) -> str:
+    """Returns the path of the file keeping the export state of a report file."""
+    return output + '.state.json'
+
+
+@dataclass
+class ExportState:
+    """
+    Watermark of an incrementally exported report: the highest movement ID exported, an
+    updated_at up to which every committed change was exported, and the (movement ID,
+    updated_at) pairs exported at or after it, which the next export reads again and skips.
+    """
+    file_format: str
+    last_movement_id: int = 0
+    updated_at: Optional[datetime] = None
+    recent: list[tuple[int, datetime]] = field(default_factory=list)
+    parts: list[str] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ExportState']:
+        """
+        Reads the state file of a report.
+
+        :param path: Path of the state file.
+        :return: ExportState, or None if the file does not exist.
+        """
+        try:
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        if data.get('updated_at'):
+            data['updated_at'] = datetime.fromisoformat(data['updated_at'])
+        # state files written before the settle window kept the IDs exported at the watermark
+        ids_at_updated_at = data.pop('ids_at_updated_at', None)
+        if ids_at_updated_at is not None:
+            data['recent'] = [(movement_id, data['updated_at']) for movement_id in ids_at_updated_at]
+        else:
+            data['recent'] = [(movement_id, datetime.fromisoformat(moment))
+                              for movement_id, moment in data.get('recent', ())]
+        return cls(**data)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the state file, replacing the previous one atomically.
+
+        :param path: Path of the state file.
+        """
+        data = asdict(self)
+        data['updated_at'] = self.updated_at.isoformat() if self.updated_at else None
+        data['recent'] = [[movement_id, moment.isoformat()] for movement_id, moment in self.recent]
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=4)
+        os.replace(temporary, path)
+
+
+@dataclass
+class ExportResult:
+    """
+    Summary of an export run.
+    """
+    mode: str
+    path: str
+    new_rows: int = 0
+    changed_rows: int = 0
+
+
+class IncrementalReportExporter:
+    """
+    Exports the movement report incrementally. The first run (or a rebuild) writes the whole
+    report and records a watermark next to it; the following runs only read the movements
+    created after the last exported ID and the older ones whose updated_at moved past the last
+    exported one, so a run costs in proportion to the activity since the previous one.
+
+    updated_at is stamped when a statement runs, but the row only becomes visible when its
+    transaction commits. The watermark therefore never passes the database time minus
+    settle_seconds: each run reads that window again and skips the movements it already
+    exported with the same updated_at. A movement committed more than settle_seconds after it
+    was stamped, with an ID below the last exported one, is only exported by a rebuild (or a
+    later change of the movement).
+
+    The rows are appended to the report, or written to a new dated part file. A changed
+    movement is exported again, so readers should keep the last row of every movement ID.
+    Deleted movements are not tracked: rebuild the report to drop them. Archived movements
+    cannot change, so only the full exports read the archive.
+    """
+
+    def __init__(self, repository: StockMovementRepository, clock: Callable[[], datetime] = datetime.now,
+                 archive: Optional['LedgerArchiveService'] = None, settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        """
+        Initializes the exporter.
+
+        :param repository: Repository of the stock movements.
+        :param clock: Returns the current moment, used to name the part files.
+        :param archive: Service of the ledger archive, whose movements the full exports include.
+        :param settle_seconds: Seconds the watermark stays behind the database time.
+        """
+        self.repository = repository
+        self.clock = clock
+        self.archive = archive
+        self.settle_seconds = settle_seconds
+
+    def export(self, output: str, file_format: str = 'csv', part_files: bool = False, rebuild: bool = False,
+               chunk_size: int = 1000) -> ExportResult:
+        """
+        Exports the movements created or changed since the previous export of a report.
+
+        :param output: Path of the report file. Its state is kept in state_path(output).
+        :param file_format: 'csv' or 'jsonl'.
+        :param part_files: Write the rows of an incremental run to a new file named after the
+            report and the current moment, instead of appending them to the report.
+        :param rebuild: Rewrite the whole report and reset its watermark, deleting the part files
+            written since the previous rebuild.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: ExportResult with the mode ('full' or 'incremental'), the file written and the row counts.
+        :raises ValueError: If the report was exported in another format.
+        :raises FileNotFoundError: If the report file of an incremental export is missing.
+        """
+        path = state_path(output)
+        state = ExportState.load(path)
+        if state is not None and state.file_format != file_format and not rebuild:
+            raise ValueError(f"The report was exported as {state.file_format}, use that format or rebuild it")
+
+        high_id, latest = self.repository.get_change_watermark()
+        full = state is None or rebuild
+        updated_at = None
+        if latest is not None:
+            updated_at = settled_watermark(self.repository, latest, self.settle_seconds)
+            if not full and state.updated_at is not None and state.updated_at > updated_at:
+                updated_at = state.updated_at
+        new_state = ExportState(file_format, high_id or 0, updated_at)
+
+        if full:
+            result = self._export_full(output, file_format, new_state, chunk_size)
+            for part in state.parts if state is not None else ():
+                if os.path.exists(part):
+                    os.remove(part)
+        else:
+            result = self._export_changes(output, file_format, part_files, state, new_state, latest, chunk_size)
+            new_state.parts = state.parts + ([os.path.abspath(result.path)] if result.path != output else [])
+        new_state.save(path)
+        return result
+
+    def _export_full(self, output: str, file_format: str, new_state: ExportState, chunk_size: int) -> ExportResult:
+        rows = ()
+        if new_state.last_movement_id:
+            rows = self._recorded(self.repository.stream_movement_report_range(
+                0, new_state.last_movement_id, chunk_size, with_updated_at=True), new_state)
+        if self.archive is not None and self.archive.has_archives():
+            rows = heapq.merge(self.archive.report_rows(), rows, key=itemgetter('movement_id'))
+        with open(output, mode='w', newline='', encoding='utf-8') as file:
+            count = write_movement_report(rows, file, file_format)
+        return ExportResult('full', output, new_rows=count)
+
+    def _export_changes(self, output: str, file_format: str, part_files: bool, state: ExportState,
+                        new_state: ExportState, latest: Optional[datetime], chunk_size: int) -> ExportResult:
+        result = ExportResult('incremental', output)
+        if new_state.updated_at is not None:
+            new_state.recent = [pair for pair in state.recent if pair[1] >= new_state.updated_at]
+        changed = ()
+        if state.updated_at is not None and latest is not None:
+            changed = self._changed_rows(state, latest, chunk_size)
+        created = ()
+        if new_state.last_movement_id > state.last_movement_id:
+            created = self.repository.stream_movement_report_range(state.last_movement_id + 1,
+                                                                   new_state.last_movement_id, chunk_size,
+                                                                   with_updated_at=True)
+
+        def counted(rows, attribute: str) -> Iterator:
+            for row in self._recorded(rows, new_state):
+                setattr(result, attribute, getattr(result, attribute) + 1)
+                yield row
+
+        rows = chain(counted(changed, 'changed_rows'), counted(created, 'new_rows'))
+        if part_files:
+            stem, extension = os.path.splitext(output)
+            result.path = f'{stem}-{self.clock():%Y%m%dT%H%M%S}{extension}'
+            with open(result.path, mode='w', newline='', encoding='utf-8') as file:
+                count = write_movement_report(rows, file, file_format)
+            if not count:
+                os.remove(result.path)
+                result.path = output
+        else:
+            if not os.path.exists(output):
+                raise FileNotFoundError(f'{output} does not exist, rebuild the report')
+            with open(output, mode='a', newline='', encoding='utf-8') as file:
+                write_movement_report(rows, file, file_format, header=False)
+        return result
+
+    def _changed_rows(self, state: ExportState, until: datetime, chunk_size: int) -> Iterator:
+        """
+        Yields the report rows of the movements up to the last exported ID with updated_at from
+        the watermark of state, except the ones it records as exported with that updated_at.
+        """
+        since = state.updated_at
+        exported = set(state.recent)
+        rows = self.repository.stream_movement_report_changes(since - _MARGIN, until + _MARGIN,
+                                                              state.last_movement_id, chunk_size)
+        for row in rows:
+            moment = row['updated_at']
+            if moment >= since and (row['movement_id'], moment) not in exported:
+                yield row
+
+    @staticmethod
+    def _recorded(rows, new_state: ExportState) -> Iterator:
+        """Yields rows, recording in new_state the ones the next export will read again."""
+        for row in rows:
+            moment = row['updated_at']
+            if moment is not None and new_state.updated_at is not None and moment >= new_state.updated_at:
+                new_state.recent.append((row['movement_id'], moment))
+            yield row
@@ -0,0 +1,336 @@
+import csv
+import gzip
+import heapq
+import os
+import time
+from array import array
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from repository.archive import LedgerArchiveRepository
+
+ARCHIVE_FIELDS = ['id', 'input_id', 'quantity', 'movement_type', 'movement_date', 'created_at', 'updated_at']
+
+
+class ArchivedMovement(NamedTuple):
+    """
+    A stock movement read from an archive file.
+    """
+    id: int
+    input_id: int
+    quantity: Decimal
+    movement_type: str
+    movement_date: date
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @property
+    def signed_quantity(self) -> Decimal:
+        """Effect of the movement on the stock: positive for IN, negative for OUT."""
+        return self.quantity if self.movement_type == 'IN' else -self.quantity
+
+
+@dataclass
+class ArchiveResult:
+    """
+    Summary of an archive run.
+    """
+    before: date
+    files: list[dict] = field(default_factory=list)
+    movements: int = 0
+    dropped_partitions: list[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+
+def write_archive_file(path: str, rows: Iterable) -> None:
+    """
+    Writes stock movements to a gzip-compressed CSV file with an ARCHIVE_FIELDS header. The
+    file is written under a temporary name and renamed when complete.
+
+    :param path: Path of the archive file.
+    :param rows: Iterable of rows with the ARCHIVE_FIELDS attributes.
+    """
+    temporary = path + '.tmp'
+    with gzip.open(temporary, mode='wt', newline='', encoding='utf-8', compresslevel=6) as file:
+        writer = csv.writer(file)
+        writer.writerow(ARCHIVE_FIELDS)
+        for row in rows:
+            writer.writerow([
+                row.id, row.input_id, row.quantity, row.movement_type, _as_date(row.movement_date).isoformat(),
+                row.created_at.isoformat() if row.created_at else '',
+                row.updated_at.isoformat() if row.updated_at else '',
+            ])
+    os.replace(temporary, path)
+
+
+def read_archive_file(path: str) -> Iterator[ArchivedMovement]:
+    """
+    Lazily reads the stock movements of an archive file.
+
+    :param path: Path of the archive file.
+    :return: Iterator of ArchivedMovement, in the order of the file (by movement ID).
+    """
+    with gzip.open(path, mode='rt', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for movement_id, input_id, quantity, movement_type, movement_date, created_at, updated_at in reader:
+            yield ArchivedMovement(
+                int(movement_id), int(input_id), Decimal(quantity), movement_type, date.fromisoformat(movement_date),
+                datetime.fromisoformat(created_at) if created_at else None,
+                datetime.fromisoformat(updated_at) if updated_at else None,
+            )
+
+
+def _as_date(value) -> date:
+    """Converts the datetimes some drivers return for DATE columns into dates."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _report_number(quantity: Decimal):
+    """Converts an archived quantity into the int or float the database drivers return for the live rows."""
+    return int(quantity) if quantity == quantity.to_integral_value() else float(quantity)
+
+
+class LedgerArchiveService:
+    """
+    Service for archiving old stock movements and reading them back.
+
+    Archiving moves the movements dated before a cutoff out of the stock_movements table, one
+    month at a time, into gzip-compressed CSV files (one or more per month) in the archive
+    directory. Each month is a transaction: its movements are read in ID order and locked,
+    written to the file, and then deleted. In the same transaction, the file is recorded in
+    ledger_archives, and the net effect of its movements on each input is added to
+    archived_balances. The maintained stock_balances are not touched, because archiving does
+    not change the stock.
+
+    The read methods let the reports and balance computations add the archived movements to
+    the ones still in the table. They only open the files whose recorded date and ID ranges
+    overlap the request.
+    """
+
+    def __init__(self, repository: LedgerArchiveRepository, directory: str):
+        """
+        Initializes the LedgerArchiveService.
+
+        :param repository: Repository of the archive records.
+        :param directory: Directory of the archive files.
+        """
+        self.repository = repository
+        self.directory = directory
+
+    def archive(self, before: date, dry_run: bool = False, drop_partitions: bool = False,
+                chunk_size: int = 10000) -> ArchiveResult:
+        """
+        Archives the stock movements dated before a day.
+
+        :param before: Movements dated before this day are archived.
+        :param dry_run: Only list the months and number of movements that would be archived.
+        :param drop_partitions: Afterwards, drop the emptied partitions of stock_movements (Oracle,
+            when the table is partitioned by movement_date).
+        :param chunk_size: Number of movements fetched per round-trip.
+        :return: ArchiveResult with one entry per file written (or per month, for a dry run).
+        :raises ValueError: If before is after today.
+        :raises RuntimeError: If the archive tables do not exist, or movements of a month were
+            deleted by someone else while being archived (that month is left unchanged).
+        """
+        if before > date.today():
+            raise ValueError('Only movements dated before today can be archived')
+        if not self.repository.has_archive_tables():
+            raise RuntimeError('The archive tables do not exist, run the migrations first')
+        started = time.perf_counter()
+        result = ArchiveResult(before)
+        months = self.repository.count_movements_by_month(before)
+        if dry_run:
+            result.files = [{'period': month, 'movements': count} for month, count in months]
+            result.movements = sum(count for _, count in months)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            for month, _ in months:
+                archived = self._archive_month(month, min(_next_month(month), before), before, chunk_size)
+                if archived is not None:
+                    result.files.append(archived)
+                    result.movements += archived['movements']
+            if drop_partitions:
+                result.dropped_partitions = self.repository.drop_empty_partitions(before)
+        result.elapsed_seconds = time.perf_counter() - started
+        return result
+
+    def _archive_month(self, start: date, end: date, before: date, chunk_size: int) -> Optional[dict]:
+        """Archives the movements dated from start to the day before end, in one file and one transaction."""
+        file_name = f'movements-{start:%Y-%m}-{datetime.now():%Y%m%d%H%M%S%f}.csv.gz'
+        path = os.path.join(self.directory, file_name)
+        movement_ids = array('q')
+        totals = {}
+        dates = set()
+
+        def collect(rows):
+            for row in rows:
+                movement_ids.append(row.id)
+                quantity, count = totals.get(row.input_id, (Decimal(0), 0))
+                signed = row.quantity if row.movement_type == 'IN' else -row.quantity
+                totals[row.input_id] = (quantity + signed, count + 1)
+                dates.add(_as_date(row.movement_date))
+                yield row
+
+        try:
+            write_archive_file(path, collect(self.repository.stream_movements_to_archive(start, end, chunk_size)))
+            if not movement_ids:
+                os.remove(path)
+                self.repository.session.rollback()
+                return None
+            record = {
+                'period_start': start, 'file_name': file_name, 'movements': len(movement_ids),
+                'first_id': movement_ids[0], 'last_id': movement_ids[-1], 'first_date': min(dates),
+                'last_date': max(dates), 'archived_before': before,
+            }
+            self.repository.add_archive(record, totals, movement_ids)
+        except BaseException:
+            self.repository.session.rollback()
+            for leftover in (path, path + '.tmp'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        return {'period': start, 'file_name': file_name, 'movements': len(movement_ids)}
+
+    def list_archives(self) -> list[dict]:
+        """
+        Lists the archive files.
+
+        :return: List of dictionaries with the columns of ledger_archives, ordered by month.
+        """
+        columns = ['id', 'period_start', 'file_name', 'movements', 'first_id', 'last_id', 'first_date', 'last_date',
+                   'archived_before', 'created_at']
+        return [{column: getattr(archive, column) for column in columns} for archive in self.repository.get_archives()]
+
+    def cutoff(self) -> Optional[date]:
+        """
+        Returns the day before which every stock movement has been archived.
+
+        :return: The cutoff, or None if nothing was archived.
+        """
+        return self.repository.get_cutoff()
+
+    def archived_balance(self, input_id: int) -> Decimal:
+        """
+        Returns the net effect of the archived movements of an input on its stock.
+
+        :param input_id: ID of the input.
+        :return: Signed quantity, 0 if the input has no archived movements.
+        """
+        return self.repository.get_archived_balance(input_id)
+
+    def movements(self, start: Optional[date] = None, end: Optional[date] = None, first_id: Optional[int] = None,
+                  last_id: Optional[int] = None, input_id: Optional[int] = None) -> Iterator[ArchivedMovement]:
+        """
+        Reads the archived movements matching some filters, opening only the files whose date
+        and ID ranges overlap them.
+
+        :param start: First movement date included, if given.
+        :param end: Last movement date included, if given.
+        :param first_id: Lowest movement ID included, if given.
+        :param last_id: Highest movement ID included, if given.
+        :param input_id: Only the movements of this input, if given.
+        :return: Iterator of ArchivedMovement, ordered by movement ID.
+        :raises FileNotFoundError: If an archive file recorded in the database is missing.
+        """
+        archives = self.repository.get_archives(start, end, first_id, last_id)
+        streams = [self._read(archive.file_name) for archive in archives]
+        for movement in heapq.merge(*streams) if len(streams) > 1 else (streams[0] if streams else ()):
+            if ((start is None or movement.movement_date >= start) and (end is None or movement.movement_date <= end)
+                    and (first_id is None or movement.id >= first_id) and (last_id is None or movement.id <= last_id)
+                    and (input_id is None or movement.input_id == input_id)):
+                yield movement
+
+    def _read(self, file_name: str) -> Iterator[ArchivedMovement]:
+        path = os.path.join(self.directory, file_name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'Archive file {path} is missing (check LEDGER_ARCHIVE_DIR)')
+        return read_archive_file(path)
+
+    def report_rows(self, first_id: Optional[int] = None, last_id: Optional[int] = None,
+                    inputs: Optional[dict] = None) -> Iterator[dict]:
+        """
+        Reads the archived movements as movement report rows, joined with the current name of
+        their input and supplier like the rows of the stock_movements table.
+
+        :param first_id: Lowest movement ID included, if given.
+        :param last_id: Highest movement ID included, if given.
+        :param inputs: Result of input_details(), when already loaded.
+        :return: Iterator of dictionaries keyed by the report fields, ordered by movement ID.
+        """
+        if not self.repository.get_archives(first_id=first_id, last_id=last_id):
+            return
+        inputs = inputs if inputs is not None else self.input_details()
+        for movement in self.movements(first_id=first_id, last_id=last_id):
+            details = inputs.get(movement.input_id)
+            # the live report joins inputs and suppliers, so movements without them are left out
+            if details is None or details.supplier_name is None:
+                continue
+            yield {
+                'movement_id': movement.id,
+                'movement_quantity': _report_number(movement.quantity),
+                'movement_type': movement.movement_type,
+                'movement_date': movement.movement_date,
+                'input_name': details.name,
+                'supplier_name': details.supplier_name,
+            }
+
+    def daily_consumption(self, start: date, end: date) -> dict[tuple[int, date], float]:
+        """
+        Totals the archived OUT movements of a date range per input and day.
+
+        :param start: First movement date included.
+        :param end: Last movement date included.
+        :return: Dictionary mapping (input_id, movement_date) pairs to the OUT total, as a float.
+        """
+        totals = {}
+        for movement in self.movements(start, end):
+            if movement.movement_type == 'OUT':
+                key = (movement.input_id, movement.movement_date)
+                totals[key] = totals.get(key, 0.0) + float(movement.quantity)
+        return totals
+
+    def ledger_rows(self) -> Iterator[tuple]:
+        """
+        Reads the archived movements as rows of the ledger snapshot.
+
+        :return: Iterator of (input_id, quantity, movement_type, movement_date) tuples, with float
+            quantities, ordered by movement ID.
+        """
+        for movement in self.movements():
+            yield movement.input_id, float(movement.quantity), movement.movement_type, movement.movement_date
+
+    def input_details(self) -> dict:
+        """
+        Loads the name, category and supplier of every input, to join the archived movements.
+
+        :return: Dictionary mapping input IDs to rows with id, name, category, supplier_id and supplier_name.
+        """
+        return self.repository.get_input_details()
+
+    def has_archives(self, start: Optional[date] = None, end: Optional[date] = None) -> bool:
+        """
+        Checks whether archived movements may fall in a date range.
+
+        :param start: First date of the range, if given.
+        :param end: Last date of the range, if given.
+        :return: True if an archive file overlaps the range.
+        """
+        return bool(self.repository.get_archives(start, end))
+
+    def id_bounds(self) -> tuple[Optional[int], Optional[int]]:
+        """
+        Returns the lowest and highest archived movement IDs.
+
+        :return: Tuple with both IDs, or (None, None) if nothing was archived.
+        """
+        archives = self.repository.get_archives()
+        if not archives:
+            return None, None
+        return min(archive.first_id for archive in archives), max(archive.last_id for archive in archives)
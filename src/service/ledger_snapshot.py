@@ -0,0 +1,219 @@
+from array import array
+from datetime import date
+from heapq import nlargest
+from typing import Iterable, Optional
+
+from service.analytics import PERIODS
+
+# first day of the Unix epoch as a proleptic Gregorian ordinal, to turn ordinals into datetime64 days
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def optional_numpy():
+    """Returns the numpy module, or None when it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class LedgerSnapshot:
+    """
+    Read-only copy of the stock movements ledger held in four compact columns, for analytics
+    that would otherwise load every StockMovement object:
+
+    - input_ids: ID of the input of each movement;
+    - quantities: signed quantity (positive for IN, negative for OUT), as a double;
+    - days: movement date as a proleptic Gregorian ordinal (date.toordinal());
+    - is_in: 1 for IN movements, 0 for OUT.
+
+    A movement takes 21 bytes instead of more than a kilobyte for a StockMovement object. The columns are
+    numpy arrays when numpy is installed, so the aggregates are vectorized; otherwise they stay
+    array.array objects and the aggregates fall back to plain loops with the same results.
+    """
+
+    def __init__(self, input_ids, quantities, days, is_in):
+        """
+        Initializes the snapshot with its columns, all of the same length. Use from_rows to
+        build one from query rows.
+        """
+        self.input_ids = input_ids
+        self.quantities = quantities
+        self.days = days
+        self.is_in = is_in
+        self.vectorized = not isinstance(input_ids, array)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], use_numpy: Optional[bool] = None) -> 'LedgerSnapshot':
+        """
+        Builds a snapshot from (input_id, quantity, movement_type, movement_date) rows. The
+        values are appended to typed arrays as they arrive, so the rows are never held in memory
+        together; with numpy, the arrays are then wrapped without copying.
+
+        :param rows: Iterable of (input_id, quantity, movement_type, movement_date) tuples.
+        :param use_numpy: Whether to use numpy: None uses it when installed, False never does.
+        :return: LedgerSnapshot with the rows in the order given.
+        :raises ImportError: If use_numpy is True and numpy is not installed.
+        """
+        input_ids, quantities, days, is_in = array('l'), array('d'), array('i'), array('B')
+        for input_id, quantity, movement_type, movement_date in rows:
+            incoming = movement_type.upper() == 'IN'
+            input_ids.append(input_id)
+            quantities.append(float(quantity) if incoming else -float(quantity))
+            days.append(movement_date.toordinal())
+            is_in.append(incoming)
+
+        numpy = optional_numpy() if use_numpy is not False else None
+        if use_numpy and numpy is None:
+            raise ImportError('numpy is not installed')
+        if numpy is None:
+            return cls(input_ids, quantities, days, is_in)
+        return cls(
+            numpy.frombuffer(input_ids, dtype=numpy.int64 if input_ids.itemsize == 8 else numpy.int32),
+            numpy.frombuffer(quantities, dtype=numpy.float64),
+            numpy.frombuffer(days, dtype=numpy.int32),
+            numpy.frombuffer(is_in, dtype=numpy.uint8).view(numpy.bool_),
+        )
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the columns, in bytes."""
+        return sum(len(column) * column.itemsize for column in (self.input_ids, self.quantities, self.days, self.is_in))
+
+    def _selection(self, start: Optional[date], end: Optional[date]):
+        """Returns a boolean mask of the movements in the date range, or None for all of them."""
+        if start is None and end is None:
+            return None
+        low = start.toordinal() if start is not None else None
+        high = end.toordinal() if end is not None else None
+        if self.vectorized:
+            mask = True
+            if low is not None:
+                mask = self.days >= low
+            if high is not None:
+                mask = mask & (self.days <= high)
+            return mask
+        return [(low is None or day >= low) and (high is None or day <= high) for day in self.days]
+
+    def balances(self, as_of: Optional[date] = None) -> dict[int, float]:
+        """
+        Computes the stock balance of every input with movements, as the sum of its signed
+        quantities.
+
+        :param as_of: Last movement date included, if given.
+        :return: Dictionary of balance by input ID.
+        """
+        mask = self._selection(None, as_of)
+        if self.vectorized:
+            numpy = optional_numpy()
+            input_ids, quantities = self.input_ids, self.quantities
+            if mask is not None:
+                input_ids, quantities = input_ids[mask], quantities[mask]
+            present = numpy.bincount(input_ids) > 0 if len(input_ids) else numpy.zeros(0, dtype=bool)
+            totals = numpy.bincount(input_ids, weights=quantities)
+            ids = numpy.flatnonzero(present)
+            return dict(zip(ids.tolist(), totals[ids].tolist()))
+        totals = {}
+        for index, (input_id, quantity) in enumerate(zip(self.input_ids, self.quantities)):
+            if mask is None or mask[index]:
+                totals[input_id] = totals.get(input_id, 0.0) + quantity
+        return totals
+
+    def _buckets(self, period: str, days):
+        """Maps the day ordinals to the ordinal of the first day of their period."""
+        if period == 'day':
+            return days
+        if period == 'week':
+            # ordinal 1 (0001-01-01) is a Monday
+            return days - (days - 1) % 7 if self.vectorized else [day - (day - 1) % 7 for day in days]
+        if self.vectorized:
+            numpy = optional_numpy()
+            months = (days - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+            return months.astype('datetime64[D]').astype(numpy.int64) + _EPOCH_ORDINAL
+        first_days = {}
+        buckets = []
+        for day in days:
+            first_day = first_days.get(day)
+            if first_day is None:
+                first_day = first_days[day] = date.fromordinal(day).replace(day=1).toordinal()
+            buckets.append(first_day)
+        return buckets
+
+    def period_totals(self, period: str = 'month', start: Optional[date] = None,
+                      end: Optional[date] = None) -> list[dict]:
+        """
+        Computes the IN and OUT totals and the net change of stock per time bucket, over all
+        inputs (the same totals as the consumption report, without the grouping).
+
+        :param period: 'day', 'week' (starting on Monday) or 'month'.
+        :param start: First movement date included, if given.
+        :param end: Last movement date included, if given.
+        :return: List of dictionaries with period, total_in, total_out, net_change and movements,
+            ordered by period.
+        :raises ValueError: If the period is not supported.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unsupported period '{period}', use one of: {', '.join(PERIODS)}")
+        mask = self._selection(start, end)
+        if self.vectorized:
+            numpy = optional_numpy()
+            days, quantities, is_in = self.days, self.quantities, self.is_in
+            if mask is not None:
+                days, quantities, is_in = days[mask], quantities[mask], is_in[mask]
+            periods, positions = numpy.unique(self._buckets(period, days), return_inverse=True)
+            total_in = numpy.bincount(positions, weights=numpy.where(is_in, quantities, 0.0), minlength=len(periods))
+            total_out = numpy.bincount(positions, weights=numpy.where(is_in, 0.0, -quantities), minlength=len(periods))
+            counts = numpy.bincount(positions, minlength=len(periods))
+            rows = zip(periods.tolist(), total_in.tolist(), total_out.tolist(), counts.tolist())
+        else:
+            totals = {}
+            buckets = self._buckets(period, self.days)
+            for index, (bucket, quantity) in enumerate(zip(buckets, self.quantities)):
+                if mask is not None and not mask[index]:
+                    continue
+                entry = totals.get(bucket)
+                if entry is None:
+                    entry = totals[bucket] = [0.0, 0.0, 0]
+                if self.is_in[index]:
+                    entry[0] += quantity
+                else:
+                    entry[1] -= quantity
+                entry[2] += 1
+            rows = ((bucket, *totals[bucket]) for bucket in sorted(totals))
+        return [
+            {'period': date.fromordinal(bucket), 'total_in': total_in, 'total_out': total_out,
+             'net_change': total_in - total_out, 'movements': count}
+            for bucket, total_in, total_out, count in rows
+        ]
+
+    def top_consumers(self, limit: int = 10, start: Optional[date] = None,
+                      end: Optional[date] = None) -> list[tuple[int, float]]:
+        """
+        Finds the inputs with the largest OUT totals.
+
+        :param limit: Maximum number of inputs returned.
+        :param start: First movement date included, if given.
+        :param end: Last movement date included, if given.
+        :return: List of (input_id, total_out) tuples, largest first (ties by lowest ID).
+        """
+        mask = self._selection(start, end)
+        if self.vectorized:
+            numpy = optional_numpy()
+            outgoing = ~self.is_in if mask is None else ~self.is_in & mask
+            input_ids = self.input_ids[outgoing]
+            if not len(input_ids):
+                return []
+            totals = numpy.bincount(input_ids, weights=-self.quantities[outgoing])
+            ids = numpy.flatnonzero(numpy.bincount(input_ids))
+            # stable sort on the negated totals keeps the lowest ID first among ties
+            order = ids[numpy.argsort(-totals[ids], kind='stable')][:limit]
+            return list(zip(order.tolist(), totals[order].tolist()))
+        totals = {}
+        for index, (input_id, quantity) in enumerate(zip(self.input_ids, self.quantities)):
+            if not self.is_in[index] and (mask is None or mask[index]):
+                totals[input_id] = totals.get(input_id, 0.0) - quantity
+        return nlargest(limit, sorted(totals.items()), key=lambda item: item[1])
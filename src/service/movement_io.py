@@ -0,0 +1,166 @@
+import csv
+import json
+import os
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Mapping, Optional, TextIO
+
+if TYPE_CHECKING:
+    from service.stock_movements import RejectedRow
+
+SUPPORTED_FORMATS = ('csv', 'jsonl')
+
+REPORT_HEADERS = ['ID', 'Quantity', 'Movement Type', 'Movement Date', 'Input Name', 'Supplier Name']
+REPORT_FIELDS = ['movement_id', 'movement_quantity', 'movement_type', 'movement_date', 'input_name', 'supplier_name']
+
+
+def detect_format(path: str, file_format: Optional[str] = None) -> str:
+    """
+    Resolves the format of a movements file, from the explicit option or from its extension.
+
+    :param path: Path of the file.
+    :param file_format: Explicit format ('csv' or 'jsonl'), if given.
+    :return: The resolved format.
+    :raises ValueError: If the format cannot be determined.
+    """
+    if file_format:
+        return file_format.lower()
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f"Cannot detect the format of '{path}', use one of: {', '.join(SUPPORTED_FORMATS)}")
+
+
+def read_movement_rows(path: str, file_format: str) -> Iterator[tuple[int, Any]]:
+    """
+    Lazily reads the rows of a CSV or JSONL movements file.
+
+    CSV files must have a header with the input_id, quantity, movement_type and
+    movement_date columns. JSONL files hold one object with the same keys per line;
+    lines that are not valid JSON are yielded as raw strings so they can be rejected.
+
+    :param path: Path of the file.
+    :param file_format: 'csv' or 'jsonl'.
+    :return: Iterator of (line number, row) pairs.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, line
+
+
+def read_ids(path: str) -> Iterator[int]:
+    """
+    Lazily reads a file of IDs, one per line. Only the first comma-separated field of a line
+    is used, so a CSV export with the IDs in its first column works too; blank lines, lines
+    starting with '#' and a non-numeric first line (a header) are skipped.
+
+    :param path: Path of the file.
+    :return: Iterator of IDs.
+    :raises ValueError: If a line other than the header does not start with an integer.
+    """
+    with open(path, encoding='utf-8') as file:
+        first = True
+        for line_number, line in enumerate(file, start=1):
+            value = line.split(',', 1)[0].strip()
+            if not value or value.startswith('#'):
+                continue
+            try:
+                yield int(value)
+            except ValueError:
+                if not first:
+                    raise ValueError(f'{path}, line {line_number}: invalid ID {value!r}')
+            first = False
+
+
+def write_rejected_rows(path: str, rejected: list['RejectedRow']) -> None:
+    """
+    Writes the rejected rows of an import to a JSONL quarantine file.
+
+    :param path: Path of the quarantine file.
+    :param rejected: Rows rejected by the import.
+    """
+    with open(path, mode='w', encoding='utf-8') as file:
+        for item in rejected:
+            file.write(json.dumps({'line': item.line_number, 'row': item.row, 'reason': item.reason}, default=str))
+            file.write('\n')
+
+
+def write_movement_report(rows: Iterable[Mapping], file: TextIO, file_format: str = 'csv',
+                          header: bool = True) -> int:
+    """
+    Writes movement report rows to a file as they arrive, so memory usage does not
+    depend on the number of rows. The file is flushed after the first row so the
+    output becomes visible right away.
+
+    :param rows: Iterable of report rows, keyed by REPORT_FIELDS.
+    :param file: Text file opened for writing (with newline='' for CSV).
+    :param file_format: 'csv' or 'jsonl'.
+    :param header: Whether to write the CSV header line.
+    :return: Number of rows written.
+    """
+    return write_rows(rows, file, REPORT_FIELDS, file_format, REPORT_HEADERS if header else None)
+
+
+def write_rows(rows: Iterable[Mapping], file: TextIO, fields: list[str], file_format: str = 'csv',
+               headers: Optional[list[str]] = None) -> int:
+    """
+    Writes report rows to a file as they arrive, flushing it after the first row.
+
+    :param rows: Iterable of rows, keyed by fields.
+    :param file: Text file opened for writing (with newline='' for CSV).
+    :param fields: Keys of the rows written, in column order.
+    :param file_format: 'csv', 'jsonl' or 'json' (a single JSON array).
+    :param headers: Header line of the CSV format. No header is written when omitted.
+    :return: Number of rows written.
+    """
+    count = 0
+    if file_format == 'csv':
+        writer = csv.writer(file)
+        if headers:
+            writer.writerow(headers)
+        for row in rows:
+            writer.writerow([_plain(row[key]) for key in fields])
+            count += 1
+            if count == 1:
+                file.flush()
+        return count
+    separator = '\n' if file_format == 'jsonl' else ',\n'
+    for row in rows:
+        if count:
+            file.write(separator)
+        elif file_format == 'json':
+            file.write('[\n')
+        file.write(json.dumps({key: row[key] for key in fields}, default=_json_default))
+        count += 1
+        if count == 1:
+            file.flush()
+    if file_format == 'json':
+        file.write('\n]\n' if count else '[]\n')
+    elif count:
+        file.write('\n')
+    return count
+
+
+def _plain(value: Any) -> Any:
+    """
+    Writes decimals in positional notation: str() uses an exponent for zeros with a scale,
+    such as the 0E-10 sums of the NUMERIC columns of SQLite.
+    """
+    return format(value, 'f') if isinstance(value, Decimal) else value
+
+
+def _json_default(value: Any) -> str:
+    """Encodes the values json cannot, decimals in positional notation and the others with str()."""
+    return format(value, 'f') if isinstance(value, Decimal) else str(value)
@@ -0,0 +1,65 @@
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Sequence, TypeVar
+
+T = TypeVar('T')
+
+
+def iter_keyset(fetch_page: Callable[[Optional[int], int], Sequence[T]], after_id: Optional[int] = None,
+                limit: Optional[int] = None, page_size: int = 500) -> Iterator[T]:
+    """
+    Iterates over the rows of a table page by page using keyset pagination on the ID,
+    so only one page is held in memory at a time.
+
+    :param fetch_page: Repository method receiving (after_id, limit) and returning a page ordered by ID.
+    :param after_id: Only rows with an ID greater than this one are returned.
+    :param limit: Maximum number of rows to return, or None for all of them.
+    :param page_size: Number of rows fetched per query.
+    :return: Iterator of rows.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = fetch_page(after_id, size)
+        yield from page
+        if len(page) < size:
+            return
+        after_id = page[-1].id
+        if remaining is not None:
+            remaining -= len(page)
+
+
+async def aiter_keyset(fetch_page: Callable[[Optional[int], int], Awaitable[Sequence[T]]],
+                       after_id: Optional[int] = None, limit: Optional[int] = None,
+                       page_size: int = 500) -> AsyncIterator[T]:
+    """
+    Asyncio version of iter_keyset, for repository methods that are coroutines.
+
+    :param fetch_page: Async repository method receiving (after_id, limit) and returning a page ordered by ID.
+    :param after_id: Only rows with an ID greater than this one are returned.
+    :param limit: Maximum number of rows to return, or None for all of them.
+    :param page_size: Number of rows fetched per query.
+    :return: Async iterator of rows.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = await fetch_page(after_id, size)
+        for row in page:
+            yield row
+        if len(page) < size:
+            return
+        after_id = page[-1].id
+        if remaining is not None:
+            remaining -= len(page)
+
+
+def split_range(low: int, high: int, parts: int) -> list[tuple[int, int]]:
+    """
+    Splits the inclusive range [low, high] into up to parts contiguous ranges of similar size.
+
+    :param low: First value of the range.
+    :param high: Last value of the range.
+    :param parts: Number of ranges wanted.
+    :return: List of (first, last) pairs, in ascending order.
+    """
+    size = max(1, -(-(high - low + 1) // max(1, parts)))
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
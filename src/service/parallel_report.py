@@ -0,0 +1,103 @@
+import heapq
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import Callable, Optional, TextIO
+
+from sqlalchemy.orm import Session
+
+from repository.archive import LedgerArchiveRepository
+from repository.stock_movements import StockMovementRepository
+from service.ledger_archive import LedgerArchiveService
+from service.movement_io import write_movement_report
+from service.pagination import split_range
+
+
+def _write_partition(session_factory: Callable[[], Session], low_id: int, high_id: int, file_format: str,
+                     chunk_size: int, archive_directory: Optional[str] = None,
+                     inputs: Optional[dict] = None) -> tuple[TextIO, int]:
+    """
+    Writes the report rows of one ID range to a temporary file, using its own session and
+    therefore its own pooled connection. With an archive directory, the archived movements of
+    the range are merged in.
+    """
+    partial = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8')
+    try:
+        with session_factory() as session:
+            rows = StockMovementRepository(session).stream_movement_report_range(low_id, high_id, chunk_size)
+            if archive_directory is not None:
+                archive = LedgerArchiveService(LedgerArchiveRepository(session), archive_directory)
+                rows = heapq.merge(archive.report_rows(low_id, high_id, inputs), rows, key=itemgetter('movement_id'))
+            count = write_movement_report(rows, partial, file_format, header=False)
+    except BaseException:
+        partial.close()
+        raise
+    return partial, count
+
+
+def write_movement_report_parallel(session_factory: Callable[[], Session], file: TextIO, file_format: str = 'csv',
+                                   workers: int = 4, partitions: Optional[int] = None,
+                                   chunk_size: int = 1000, archive_directory: Optional[str] = None) -> int:
+    """
+    Writes the movement report with several worker threads. The movements are split in
+    contiguous ID ranges; each range is queried on its own pooled connection and written to a
+    temporary file, and the partial files are appended to the output in ID order as soon as
+    they are complete. The output is identical to the one of write_movement_report.
+
+    IDs grow with the movement dates, so the ranges also split the ledger by period, while the
+    report keeps its order by movement ID.
+
+    With the directory of the ledger archive, the ranges also cover the archived movements,
+    and each partition merges the archived movements of its range, joined with the names of
+    the inputs and suppliers read once for all partitions.
+
+    :param session_factory: Callable returning a new session, e.g. a sessionmaker.
+    :param file: Text file opened for writing (with newline='' for CSV).
+    :param file_format: 'csv' or 'jsonl'.
+    :param workers: Number of partitions queried at the same time.
+    :param partitions: Number of ID ranges. Defaults to four per worker, so a slow range does not
+        hold the other workers idle.
+    :param chunk_size: Number of rows fetched per round-trip.
+    :param archive_directory: Directory of the ledger archive files, to include the archived
+        movements. Only the stock_movements table is read when omitted.
+    :return: Number of rows written.
+    """
+    inputs = None
+    with session_factory() as session:
+        low_id, high_id = StockMovementRepository(session).get_id_bounds()
+        if archive_directory is not None:
+            archive = LedgerArchiveService(LedgerArchiveRepository(session), archive_directory)
+            archived_low, archived_high = archive.id_bounds()
+            if archived_low is None:
+                archive_directory = None
+            else:
+                low_id = archived_low if low_id is None else min(low_id, archived_low)
+                high_id = archived_high if high_id is None else max(high_id, archived_high)
+                inputs = archive.input_details()
+    write_movement_report([], file, file_format)
+    if low_id is None:
+        return 0
+
+    ranges = split_range(low_id, high_id, partitions or workers * 4)
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report') as executor:
+        futures = [executor.submit(_write_partition, session_factory, low, high, file_format, chunk_size,
+                                   archive_directory, inputs)
+                   for low, high in ranges]
+        try:
+            for future in futures:
+                partial, partial_count = future.result()
+                with partial:
+                    partial.seek(0)
+                    shutil.copyfileobj(partial, file)
+                count += partial_count
+                file.flush()
+        except BaseException:
+            # the pending partitions are cancelled; the ones that ran have their temporary files closed
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    future.result()[0].close()
+            raise
+    return count
@@ -0,0 +1,237 @@
+import math
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import islice
+from statistics import NormalDist
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from repository.analytics import AnalyticsRepository
+from service.ledger_snapshot import optional_numpy
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+
+FORECAST_FIELDS = ['input_id', 'balance', 'avg_daily_out', 'std_daily_out', 'days_of_cover', 'safety_stock',
+                   'reorder_point', 'suggested_quantity']
+
+
+@dataclass(frozen=True)
+class ForecastParameters:
+    """
+    Settings of a reorder forecast.
+
+    - window_days: number of days of OUT history, up to today, averaged into the daily consumption;
+    - lead_time_days: days between placing an order and receiving it;
+    - review_days: days the stock ordered should last after the lead time;
+    - service_level: probability of not running out during the lead time, which sets the safety stock.
+    """
+    window_days: int = 90
+    lead_time_days: int = 7
+    review_days: int = 14
+    service_level: float = 0.95
+
+    def validate(self) -> None:
+        """
+        Checks the settings.
+
+        :raises ValueError: If a setting is out of range.
+        """
+        if self.window_days < 1:
+            raise ValueError('The window must be at least one day')
+        if self.lead_time_days < 0 or self.review_days < 0:
+            raise ValueError('The lead time and the review period must not be negative')
+        if not 0.5 <= self.service_level < 1:
+            raise ValueError('The service level must be at least 0.5 and below 1')
+
+    @property
+    def safety_factor(self) -> float:
+        """Number of standard deviations of the lead time demand kept as safety stock."""
+        return NormalDist().inv_cdf(self.service_level)
+
+
+class ReorderForecastResult:
+    """
+    Reorder suggestions of all inputs, held in columns aligned with input_ids (numpy arrays
+    when computed with numpy, lists otherwise):
+
+    - balances: current stock;
+    - avg_daily_out / std_daily_out: mean and standard deviation of the daily OUT totals over
+      the window, days without OUT movements counting as zero;
+    - days_of_cover: days the current stock lasts at the average consumption (infinite without consumption);
+    - safety_stock: safety_factor * std_daily_out * sqrt(lead_time_days);
+    - reorder_point: avg_daily_out * lead_time_days + safety_stock;
+    - suggested_quantity: when the stock is at or below the reorder point, the quantity that
+      brings it up to the reorder point plus review_days of average consumption; 0 otherwise.
+    """
+
+    def __init__(self, computed_on: date, parameters: ForecastParameters, input_ids, balances, avg_daily_out,
+                 std_daily_out, days_of_cover, safety_stock, reorder_point, suggested_quantity, vectorized: bool):
+        self.computed_on = computed_on
+        self.parameters = parameters
+        self.input_ids = input_ids
+        self.balances = balances
+        self.avg_daily_out = avg_daily_out
+        self.std_daily_out = std_daily_out
+        self.days_of_cover = days_of_cover
+        self.safety_stock = safety_stock
+        self.reorder_point = reorder_point
+        self.suggested_quantity = suggested_quantity
+        self.vectorized = vectorized
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+    @property
+    def reorder_count(self) -> int:
+        """Number of inputs with a suggested order."""
+        if self.vectorized:
+            return int((self.suggested_quantity > 0).sum())
+        return sum(1 for quantity in self.suggested_quantity if quantity > 0)
+
+    def rows(self, only_reorder: bool = False, digits: int = 4) -> Iterator[dict]:
+        """
+        Yields the suggestions as dictionaries keyed by FORECAST_FIELDS, ordered by input ID.
+
+        :param only_reorder: Only yield the inputs with a suggested order.
+        :param digits: Decimal digits the quantities are rounded to.
+        :return: Iterator of dictionaries. days_of_cover is None for inputs without consumption.
+        """
+        columns = [self.balances, self.avg_daily_out, self.std_daily_out, self.days_of_cover, self.safety_stock,
+                   self.reorder_point, self.suggested_quantity]
+        if self.vectorized:
+            numpy = optional_numpy()
+            columns = [self.input_ids.tolist(), *(numpy.round(column, digits).tolist() for column in columns)]
+        else:
+            columns = [self.input_ids, *([round(value, digits) for value in column] for column in columns)]
+        for values in zip(*columns):
+            row = dict(zip(FORECAST_FIELDS, values))
+            if only_reorder and not row['suggested_quantity'] > 0:
+                continue
+            if row['days_of_cover'] == math.inf:
+                row['days_of_cover'] = None
+            yield row
+
+
+class ReorderForecaster:
+    """
+    Computes the reorder suggestions of all inputs in one pass over the ledger: a single
+    GROUP BY query streams the daily OUT totals of the window, which are folded chunk by
+    chunk into per-input sums, so memory grows with the number of inputs and not with the
+    length of the history. With numpy the folding and the statistics are vectorized across
+    inputs; without it, plain loops give the same results.
+    """
+
+    def __init__(self, repository: AnalyticsRepository, clock: Callable[[], date] = date.today,
+                 archive: Optional['LedgerArchiveService'] = None):
+        """
+        Initializes the forecaster.
+
+        :param repository: Repository of the aggregate queries.
+        :param clock: Returns the current date, the last day of the window.
+        :param archive: Service of the ledger archive, read when the window reaches archived movements.
+        """
+        self.repository = repository
+        self.clock = clock
+        self.archive = archive
+
+    def forecast(self, parameters: ForecastParameters = ForecastParameters(), use_numpy: Optional[bool] = None,
+                 chunk_size: int = 50000) -> ReorderForecastResult:
+        """
+        Computes the reorder suggestions of every input.
+
+        :param parameters: Settings of the forecast.
+        :param use_numpy: Whether to use numpy: None uses it when installed, False never does.
+        :param chunk_size: Number of daily totals folded at a time.
+        :return: ReorderForecastResult of all the inputs.
+        :raises ValueError: If the parameters are out of range.
+        :raises ImportError: If use_numpy is True and numpy is not installed.
+        """
+        parameters.validate()
+        numpy = optional_numpy() if use_numpy is not False else None
+        if use_numpy and numpy is None:
+            raise ImportError('numpy is not installed')
+
+        input_ids, balances = array('l'), array('d')
+        for input_id, balance in self.repository.stream_stock_positions():
+            input_ids.append(input_id)
+            balances.append(balance)
+        end = self.clock()
+        start = end - timedelta(days=parameters.window_days - 1)
+        daily = self.repository.stream_daily_consumption(start, end)
+        if self.archive is not None and self.archive.has_archives(start, end):
+            daily = _add_archived_days(daily, self.archive.daily_consumption(start, end))
+        if numpy is None:
+            return self._forecast_loops(end, parameters, input_ids, balances, daily)
+        return self._forecast_vectorized(numpy, end, parameters, input_ids, balances, daily, chunk_size)
+
+    @staticmethod
+    def _forecast_vectorized(numpy, computed_on: date, parameters: ForecastParameters, input_ids: array,
+                             balances: array, daily: Iterator[tuple], chunk_size: int) -> ReorderForecastResult:
+        input_ids = numpy.frombuffer(input_ids, dtype=numpy.int64 if input_ids.itemsize == 8 else numpy.int32)
+        balances = numpy.frombuffer(balances, dtype=numpy.float64)
+        count = len(input_ids)
+        totals = numpy.zeros(count)
+        squares = numpy.zeros(count)
+        while chunk := list(islice(daily, chunk_size)):
+            chunk_ids = numpy.fromiter((row[0] for row in chunk), dtype=numpy.int64, count=len(chunk))
+            quantities = numpy.fromiter((row[2] for row in chunk), dtype=numpy.float64, count=len(chunk))
+            # input_ids is sorted, so each daily total finds the position of its input by binary search
+            positions = numpy.searchsorted(input_ids, chunk_ids)
+            known = positions < count
+            known[known] = input_ids[positions[known]] == chunk_ids[known]
+            positions, quantities = positions[known], quantities[known]
+            totals += numpy.bincount(positions, weights=quantities, minlength=count)
+            squares += numpy.bincount(positions, weights=quantities * quantities, minlength=count)
+
+        window = parameters.window_days
+        average = totals / window
+        deviation = numpy.sqrt(numpy.maximum(squares / window - average * average, 0.0))
+        safety_stock = parameters.safety_factor * deviation * math.sqrt(parameters.lead_time_days)
+        reorder_point = average * parameters.lead_time_days + safety_stock
+        consuming = average > 0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            days_of_cover = numpy.where(consuming, balances / average, numpy.inf)
+        target = reorder_point + average * parameters.review_days
+        suggested = numpy.where(consuming & (balances <= reorder_point), numpy.maximum(target - balances, 0.0), 0.0)
+        return ReorderForecastResult(computed_on, parameters, input_ids, balances, average, deviation, days_of_cover,
+                               safety_stock, reorder_point, suggested, vectorized=True)
+
+    @staticmethod
+    def _forecast_loops(computed_on: date, parameters: ForecastParameters, input_ids: array, balances: array,
+                        daily: Iterator[tuple]) -> ReorderForecastResult:
+        positions = {input_id: position for position, input_id in enumerate(input_ids)}
+        totals = [0.0] * len(input_ids)
+        squares = [0.0] * len(input_ids)
+        for input_id, _, quantity in daily:
+            position = positions.get(input_id)
+            if position is not None:
+                totals[position] += quantity
+                squares[position] += quantity * quantity
+
+        window = parameters.window_days
+        lead_time_factor = parameters.safety_factor * math.sqrt(parameters.lead_time_days)
+        average = [total / window for total in totals]
+        deviation = [math.sqrt(max(square / window - mean * mean, 0.0)) for square, mean in zip(squares, average)]
+        safety_stock = [lead_time_factor * value for value in deviation]
+        reorder_point = [mean * parameters.lead_time_days + safety for mean, safety in zip(average, safety_stock)]
+        days_of_cover = [balance / mean if mean > 0 else math.inf for balance, mean in zip(balances, average)]
+        suggested = [
+            max(point + mean * parameters.review_days - balance, 0.0) if mean > 0 and balance <= point else 0.0
+            for balance, mean, point in zip(balances, average, reorder_point)
+        ]
+        return ReorderForecastResult(computed_on, parameters, list(input_ids), list(balances), average, deviation,
+                               days_of_cover, safety_stock, reorder_point, suggested, vectorized=False)
+
+
+def _add_archived_days(daily: Iterator[tuple], archived: dict[tuple[int, date], float]) -> Iterator[tuple]:
+    """
+    Adds the archived OUT totals to the daily totals of the database. A day can have movements
+    in both (movements dated before the archive cutoff and written after it), and is then
+    yielded once with the sum, so the squared daily totals stay right.
+    """
+    for input_id, day, quantity in daily:
+        key = (input_id, day.date() if isinstance(day, datetime) else day)
+        yield input_id, day, quantity + archived.pop(key, 0.0)
+    for (input_id, day), quantity in archived.items():
+        yield input_id, day, quantity
@@ -0,0 +1,256 @@
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from repository.inputs import InputRepository
+from service.search_index import SEARCH_FIELDS, SEARCH_MODES, SearchIndex
+from service.watermark import DEFAULT_SETTLE_SECONDS, MARGIN, settled_watermark
+
+
+@dataclass
+class SearchHit:
+    """
+    An input matching a search.
+    """
+    input_id: int
+    name: str
+    category: str
+    supplier_id: Optional[int]
+    supplier_name: Optional[str]
+
+
+@dataclass
+class RefreshResult:
+    """
+    Summary of a build or refresh of the search index.
+    """
+    mode: str
+    changed: int = 0
+    removed: int = 0
+    size: int = 0
+    elapsed_seconds: float = 0.0
+
+
+class SearchIndexStore:
+    """
+    Holds the search index of a file for the whole process: it is loaded from the file on first
+    use (or built, when the file is missing, outdated or made from another database), refreshed
+    from the rows changed since its watermark at most every refresh_seconds, and written back
+    when a refresh changed it. A lock serializes the searches with the refreshes.
+
+    The watermark never passes the database time minus settle_seconds, so every refresh reads
+    again the rows stamped during that window and picks up the ones committed late. A row whose
+    transaction commits more than settle_seconds after it was stamped is only seen by the next
+    build (or a later change of the row).
+    """
+
+    def __init__(self, path: str, refresh_seconds: float = 60.0, clock: Callable[[], float] = time.monotonic,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+        """
+        Initializes the store. Nothing is read until the index is first needed.
+
+        :param path: Path of the index file.
+        :param refresh_seconds: Seconds a refreshed index is used before checking the database again.
+        :param clock: Function returning the current time, in seconds.
+        :param settle_seconds: Seconds the watermark stays behind the database time.
+        """
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        self.index: Optional[SearchIndex] = None
+        self.refreshed_at: Optional[float] = None
+        self.lock = threading.RLock()
+
+    def get(self, repository: InputRepository) -> SearchIndex:
+        """
+        Returns the index, loading, building or refreshing it first when needed. Call it with the
+        lock held while searching, so a concurrent refresh does not change the index meanwhile.
+
+        :param repository: Repository of the inputs, used to build or refresh the index.
+        :return: The index.
+        """
+        with self.lock:
+            if self.index is None:
+                self._load(repository)
+            if self.refreshed_at is None or self.clock() - self.refreshed_at >= self.refresh_seconds:
+                self.refresh(repository)
+            return self.index
+
+    def _load(self, repository: InputRepository) -> None:
+        """Loads the index from the file, or builds it if the file cannot be used for this database."""
+        index = SearchIndex.load(self.path)
+        if index is None or index.source != _source(repository):
+            self.build(repository)
+        else:
+            self.index = index
+
+    def build(self, repository: InputRepository) -> RefreshResult:
+        """
+        Builds the index from all the inputs and writes it to the file.
+
+        :param repository: Repository of the inputs.
+        :return: RefreshResult of the build.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            index = SearchIndex(_source(repository))
+            # taken first, so the rows changed while the index is built are read by the next refresh
+            index.watermark = settled_watermark(repository, repository.get_search_watermark(), self.settle_seconds)
+            for row in repository.stream_search_rows():
+                index.add(row.id, row.name, row.category, row.supplier_name)
+            index.save(self.path)
+            self.index = index
+            self.refreshed_at = self.clock()
+        return RefreshResult('build', changed=len(index), size=len(index),
+                             elapsed_seconds=time.perf_counter() - started)
+
+    def refresh(self, repository: InputRepository, save: bool = True) -> RefreshResult:
+        """
+        Applies to the index the inputs changed since its watermark (and the inputs of the
+        suppliers changed since then). Deleted inputs leave no trace in updated_at: when the
+        number of inputs differs from the size of the index, the IDs of all inputs are read
+        and the missing ones are removed.
+
+        :param repository: Repository of the inputs.
+        :param save: Write the index to the file if it changed.
+        :return: RefreshResult of the refresh.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            if self.index is None:
+                self._load(repository)
+            index = self.index
+            result = RefreshResult('refresh')
+            if index.watermark is None:
+                rows = list(repository.stream_search_rows())
+            else:
+                rows = repository.get_search_rows_updated_since(index.watermark - MARGIN)
+            latest = index.watermark
+            for row in rows:
+                result.changed += index.add(row.id, row.name, row.category, row.supplier_name)
+                moment = getattr(row, 'updated_at', None)
+                if moment is not None and (latest is None or moment > latest):
+                    latest = moment
+            if latest is None:
+                latest = repository.get_search_watermark()
+            latest = settled_watermark(repository, latest, self.settle_seconds)
+            if latest is not None and (index.watermark is None or latest > index.watermark):
+                index.watermark = latest
+            if repository.count_inputs() != len(index):
+                existing = set(repository.stream_input_ids())
+                for input_id in [input_id for input_id in index.input_ids() if input_id not in existing]:
+                    result.removed += index.remove(input_id)
+            if save and (result.changed or result.removed):
+                index.save(self.path)
+            self.refreshed_at = self.clock()
+            result.size = len(index)
+        result.elapsed_seconds = time.perf_counter() - started
+        return result
+
+
+def _source(repository: InputRepository) -> str:
+    """Describes the database of a repository, to tell index files of different databases apart."""
+    return repository.session.get_bind().url.render_as_string(hide_password=True)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_index_store() -> SearchIndexStore:
+    """
+    Returns the process-wide store of the search index, creating it on first use with the file
+    set by the SEARCH_INDEX_PATH environment variable (inputs-search.idx in the temporary
+    directory by default), the refresh interval set by SEARCH_REFRESH_SECONDS and the settle
+    window set by SEARCH_SETTLE_SECONDS.
+
+    :return: The store.
+    """
+    path = os.getenv('SEARCH_INDEX_PATH') or os.path.join(tempfile.gettempdir(), 'inputs-search.idx')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = SearchIndexStore(path, float(os.getenv('SEARCH_REFRESH_SECONDS', 60)),
+                                             settle_seconds=float(os.getenv('SEARCH_SETTLE_SECONDS',
+                                                                            DEFAULT_SETTLE_SECONDS)))
+        return _stores[path]
+
+
+class SearchService:
+    """
+    Service for searching the inputs by name, category or supplier name. Searches use the
+    in-memory index of the store when one is given, and LIKE queries otherwise (or on request).
+    """
+
+    def __init__(self, repository: InputRepository, store: Optional[SearchIndexStore] = None):
+        """
+        Initializes the SearchService.
+
+        :param repository: Repository of the inputs.
+        :param store: Store of the search index. Every search runs a LIKE query when omitted.
+        """
+        self.repository = repository
+        self.store = store
+
+    def search(self, query: str, mode: str = 'prefix', fields: Iterable[str] = SEARCH_FIELDS, limit: int = 20,
+               use_index: bool = True) -> list[SearchHit]:
+        """
+        Finds the inputs whose name, category or supplier name match a query, ignoring case.
+        The index also ignores accents; the LIKE queries follow the LOWER function of the database.
+
+        :param query: Text searched.
+        :param mode: 'prefix' (a field starts with the text), 'substring' (a field contains it)
+            or 'token' (every word of the text starts a word of one of the fields).
+        :param fields: Fields searched, among SEARCH_FIELDS.
+        :param limit: Maximum number of inputs returned.
+        :param use_index: Use the index, if the service has one. The LIKE queries scan the inputs.
+        :return: List of SearchHit. With the index, they are ordered as SearchIndex.search
+            describes; with the LIKE queries, by input ID.
+        :raises ValueError: If the mode or a field is not supported, or the limit is not positive.
+        """
+        fields = list(fields)
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported mode '{mode}', use one of: {', '.join(SEARCH_MODES)}")
+        unsupported = [field for field in fields if field not in SEARCH_FIELDS]
+        if unsupported or not fields:
+            raise ValueError(f"Unsupported fields: {', '.join(unsupported)} (use: {', '.join(SEARCH_FIELDS)})")
+        if limit < 1:
+            raise ValueError('The limit must be positive')
+        if not query.split():
+            return []
+
+        if self.store is None or not use_index:
+            rows = self.repository.search_inputs(' '.join(query.lower().split()), mode, fields, limit)
+        else:
+            with self.store.lock:
+                input_ids = self.store.get(self.repository).search(query, mode, fields, limit)
+            # the rows are read by primary key, so the hits show the current values and skip
+            # inputs deleted since the last refresh
+            found = self.repository.get_search_rows(input_ids)
+            rows = [found[input_id] for input_id in input_ids if input_id in found]
+        return [SearchHit(row.id, row.name, row.category, row.supplier_id, row.supplier_name) for row in rows]
+
+    def build_index(self) -> RefreshResult:
+        """
+        Rebuilds the search index from all the inputs, dropping its stale entries, and writes it to its file.
+
+        :return: RefreshResult of the build.
+        :raises RuntimeError: If the service has no index.
+        """
+        if self.store is None:
+            raise RuntimeError('The search service has no index')
+        return self.store.build(self.repository)
+
+    def refresh_index(self) -> RefreshResult:
+        """
+        Applies the inputs changed since the last refresh to the search index and writes it to its file.
+
+        :return: RefreshResult of the refresh.
+        :raises RuntimeError: If the service has no index.
+        """
+        if self.store is None:
+            raise RuntimeError('The search service has no index')
+        return self.store.refresh(self.repository)
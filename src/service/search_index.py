@@ -0,0 +1,495 @@
+import json
+import os
+import sys
+import tempfile
+import unicodedata
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+SEARCH_FIELDS = ('name', 'category', 'supplier')
+SEARCH_MODES = ('prefix', 'substring', 'token')
+
+# bumped when the layout of the saved index changes, so older files are rebuilt instead of loaded
+FORMAT_VERSION = 2
+
+_NO_VALUE = -1
+# values matching a query word beyond which token searches check the word by splitting the values
+_MAX_VALUE_SET = 5000
+# words sampled to estimate how many inputs a query word matches
+_SAMPLE_WORDS = 200
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Normalizes a text for searching: accents removed, case folded and runs of whitespace
+    collapsed into single spaces.
+
+    :param text: Text to be normalized, or None.
+    :return: The normalized text ('' for None).
+    """
+    if not text:
+        return ''
+    if text.isascii():
+        return ' '.join(text.lower().split())
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[start:start + 3] for start in range(len(text) - 2)}
+
+
+class PostingLists:
+    """
+    Lists of integers keyed by dense integer keys, kept in two parts: a compact one (every list
+    concatenated into data, with offsets marking where each key starts) and the items appended
+    since the last compaction, per key. The compact part is saved as two flat arrays, which is
+    what makes loading a saved index fast.
+    """
+
+    def __init__(self):
+        self.offsets = array('q', [0])
+        self.data = array('i')
+        self.appended: dict[int, array] = {}
+
+    def __getitem__(self, key: int) -> array:
+        if key + 1 < len(self.offsets):
+            items = self.data[self.offsets[key]:self.offsets[key + 1]]
+            appended = self.appended.get(key)
+            return items + appended if appended else items
+        return self.appended.get(key) or array('i')
+
+    def count(self, key: int) -> int:
+        """Returns the length of the list of a key."""
+        compact = self.offsets[key + 1] - self.offsets[key] if key + 1 < len(self.offsets) else 0
+        appended = self.appended.get(key)
+        return compact + (len(appended) if appended else 0)
+
+    def append(self, key: int, item: int) -> None:
+        """Appends an item to the list of a key."""
+        items = self.appended.get(key)
+        if items is None:
+            items = self.appended[key] = array('i')
+        items.append(item)
+
+    def compact(self) -> None:
+        """Moves the appended items into the compact part."""
+        if not self.appended:
+            return
+        compact_keys = len(self.offsets) - 1
+        offsets, data = array('q', [0]), array('i')
+        view = memoryview(self.data)
+        for key in range(max(compact_keys, max(self.appended) + 1)):
+            if key < compact_keys:
+                data.extend(view[self.offsets[key]:self.offsets[key + 1]])
+            appended = self.appended.get(key)
+            if appended:
+                data.extend(appended)
+            offsets.append(len(data))
+        self.offsets, self.data, self.appended = offsets, data, {}
+
+
+class SearchIndex:
+    """
+    In-memory index of the input name, category and supplier name, for prefix, substring and
+    token searches without touching the database.
+
+    Every distinct normalized value of a field gets a value ID, and every distinct word of the
+    values a word ID. The index keeps:
+
+    - for each input, the value ID of each field (arrays indexed by input ID);
+    - for each value, the IDs of the inputs that had it (its postings);
+    - for each field, its value IDs sorted by text, so a prefix is a range found by binary
+      search (the flattened form of a trie);
+    - for each word, the values containing it, with the word IDs sorted by text for prefix ranges;
+    - for each trigram, the values containing it, to find substrings of three or more characters.
+
+    Changes only append: an input that changes gets new postings, and its old ones become stale.
+    Searches check every candidate against the current value IDs of the input, so stale postings
+    only cost time until the index is rebuilt. Inputs are held in arrays indexed by ID, which
+    suits the dense IDs of an identity column. The dictionaries from texts to IDs are only needed
+    to add inputs, so they are not saved: a loaded index rebuilds them on its first change.
+    """
+
+    def __init__(self, source: str = ''):
+        """
+        Initializes an empty index.
+
+        :param source: Description of the database indexed (its URL without the password).
+        """
+        self.source = source
+        self.watermark: Optional[datetime] = None
+        self.size = 0
+        self.input_values = tuple(array('i') for _ in SEARCH_FIELDS)
+        self.values: list[str] = []
+        self.value_fields = array('B')
+        self.postings = PostingLists()
+        self.sorted_values = tuple(array('i') for _ in SEARCH_FIELDS)
+        self.words: list[str] = []
+        self.word_values = PostingLists()
+        self.sorted_words = array('i')
+        self.trigrams: dict[str, array] = {}
+        self._value_ids: Optional[tuple[dict, ...]] = None
+        self._word_ids: Optional[dict[str, int]] = None
+        self._unsorted_values = tuple([] for _ in SEARCH_FIELDS)
+        self._unsorted_words = []
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, input_id: int, name: str, category: str, supplier_name: Optional[str]) -> bool:
+        """
+        Adds an input, or updates it if it is already indexed.
+
+        :param input_id: ID of the input.
+        :param name: Name of the input.
+        :param category: Category of the input.
+        :param supplier_name: Name of the supplier of the input, if any.
+        :return: True if the index changed.
+        """
+        value_ids = [self._value_id(field, normalize(text))
+                     for field, text in enumerate((name, category, supplier_name))]
+        if input_id >= len(self.input_values[0]):
+            missing = input_id + 1 - len(self.input_values[0])
+            for column in self.input_values:
+                column.extend(array('i', [_NO_VALUE]) * missing)
+        current = [column[input_id] for column in self.input_values]
+        if current == value_ids:
+            return False
+        if current[0] == _NO_VALUE:
+            self.size += 1
+        for column, old_value_id, value_id in zip(self.input_values, current, value_ids):
+            if old_value_id != value_id:
+                column[input_id] = value_id
+                if value_id != _NO_VALUE:
+                    self.postings.append(value_id, input_id)
+        return True
+
+    def remove(self, input_id: int) -> bool:
+        """
+        Removes an input. Its postings become stale.
+
+        :param input_id: ID of the input.
+        :return: True if the input was indexed.
+        """
+        if input_id >= len(self.input_values[0]) or self.input_values[0][input_id] == _NO_VALUE:
+            return False
+        for column in self.input_values:
+            column[input_id] = _NO_VALUE
+        self.size -= 1
+        return True
+
+    def input_ids(self) -> Iterator[int]:
+        """Yields the IDs of the indexed inputs, in ascending order."""
+        names = self.input_values[0]
+        return (input_id for input_id in range(len(names)) if names[input_id] != _NO_VALUE)
+
+    def _value_id(self, field: int, text: str) -> int:
+        if not text:
+            return _NO_VALUE
+        if self._value_ids is None:
+            self._value_ids = tuple({} for _ in SEARCH_FIELDS)
+            for value_id, (value, value_field) in enumerate(zip(self.values, self.value_fields)):
+                self._value_ids[value_field][value] = value_id
+        value_id = self._value_ids[field].get(text)
+        if value_id is not None:
+            return value_id
+        value_id = len(self.values)
+        self.values.append(text)
+        self.value_fields.append(field)
+        self._value_ids[field][text] = value_id
+        self._unsorted_values[field].append(value_id)
+        for word in set(text.split()):
+            self.word_values.append(self._word_id(word), value_id)
+        for trigram in _trigrams(text):
+            values = self.trigrams.get(trigram)
+            if values is None:
+                values = self.trigrams[trigram] = array('i')
+            values.append(value_id)
+        return value_id
+
+    def _word_id(self, word: str) -> int:
+        if self._word_ids is None:
+            self._word_ids = {text: word_id for word_id, text in enumerate(self.words)}
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self.words)
+            self.words.append(word)
+            self._unsorted_words.append(word_id)
+        return word_id
+
+    def _sort(self) -> None:
+        """Merges the values and words added since the previous search into the sorted arrays."""
+        for sorted_ids, unsorted, texts in [*((sorted_values, unsorted, self.values) for sorted_values, unsorted
+                                              in zip(self.sorted_values, self._unsorted_values)),
+                                            (self.sorted_words, self._unsorted_words, self.words)]:
+            key = texts.__getitem__
+            if len(unsorted) < 1000:
+                for item in unsorted:
+                    sorted_ids.insert(bisect_left(sorted_ids, key(item), key=key), item)
+            else:
+                merged = sorted([*sorted_ids, *unsorted], key=key)
+                del sorted_ids[:]
+                sorted_ids.extend(merged)
+            unsorted.clear()
+
+    def search(self, query: str, mode: str = 'prefix', fields: Iterable[str] = SEARCH_FIELDS,
+               limit: int = 20) -> list[int]:
+        """
+        Finds the inputs matching a query.
+
+        :param query: Text searched; it is normalized like the indexed values.
+        :param mode: 'prefix' (a field starts with the text), 'substring' (a field contains it)
+            or 'token' (every word of the text starts a word of one of the fields).
+        :param fields: Fields searched, among SEARCH_FIELDS.
+        :param limit: Maximum number of inputs returned.
+        :return: List of input IDs. Prefix matches are ordered by field (in SEARCH_FIELDS order)
+            and value; substring matches by value; token matches by the word matched by the
+            most selective query word.
+        """
+        self._sort()
+        text = normalize(query)
+        fields = [SEARCH_FIELDS.index(field) for field in fields]
+        if not text or not fields or limit < 1:
+            return []
+        if mode == 'prefix':
+            value_ids = (value_id for field in sorted(fields) for value_id in self._prefix_values(field, text))
+        elif mode == 'substring':
+            value_ids = self._substring_values(text, fields)
+        else:
+            return self._token_search(list(dict.fromkeys(text.split())), fields, limit)
+        return self._collect(value_ids, limit)
+
+    def _collect(self, value_ids: Iterable[int], limit: int, accept=None) -> list[int]:
+        """Gathers the inputs whose current value is one of value_ids, until limit are found."""
+        found = []
+        seen = set()
+        for value_id in value_ids:
+            column = self.input_values[self.value_fields[value_id]]
+            for input_id in self.postings[value_id]:
+                if column[input_id] == value_id and input_id not in seen and (accept is None or accept(input_id)):
+                    seen.add(input_id)
+                    found.append(input_id)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def _prefix_values(self, field: int, text: str) -> Iterator[int]:
+        values = self.values
+        sorted_values = self.sorted_values[field]
+        position = bisect_left(sorted_values, text, key=values.__getitem__)
+        while position < len(sorted_values) and values[sorted_values[position]].startswith(text):
+            yield sorted_values[position]
+            position += 1
+
+    def _substring_values(self, text: str, fields: list[int]) -> Iterator[int]:
+        values, value_fields = self.values, self.value_fields
+        if len(text) < 3:
+            # no trigram to narrow the candidates: scan the values of the fields
+            return (value_id for field in sorted(fields) for value_id in self.sorted_values[field]
+                    if text in values[value_id])
+        postings = []
+        for trigram in _trigrams(text):
+            candidates = self.trigrams.get(trigram)
+            if candidates is None:
+                return iter(())
+            postings.append(candidates)
+        candidates = min(postings, key=len)
+        return (value_id for value_id in candidates if value_fields[value_id] in fields and text in values[value_id])
+
+    def _word_range(self, token: str) -> range:
+        """Returns the positions in sorted_words of the words starting with token."""
+        key = self.words.__getitem__
+        start = bisect_left(self.sorted_words, token, key=key)
+        return range(start, bisect_left(self.sorted_words, token + '\uffff', lo=start, key=key))
+
+    def _token_values(self, positions: range, fields: list[int]) -> Iterator[int]:
+        """Yields the values of the fields containing the words at positions (a value may repeat)."""
+        value_fields, sorted_words = self.value_fields, self.sorted_words
+        for position in positions:
+            for value_id in self.word_values[sorted_words[position]]:
+                if value_fields[value_id] in fields:
+                    yield value_id
+
+    def _token_estimates(self, positions: range, fields: list[int]) -> tuple[float, float]:
+        """
+        Estimates the number of values and of postings of the words at positions, from a sample
+        of at most _SAMPLE_WORDS words and the average number of inputs per value of each field.
+        """
+        if not positions:
+            return 0.0, 0.0
+        per_value = [self.size / len(values) if values else 0.0 for values in self.sorted_values]
+        sample = positions[:_SAMPLE_WORDS]
+        values = postings = 0.0
+        for position in sample:
+            word_id = self.sorted_words[position]
+            count = self.word_values.count(word_id)
+            field = self.value_fields[self.word_values[word_id][0]]
+            values += count
+            postings += count * per_value[field] if field in fields else 0.0
+        scale = len(positions) / len(sample)
+        return values * scale, postings * scale
+
+    def _token_search(self, tokens: list[str], fields: list[int], limit: int) -> list[int]:
+        ranges = {token: self._word_range(token) for token in tokens}
+        if not all(ranges.values()):
+            return []
+        estimates = {token: self._token_estimates(ranges[token], fields) for token in tokens}
+        # drive the search with the query word expected to match the fewest inputs
+        driver = min(tokens, key=lambda token: estimates[token][1])
+        # the other words are checked against the values of the candidates: through the set of
+        # their values when small, or by splitting the values into words otherwise
+        checks = []
+        for token in tokens:
+            if token != driver:
+                if estimates[token][0] <= _MAX_VALUE_SET:
+                    value_set = set(self._token_values(ranges[token], fields))
+                    checks.append((token, value_set, {self.value_fields[value_id] for value_id in value_set}))
+                else:
+                    checks.append((token, None, set(fields)))
+        values, value_fields = self.values, self.value_fields
+
+        def matches(value_id: int, token: str, value_set: Optional[set]) -> bool:
+            if value_set is not None:
+                return value_id in value_set
+            return any(word.startswith(token) for word in values[value_id].split())
+
+        found = []
+        seen = set()
+        for value_id in self._token_values(ranges[driver], fields):
+            field = value_fields[value_id]
+            # words not in the driver value must be in another field of the input; when no other
+            # field can have them, none of the inputs of this value match
+            pending = [check for check in checks if not matches(value_id, check[0], check[1])]
+            if any(not (token_fields - {field}) for _, _, token_fields in pending):
+                continue
+            column = self.input_values[field]
+            others = [self.input_values[other] for other in fields if other != field]
+            for input_id in self.postings[value_id]:
+                if column[input_id] != value_id or input_id in seen:
+                    continue
+                if pending:
+                    current = [other[input_id] for other in others]
+                    if not all(any(other_id != _NO_VALUE and matches(other_id, token, value_set)
+                                   for other_id in current) for token, value_set, _ in pending):
+                        continue
+                seen.add(input_id)
+                found.append(input_id)
+                if len(found) == limit:
+                    return found
+        return found
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index to a file, replacing the previous one atomically. The file holds only
+        data: a JSON header line followed by the raw bytes of the arrays and of the texts, which
+        are joined by newlines (normalized texts have none). It is written to a unique temporary
+        file in the same directory, so concurrent saves do not clash.
+
+        :param path: Path of the index file.
+        """
+        self._sort()
+        self.postings.compact()
+        self.word_values.compact()
+        trigram_keys = list(self.trigrams)
+        trigram_offsets, trigram_data = array('q', [0]), array('i')
+        for trigram in trigram_keys:
+            trigram_data.extend(self.trigrams[trigram])
+            trigram_offsets.append(len(trigram_data))
+        sections = [
+            *self.input_values,
+            self.value_fields, self.postings.offsets, self.postings.data,
+            *self.sorted_values,
+            self.word_values.offsets, self.word_values.data, self.sorted_words,
+            trigram_offsets, trigram_data,
+            _encode_texts(self.values), _encode_texts(self.words), _encode_texts(trigram_keys),
+        ]
+        blobs = [section.tobytes() if isinstance(section, array) else section for section in sections]
+        header = {
+            'format': FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'source': self.source,
+            'watermark': self.watermark.isoformat() if self.watermark is not None else None,
+            'size': self.size,
+            'sections': [[section.typecode if isinstance(section, array) else 's', len(blob)]
+                         for section, blob in zip(sections, blobs)],
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(json.dumps(header).encode('utf-8') + b'\n')
+                for blob in blobs:
+                    file.write(blob)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SearchIndex']:
+        """
+        Reads an index written by save.
+
+        :param path: Path of the index file.
+        :return: SearchIndex, or None if the file does not exist, has another format or is
+            unreadable (truncated or corrupt), so that it gets rebuilt.
+        """
+        try:
+            with open(path, 'rb') as file:
+                header = json.loads(file.readline())
+                if (not isinstance(header, dict) or header.get('format') != FORMAT_VERSION
+                        or header.get('byteorder') != sys.byteorder):
+                    return None
+                sections = []
+                for typecode, length in header['sections']:
+                    blob = file.read(length)
+                    if len(blob) != length:
+                        raise ValueError('Truncated search index file')
+                    if typecode == 's':
+                        sections.append(_decode_texts(blob))
+                    else:
+                        values = array(typecode)
+                        values.frombytes(blob)
+                        sections.append(values)
+                if file.read(1):
+                    raise ValueError('Unexpected data at the end of the search index file')
+            return cls._from_sections(header, sections)
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            return None
+
+    @classmethod
+    def _from_sections(cls, header: dict, sections: list) -> 'SearchIndex':
+        """Rebuilds an index from the header and sections of a file written by save."""
+        field_count = len(SEARCH_FIELDS)
+        if len(sections) != 2 * field_count + 11:
+            raise ValueError('Unexpected number of sections in the search index file')
+        sections = iter(sections)
+        index = cls(header['source'])
+        index.watermark = datetime.fromisoformat(header['watermark']) if header['watermark'] else None
+        index.size = int(header['size'])
+        index.input_values = tuple(next(sections) for _ in range(field_count))
+        index.value_fields = next(sections)
+        index.postings.offsets, index.postings.data = next(sections), next(sections)
+        index.sorted_values = tuple(next(sections) for _ in range(field_count))
+        index.word_values.offsets, index.word_values.data = next(sections), next(sections)
+        index.sorted_words = next(sections)
+        trigram_offsets, trigram_data = next(sections), next(sections)
+        index.values, index.words, trigram_keys = next(sections), next(sections), next(sections)
+        if (len(index.values) != len(index.value_fields) or len(trigram_offsets) != len(trigram_keys) + 1
+                or len({len(column) for column in index.input_values}) > 1):
+            raise ValueError('Inconsistent search index file')
+        index.trigrams = {trigram: trigram_data[trigram_offsets[position]:trigram_offsets[position + 1]]
+                          for position, trigram in enumerate(trigram_keys)}
+        return index
+
+
+def _encode_texts(texts: list[str]) -> bytes:
+    return '\n'.join(texts).encode('utf-8')
+
+
+def _decode_texts(blob: bytes) -> list[str]:
+    return blob.decode('utf-8').split('\n') if blob else []
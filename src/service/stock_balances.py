@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import TYPE_CHECKING, Optional
+
+from repository.stock_balances import StockBalanceRepository
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+
+CHECKPOINT_INTERVALS = ('day', 'week', 'month')
+
+
+class StockBalanceService:
+    """
+    Service for querying and reconciling the maintained on-hand stock balance of inputs.
+    """
+
+    def __init__(self, repository: StockBalanceRepository, archive: Optional['LedgerArchiveService'] = None):
+        """
+        Initializes the StockBalanceService with the given repository.
+
+        :param repository: Repository for managing stock balances.
+        :param archive: Service of the ledger archive, whose movements the ledger computations
+            include. Only the stock_movements table is read when omitted.
+        """
+        self.repository = repository
+        self.archive = archive
+
+    def get_balance(self, input_id: int) -> Decimal:
+        """
+        Retrieves the current stock of an input with a primary key lookup.
+
+        :param input_id: ID of the input.
+        :return: Quantity on hand, or 0 if the input has no movements.
+        """
+        balance = self.repository.get_balance_by_input_id(input_id)
+        return balance.quantity if balance else Decimal(0)
+
+    def reconcile(self) -> dict:
+        """
+        Rebuilds the maintained balances from the stock movements ledger, including the net
+        effect of the archived movements.
+
+        :return: Dictionary with the number of balances rebuilt and how many of them were out of sync.
+        """
+        archived = self._cutoff() is not None
+        current = self.repository.get_all_balances()
+        ledger = dict(self.repository.ledger_balances(archived))
+        out_of_sync = sum(
+            1 for input_id in current.keys() | ledger.keys()
+            if current.get(input_id, 0) != ledger.get(input_id, 0)
+        )
+        self.repository.rebuild_from_ledger(archived)
+        return {'balances': len(ledger), 'out_of_sync': out_of_sync}
+
+    def get_balance_as_of(self, input_id: int, as_of: date) -> Decimal:
+        """
+        Computes the stock of an input at the end of a past date, from the nearest balance
+        checkpoint taken on or before that date plus the movements dated since. Without
+        checkpoints, the whole history of the input is summed, with the same result.
+
+        Archived movements all precede the archive cutoff: from the day before it on, their
+        net effect is read from archived_balances; for earlier dates, the archived movements
+        of the input after the checkpoint are read from the archive files of those months.
+
+        :param input_id: ID of the input.
+        :param as_of: Date of the balance; movements dated on it are included.
+        :return: Quantity on hand at the end of the date.
+        """
+        checkpoint = self.repository.get_checkpoint(input_id, as_of)
+        start = checkpoint.checkpoint_date if checkpoint is not None else None
+        balance = checkpoint.quantity if checkpoint is not None else Decimal(0)
+        balance += self.repository.sum_movements(input_id, start, as_of)
+        cutoff = self._cutoff()
+        if cutoff is None or (start is not None and start >= cutoff):
+            return balance
+        if start is None and as_of >= cutoff - timedelta(days=1):
+            return balance + self.archive.archived_balance(input_id)
+        return balance + sum((movement.signed_quantity for movement in
+                              self.archive.movements(start, as_of, input_id=input_id)), Decimal(0))
+
+    def build_checkpoints(self, interval: str = 'month') -> dict:
+        """
+        Rebuilds the balance checkpoints from the stock movements ledger, one per input at the
+        start of every period after a period with movements of the input. After archiving,
+        only the checkpoints from the archive cutoff on are rebuilt.
+
+        :param interval: Checkpoint interval: 'day', 'week' or 'month'.
+        :return: Dictionary with the interval and the number of checkpoints written.
+        :raises ValueError: If the interval is not supported.
+        """
+        if interval not in CHECKPOINT_INTERVALS:
+            raise ValueError(f"Unsupported interval '{interval}', use one of: {', '.join(CHECKPOINT_INTERVALS)}")
+        checkpoints = self.repository.rebuild_checkpoints(interval, archive_cutoff=self._cutoff())
+        return {'interval': interval, 'checkpoints': checkpoints}
+
+    def _cutoff(self) -> Optional[date]:
+        """Returns the day before which the movements were archived, or None if none were."""
+        return self.archive.cutoff() if self.archive is not None else None
@@ -1,9 +1,26 @@
-from datetime import datetime
+import heapq
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
 from enum import Enum
-from typing import Optional, Type
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Type
 
+from sqlalchemy.exc import SQLAlchemyError
+
+from repository.bulk import check_bulk_values, id_chunks
+from repository.stock_balances import StockBalanceRepository
 from repository.stock_movements import StockMovementRepository
 from models.models import StockMovement
+from service.pagination import iter_keyset
+from service.unit_of_work import UnitOfWork
+
+if TYPE_CHECKING:
+    from service.ledger_archive import LedgerArchiveService
+
+# columns that can be set on many stock movements at once
+BULK_UPDATE_FIELDS = ('quantity', 'movement_type', 'movement_date')
 
 
 class MovementType(Enum):
@@ -14,19 +31,98 @@ class MovementType(Enum):
     OUT = 'OUT'
 
 
+def signed_quantity(movement_type: str, quantity):
+    """
+    Returns the effect of a movement on the stock balance: positive for IN, negative for OUT.
+
+    :param movement_type: Type of the movement (IN or OUT).
+    :param quantity: Quantity moved.
+    :return: The signed quantity.
+    """
+    return quantity if movement_type.upper() == MovementType.IN.value else -quantity
+
+
+def _parse_integer(value: Any, name: str) -> int:
+    """
+    Converts an imported value to an integer without changing it: booleans and numbers with a
+    fractional part are refused instead of being truncated.
+
+    :param value: Raw value, a string (CSV) or a number (JSONL).
+    :param name: Name of the field, used in the error message.
+    :return: The integer.
+    :raises ValueError: If the value is not an integer.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid {name}: {value!r}')
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'Invalid {name}: {value!r}')
+    if not isinstance(value, str) and number != value:
+        raise ValueError(f'Invalid {name}: {value!r} (not an integer)')
+    return number
+
+
+class InsufficientStockError(ValueError):
+    """
+    Raised when an OUT movement asks for more than the stock available for the input.
+    """
+
+    def __init__(self, input_id: int, requested, available):
+        super().__init__(f'Insufficient stock for input {input_id}: requested {requested}, available {available}')
+        self.input_id = input_id
+        self.requested = requested
+        self.available = available
+
+
+@dataclass
+class RejectedRow:
+    """
+    A row refused by the bulk import, with its position in the source file and the reason.
+    """
+    line_number: int
+    row: Any
+    reason: str
+
+
+@dataclass
+class BulkImportResult:
+    """
+    Summary of a bulk import of stock movements.
+    """
+    imported: int = 0
+    rejected: list[RejectedRow] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        Throughput of the import, counting both imported and rejected rows.
+        """
+        total = self.imported + len(self.rejected)
+        return total / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
 class StockMovementService:
     """
     Service for managing stock movement operations, including creating, updating,
     deleting, and retrieving stock movement records.
     """
 
-    def __init__(self, repository: StockMovementRepository):
+    def __init__(self, repository: StockMovementRepository, balance_repository: Optional[StockBalanceRepository] = None,
+                 archive: Optional['LedgerArchiveService'] = None):
         """
         Initializes the StockMovementService with the given repository.
 
         :param repository: Repository for managing stock movement records.
+        :param balance_repository: Repository of the maintained stock balances, updated in the same
+            transaction as the movements. Balances are not maintained when omitted.
+        :param archive: Service of the ledger archive, whose movements the report includes. The
+            report only reads the stock_movements table when omitted.
         """
         self.repository = repository
+        self.balance_repository = balance_repository
+        self.archive = archive
 
     def create_stock_movement(self, input_id: int, quantity: int, movement_type: str,
                               movement_date: datetime.date = datetime.now().date()) -> StockMovement:
@@ -45,9 +141,152 @@ class StockMovementService:
             movement_type=movement_type,
             movement_date=movement_date
         )
+        self._apply_balance(input_id, signed_quantity(movement_type, quantity), movement_date)
+        self.repository.add_stock_movement(new_movement)
+        return new_movement
+
+    def debit_stock(self, input_id: int, quantity: int, movement_date: Optional[date] = None) -> StockMovement:
+        """
+        Creates an OUT movement only if the stock of the input covers it. The availability check
+        and the debit of the balance are a single conditional UPDATE committed with the movement,
+        so concurrent debits of the same input cannot oversell it, while debits of different
+        inputs lock different balance rows and do not wait on each other.
+
+        :param input_id: ID of the input associated with the stock movement.
+        :param quantity: Quantity taken out of stock.
+        :param movement_date: Date of the stock movement. Defaults to today's date.
+        :return: The created StockMovement object.
+        :raises InsufficientStockError: If the balance of the input does not cover the quantity.
+        :raises RuntimeError: If the service does not maintain stock balances.
+        """
+        if self.balance_repository is None:
+            raise RuntimeError('Stock can only be checked when balances are maintained')
+        movement_date = movement_date or date.today()
+        if not self.balance_repository.try_debit(input_id, quantity):
+            balance = self.balance_repository.get_balance_by_input_id(input_id)
+            raise InsufficientStockError(input_id, quantity, balance.quantity if balance else 0)
+        self.balance_repository.delete_stale_checkpoints({input_id: movement_date})
+        new_movement = StockMovement(
+            input_id=input_id,
+            quantity=quantity,
+            movement_type=MovementType.OUT.value,
+            movement_date=movement_date
+        )
         self.repository.add_stock_movement(new_movement)
         return new_movement
 
+    def bulk_import_stock_movements(self, rows: Iterable[tuple[int, Any]], batch_size: int = 1000) -> BulkImportResult:
+        """
+        Imports stock movements in batches: each batch is validated, checked against the
+        existing inputs with a single query and written with one multi-row INSERT and one commit.
+
+        Invalid rows are rejected without stopping the import. If a batch is refused by the
+        database, its rows are retried one by one so that only the offending rows are rejected.
+
+        :param rows: Iterable of (line number, raw row) pairs, where a raw row is a dictionary
+            with input_id, quantity, movement_type and movement_date (YYYY-MM-DD, optional) keys.
+        :param batch_size: Number of rows validated and inserted per batch.
+        :return: BulkImportResult with the number of imported rows and the rejected ones.
+        """
+        result = BulkImportResult()
+        started = time.perf_counter()
+        rows = iter(rows)
+        while batch := list(islice(rows, batch_size)):
+            valid = []
+            for line_number, raw in batch:
+                try:
+                    valid.append((line_number, raw, self._parse_movement_row(raw)))
+                except ValueError as error:
+                    result.rejected.append(RejectedRow(line_number, raw, str(error)))
+
+            existing_ids = self.repository.get_existing_input_ids({values['input_id'] for _, _, values in valid})
+            accepted = []
+            for line_number, raw, values in valid:
+                if values['input_id'] in existing_ids:
+                    accepted.append((line_number, raw, values))
+                else:
+                    result.rejected.append(RejectedRow(line_number, raw, f"Input {values['input_id']} not found"))
+
+            try:
+                result.imported += self._add_movements([values for _, _, values in accepted])
+            except SQLAlchemyError:
+                for line_number, raw, values in accepted:
+                    try:
+                        result.imported += self._add_movements([values])
+                    except SQLAlchemyError as error:
+                        result.rejected.append(RejectedRow(line_number, raw, str(getattr(error, 'orig', None) or error)))
+
+        result.elapsed_seconds = time.perf_counter() - started
+        return result
+
+    def _add_movements(self, movements: list[dict]) -> int:
+        """
+        Inserts a batch of movements and applies them to the maintained balances in one
+        transaction, so a failure of either statement rolls both back.
+        """
+        with UnitOfWork(self.repository.session):
+            self._apply_balances(movements)
+            return self.repository.bulk_add_stock_movements(movements)
+
+    def _apply_balance(self, input_id: int, delta, movement_date: date) -> None:
+        """
+        Applies a signed quantity to the maintained balance of an input, if balances are enabled,
+        and drops the balance checkpoints the movement makes stale. The changes are committed
+        together with the movement.
+        """
+        if self.balance_repository is not None:
+            self.balance_repository.apply_delta(input_id, delta)
+            self.balance_repository.delete_stale_checkpoints({input_id: movement_date})
+
+    def _apply_balances(self, movements: list[dict]) -> None:
+        """
+        Applies the net effect of a batch of movements to the maintained balances,
+        with one batched statement for all the inputs of the batch.
+        """
+        if self.balance_repository is None:
+            return
+        deltas = {}
+        earliest = {}
+        for values in movements:
+            input_id = values['input_id']
+            deltas[input_id] = deltas.get(input_id, 0) + signed_quantity(values['movement_type'], values['quantity'])
+            earliest[input_id] = min(earliest.get(input_id, values['movement_date']), values['movement_date'])
+        self.balance_repository.apply_deltas(deltas)
+        self.balance_repository.delete_stale_checkpoints(earliest)
+
+    @staticmethod
+    def _parse_movement_row(raw: Any) -> dict:
+        """
+        Validates a raw imported row and converts it to the values of a stock movement.
+
+        :param raw: Raw row read from the import file.
+        :return: Dictionary with input_id, quantity, movement_type and movement_date.
+        :raises ValueError: If the row is malformed.
+        """
+        if not isinstance(raw, dict):
+            raise ValueError('Row is not a valid record')
+        input_id = _parse_integer(raw.get('input_id'), 'input_id')
+        quantity = _parse_integer(raw.get('quantity'), 'quantity')
+        if quantity <= 0:
+            raise ValueError(f'Quantity must be positive: {quantity}')
+        movement_type = str(raw.get('movement_type') or '').strip().upper()
+        if movement_type not in MovementType.__members__:
+            raise ValueError(f"Invalid movement_type: {raw.get('movement_type')!r}")
+        movement_date = raw.get('movement_date')
+        if movement_date in (None, ''):
+            movement_date = date.today()
+        else:
+            try:
+                movement_date = datetime.strptime(str(movement_date), '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"Invalid movement_date: {movement_date!r} (expected YYYY-MM-DD)")
+        return {
+            'input_id': input_id,
+            'quantity': quantity,
+            'movement_type': movement_type,
+            'movement_date': movement_date,
+        }
+
     def get_stock_movement(self, movement_id: int) -> Optional[StockMovement]:
         """
         Retrieves a stock movement by its ID.
@@ -70,6 +309,10 @@ class StockMovementService:
         """
         stock_movement = self.repository.get_stock_movement_by_id(movement_id)
         if stock_movement:
+            self._apply_balance(stock_movement.input_id,
+                                -signed_quantity(stock_movement.movement_type, stock_movement.quantity),
+                                stock_movement.movement_date)
+            self._apply_balance(input_id, signed_quantity(movement_type, quantity), stock_movement.movement_date)
             stock_movement.input_id = input_id
             stock_movement.quantity = quantity
             stock_movement.movement_type = movement_type
@@ -86,10 +329,75 @@ class StockMovementService:
         """
         stock_movement = self.repository.get_stock_movement_by_id(movement_id)
         if stock_movement:
+            self._apply_balance(stock_movement.input_id,
+                                -signed_quantity(stock_movement.movement_type, stock_movement.quantity),
+                                stock_movement.movement_date)
             self.repository.delete_stock_movement(stock_movement)
             return True
         return False
 
+    def bulk_update_stock_movements(self, movement_ids: Iterable[int], values: dict) -> int:
+        """
+        Sets the same values on many stock movements with set-based UPDATE statements instead of
+        loading and merging every movement. See _bulk_write for the balances.
+
+        :param movement_ids: IDs of the stock movements to be updated.
+        :param values: Dictionary mapping fields of BULK_UPDATE_FIELDS to new values.
+        :return: Number of stock movements updated.
+        :raises ValueError: If the fields are not supported or their values are invalid.
+        """
+        check_bulk_values(values, BULK_UPDATE_FIELDS)
+        values = dict(values)
+        if 'movement_type' in values:
+            values['movement_type'] = str(values['movement_type']).strip().upper()
+            if values['movement_type'] not in MovementType.__members__:
+                raise ValueError(f"Invalid movement_type: {values['movement_type']!r}")
+        if 'quantity' in values and not values['quantity'] > 0:
+            raise ValueError(f"Quantity must be positive: {values['quantity']}")
+        return self._bulk_write(movement_ids, lambda chunk: self.repository.update_stock_movements_by_ids(chunk, values))
+
+    def bulk_delete_stock_movements(self, movement_ids: Iterable[int]) -> int:
+        """
+        Deletes many stock movements with set-based DELETE statements instead of loading and
+        deleting every movement. See _bulk_write for the balances.
+
+        :param movement_ids: IDs of the stock movements to be deleted.
+        :return: Number of stock movements deleted.
+        """
+        return self._bulk_write(movement_ids, self.repository.delete_stock_movements_by_ids)
+
+    def _bulk_write(self, movement_ids: Iterable[int], write) -> int:
+        """
+        Runs a set-based write on the movements, 1000 IDs at a time, in a single transaction.
+        When balances are maintained, the effect of each chunk on the balances of its inputs is
+        summed in the database before and after the write, and the balances are moved by the
+        difference; the checkpoints of those inputs after the earliest date involved are dropped.
+
+        :param movement_ids: IDs of the stock movements.
+        :param write: Writes a chunk of IDs and returns the number of rows affected.
+        :return: Number of stock movements affected.
+        """
+        count = 0
+        with UnitOfWork(self.repository.session):
+            for chunk in id_chunks(movement_ids):
+                if self.balance_repository is None:
+                    count += write(chunk)
+                    continue
+                before = self.balance_repository.get_movement_effects(chunk)
+                count += write(chunk)
+                after = self.balance_repository.get_movement_effects(chunk)
+                deltas = {}
+                earliest = {}
+                for input_id in before.keys() | after.keys():
+                    old_total, old_date = before.get(input_id, (0, None))
+                    new_total, new_date = after.get(input_id, (0, None))
+                    if new_total != old_total:
+                        deltas[input_id] = new_total - old_total
+                    earliest[input_id] = min(day for day in (old_date, new_date) if day is not None)
+                self.balance_repository.apply_deltas(deltas)
+                self.balance_repository.delete_stale_checkpoints(earliest)
+        return count
+
     def get_all_stock_movements(self) -> list[Type[StockMovement]]:
         """
         Retrieves all stock movements from the database.
@@ -98,9 +406,37 @@ class StockMovementService:
         """
         return self.repository.get_all_stock_movements()
 
+    def iter_stock_movements(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                             page_size: int = 500) -> Iterator[StockMovement]:
+        """
+        Iterates over the stock movements ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only stock movements with an ID greater than this one are returned.
+        :param limit: Maximum number of stock movements, or None for all of them.
+        :param page_size: Number of stock movements fetched per query.
+        :return: Iterator of StockMovement objects.
+        """
+        return iter_keyset(self.repository.get_stock_movements_page, after_id, limit, page_size)
+
     def generate_movement_report(self) -> list:
         """
         Generates a report of all stock movements, including input name, supplier name,
         movement type, quantity, and date.
         """
-        return self.repository.generate_movement_report()
+        if self.archive is None or not self.archive.has_archives():
+            return self.repository.generate_movement_report()
+        return [dict(row) for row in self.stream_movement_report()]
+
+    def stream_movement_report(self, chunk_size: int = 1000) -> Iterator:
+        """
+        Streams the report of all stock movements row by row, keeping memory usage
+        constant regardless of the size of the ledger. Archived movements are merged in by
+        movement ID, so the report is the same before and after archiving.
+
+        :param chunk_size: Number of rows fetched from the database per round-trip.
+        :return: Iterator of report rows.
+        """
+        rows = self.repository.stream_movement_report(chunk_size)
+        if self.archive is None or not self.archive.has_archives():
+            return rows
+        return heapq.merge(self.archive.report_rows(), rows, key=itemgetter('movement_id'))
@@ -1,7 +1,14 @@
-from typing import Optional, Type
+from functools import partial
+from typing import Iterable, Iterator, Optional, Type
 
 from models.models import Supplier
+from repository.bulk import check_bulk_values
 from repository.supplier import SupplierRepository
+from service.cache import LRUCache, detached_copy
+from service.pagination import iter_keyset
+
+# columns that can be set on many suppliers at once
+BULK_UPDATE_FIELDS = ('contact_info', 'address')
 
 
 class SupplierService:
@@ -10,13 +17,15 @@ class SupplierService:
     deleting, and retrieving supplier records.
     """
 
-    def __init__(self, repository: SupplierRepository):
+    def __init__(self, repository: SupplierRepository, cache: Optional[LRUCache] = None):
         """
         Initializes the SupplierService with the given repository.
 
         :param repository: Repository for managing supplier records.
+        :param cache: Read-through cache for suppliers fetched by ID. Lookups always hit the database when omitted.
         """
         self.repository = repository
+        self.cache = cache
 
     def create_supplier(self, name: str, contact_info: str, address: str) -> Supplier:
         """
@@ -36,9 +45,24 @@ class SupplierService:
         Retrieves a supplier by its ID.
 
         :param supplier_id: ID of the supplier to be retrieved.
-        :return: Supplier object if found, or None if not found.
+        :return: Supplier object if found, or None if not found. When the cache is enabled, the
+            object is a new copy of the cached one, not bound to the session, so callers can
+            change it without affecting the cache or each other.
+        """
+        if self.cache is None:
+            return self.repository.fetch_supplier_by_id(supplier_id)
+        return detached_copy(self.cache.get_or_load(
+            int(supplier_id), lambda: detached_copy(self.repository.fetch_supplier_by_id(supplier_id))))
+
+    def fetch_supplier_with_inputs(self, supplier_id: int) -> Optional[Supplier]:
+        """
+        Retrieves a supplier by its ID together with its inputs, using a constant number of
+        queries. The cache is not used, since it only holds the supplier columns.
+
+        :param supplier_id: ID of the supplier to be retrieved.
+        :return: Supplier object with its inputs loaded, or None if not found.
         """
-        return self.repository.fetch_supplier_by_id(supplier_id)
+        return self.repository.fetch_supplier_by_id(supplier_id, with_inputs=True)
 
     def fetch_all_suppliers(self) -> list[Type[Supplier]]:
         """
@@ -48,6 +72,20 @@ class SupplierService:
         """
         return self.repository.fetch_all_suppliers()
 
+    def iter_suppliers(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                       page_size: int = 500, with_inputs: bool = False) -> Iterator[Supplier]:
+        """
+        Iterates over the suppliers ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only suppliers with an ID greater than this one are returned.
+        :param limit: Maximum number of suppliers, or None for all of them.
+        :param page_size: Number of suppliers fetched per query.
+        :param with_inputs: Also loads the inputs of the suppliers, with one extra query per page.
+        :return: Iterator of Supplier objects.
+        """
+        fetch_page = partial(self.repository.fetch_suppliers_page, with_inputs=with_inputs)
+        return iter_keyset(fetch_page, after_id, limit, page_size)
+
     def update_supplier(self, supplier_id: int, name: str, contact_info: str, address: str) -> Optional[Supplier]:
         """
         Updates an existing supplier.
@@ -64,6 +102,7 @@ class SupplierService:
             supplier.contact_info = contact_info
             supplier.address = address
             self.repository.update_supplier(supplier)
+            self._invalidate(supplier_id)
             return supplier
         return None
 
@@ -77,5 +116,44 @@ class SupplierService:
         supplier = self.repository.fetch_supplier_by_id(supplier_id)
         if supplier:
             self.repository.delete_supplier(supplier)
+            self._invalidate(supplier_id)
             return True
         return False
+
+    def bulk_update_suppliers(self, supplier_ids: Iterable[int], values: dict) -> int:
+        """
+        Sets the same values on many suppliers with set-based UPDATE statements instead of
+        loading and merging every supplier.
+
+        :param supplier_ids: IDs of the suppliers to be updated.
+        :param values: Dictionary mapping fields of BULK_UPDATE_FIELDS to new values.
+        :return: Number of suppliers updated.
+        :raises ValueError: If the fields are not supported.
+        """
+        check_bulk_values(values, BULK_UPDATE_FIELDS)
+        supplier_ids = list(supplier_ids)
+        count = self.repository.update_suppliers_by_ids(supplier_ids, values)
+        for supplier_id in supplier_ids:
+            self._invalidate(supplier_id)
+        return count
+
+    def bulk_delete_suppliers(self, supplier_ids: Iterable[int]) -> int:
+        """
+        Deletes many suppliers with set-based DELETE statements. Suppliers that still have
+        inputs are kept.
+
+        :param supplier_ids: IDs of the suppliers to be deleted.
+        :return: Number of suppliers deleted.
+        """
+        supplier_ids = list(supplier_ids)
+        count = self.repository.delete_suppliers_by_ids(supplier_ids)
+        for supplier_id in supplier_ids:
+            self._invalidate(supplier_id)
+        return count
+
+    def _invalidate(self, supplier_id: int) -> None:
+        """
+        Removes a supplier from the cache after it changes.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(int(supplier_id))
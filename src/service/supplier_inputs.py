@@ -1,7 +1,14 @@
+from repository.bulk import check_bulk_values
 from repository.inputs import InputRepository
 from models.models import Input
+from service.cache import LRUCache, detached_copy
 from service.supplier import SupplierService
-from typing import Optional, List
+from service.pagination import iter_keyset
+from functools import partial
+from typing import Iterable, Iterator, Optional, List
+
+# columns that can be set on many inputs at once
+BULK_UPDATE_FIELDS = ('category', 'quantity', 'expiration_date', 'supplier_id')
 
 
 class InputService:
@@ -10,15 +17,18 @@ class InputService:
     deleting, and retrieving input records.
     """
 
-    def __init__(self, repository: InputRepository, supplier_service: SupplierService):
+    def __init__(self, repository: InputRepository, supplier_service: SupplierService,
+                 cache: Optional[LRUCache] = None):
         """
         Initializes the InputService with the given repository and supplier service.
 
         :param repository: Repository for managing input records.
         :param supplier_service: Service for managing supplier-related operations.
+        :param cache: Read-through cache for inputs fetched by ID. Lookups always hit the database when omitted.
         """
         self.repository = repository
         self.supplier_service = supplier_service
+        self.cache = cache
 
     def create_input(self, name: str, category: str, quantity: int, expiration_date, supplier_id: int) -> Optional[Input]:
         """
@@ -48,9 +58,24 @@ class InputService:
         Retrieves an input by its ID.
 
         :param input_id: ID of the input to be retrieved.
-        :return: Input object if found, or None if not found.
+        :return: Input object if found, or None if not found. When the cache is enabled, the
+            object is a new copy of the cached one, not bound to the session, so callers can
+            change it without affecting the cache or each other.
+        """
+        if self.cache is None:
+            return self.repository.get_input_by_id(input_id)
+        return detached_copy(self.cache.get_or_load(
+            int(input_id), lambda: detached_copy(self.repository.get_input_by_id(input_id))))
+
+    def get_input_with_supplier(self, input_id: int) -> Optional[Input]:
+        """
+        Retrieves an input by its ID together with its supplier, in a single query.
+        The cache is not used, since it only holds the input columns.
+
+        :param input_id: ID of the input to be retrieved.
+        :return: Input object with its supplier loaded, or None if not found.
         """
-        return self.repository.get_input_by_id(input_id)
+        return self.repository.get_input_by_id(input_id, with_supplier=True)
 
     def update_input(self, input_id: int, name: str, category: str, quantity: int, expiration_date, supplier_id: int) -> Optional[Input]:
         """
@@ -72,6 +97,7 @@ class InputService:
             input_item.expiration_date = expiration_date
             input_item.supplier_id = supplier_id
             self.repository.update_input(input_item)
+            self._invalidate(input_id)
             return input_item
         return None
 
@@ -85,9 +111,62 @@ class InputService:
         input_item = self.repository.get_input_by_id(input_id)
         if input_item:
             self.repository.delete_input(input_item)
+            self._invalidate(input_id)
             return True
         return False
 
+    def bulk_update_inputs(self, values: dict, input_ids: Optional[Iterable[int]] = None,
+                           category: Optional[str] = None) -> int:
+        """
+        Sets the same values on the inputs with the given IDs, or on all the inputs of a category,
+        with set-based UPDATE statements instead of loading and merging every input.
+
+        :param values: Dictionary mapping fields of BULK_UPDATE_FIELDS to new values.
+        :param input_ids: IDs of the inputs to be updated.
+        :param category: Category of the inputs to be updated, instead of input_ids.
+        :return: Number of inputs updated.
+        :raises ValueError: If the fields are not supported, if not exactly one of input_ids and
+            category is given, or if the new supplier does not exist.
+        """
+        check_bulk_values(values, BULK_UPDATE_FIELDS)
+        if (input_ids is None) == (category is None):
+            raise ValueError('Give either the input IDs or a category')
+        if values.get('supplier_id') is not None and not self.supplier_exists(values['supplier_id']):
+            raise ValueError(f"Supplier {values['supplier_id']} not found")
+        if category is not None:
+            count = self.repository.update_inputs_by_category(category, values)
+            if self.cache is not None:
+                self.cache.clear()
+            return count
+        input_ids = list(input_ids)
+        count = self.repository.update_inputs_by_ids(input_ids, values)
+        for input_id in input_ids:
+            self._invalidate(input_id)
+        return count
+
+    def bulk_delete_inputs(self, input_ids: Optional[Iterable[int]] = None, category: Optional[str] = None) -> int:
+        """
+        Deletes the inputs with the given IDs, or all the inputs of a category, with set-based
+        DELETE statements. Inputs that still have stock movements are kept.
+
+        :param input_ids: IDs of the inputs to be deleted.
+        :param category: Category of the inputs to be deleted, instead of input_ids.
+        :return: Number of inputs deleted.
+        :raises ValueError: If not exactly one of input_ids and category is given.
+        """
+        if (input_ids is None) == (category is None):
+            raise ValueError('Give either the input IDs or a category')
+        if category is not None:
+            count = self.repository.delete_inputs_by_category(category)
+            if self.cache is not None:
+                self.cache.clear()
+            return count
+        input_ids = list(input_ids)
+        count = self.repository.delete_inputs_by_ids(input_ids)
+        for input_id in input_ids:
+            self._invalidate(input_id)
+        return count
+
     def get_all_inputs(self) -> List[Input]:
         """
         Retrieves all input records.
@@ -96,6 +175,20 @@ class InputService:
         """
         return self.repository.get_all_inputs()
 
+    def iter_inputs(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                    page_size: int = 500, with_supplier: bool = False) -> Iterator[Input]:
+        """
+        Iterates over the inputs ordered by ID, fetching them in keyset pages.
+
+        :param after_id: Only inputs with an ID greater than this one are returned.
+        :param limit: Maximum number of inputs, or None for all of them.
+        :param page_size: Number of inputs fetched per query.
+        :param with_supplier: Also loads the supplier of each input, joined in the page query.
+        :return: Iterator of Input objects.
+        """
+        fetch_page = partial(self.repository.get_inputs_page, with_supplier=with_supplier)
+        return iter_keyset(fetch_page, after_id, limit, page_size)
+
     def supplier_exists(self, supplier_id: int) -> bool:
         """
         Checks if a supplier exists by its ID.
@@ -105,3 +198,10 @@ class InputService:
         """
         supplier = self.supplier_service.fetch_supplier(supplier_id)
         return supplier is not None
+
+    def _invalidate(self, input_id: int) -> None:
+        """
+        Removes an input from the cache after it changes.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(int(input_id))
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from repository.transaction import UNIT_OF_WORK_KEY
+
+
+class UnitOfWork:
+    """
+    Groups the writes of the services sharing a session into a single transaction.
+
+    While the unit of work is open, the repositories leave their changes pending instead of
+    committing them; they are flushed together and committed once when the block exits normally,
+    or rolled back when it raises. Call flush() when a generated ID is needed before the end.
+    Savepoints let a caller undo part of the work and carry on:
+
+        with UnitOfWork(session) as uow:
+            new_input = input_service.create_input(...)
+            uow.flush()
+            for row in rows:
+                try:
+                    with uow.savepoint():
+                        stock_movement_service.create_stock_movement(new_input.id, ...)
+                except SQLAlchemyError:
+                    ...  # only this movement is undone
+
+    A unit of work opened while another one is open on the same session joins it, so the outer
+    one decides the outcome.
+    """
+
+    def __init__(self, session: Session):
+        """
+        Initializes the unit of work. Nothing happens until it is entered.
+
+        :param session: Session shared by the repositories of the services taking part.
+        """
+        self.session = session
+        self._outer: Optional[UnitOfWork] = None
+
+    def __enter__(self) -> 'UnitOfWork':
+        self._outer = self.session.info.get(UNIT_OF_WORK_KEY)
+        if self._outer is None:
+            # changes made outside the unit of work are not committed along with it
+            if self.session.in_transaction() and (self.session.new or self.session.dirty or self.session.deleted):
+                raise RuntimeError('The session has pending changes, commit or roll them back first')
+        self.session.info[UNIT_OF_WORK_KEY] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._outer is not None:
+            self.session.info[UNIT_OF_WORK_KEY] = self._outer
+            return
+        del self.session.info[UNIT_OF_WORK_KEY]
+        if exc_type is None:
+            try:
+                self.session.commit()
+            except BaseException:
+                self.session.rollback()
+                raise
+        else:
+            self.session.rollback()
+
+    def flush(self) -> None:
+        """Sends the pending changes to the database, assigning the generated IDs, without committing."""
+        self.session.flush()
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """
+        Runs a block inside a savepoint: if it raises, only its changes are rolled back and the
+        error is re-raised, leaving the rest of the unit of work intact.
+        """
+        with self.session.begin_nested():
+            yield
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+# SQLite keeps CURRENT_TIMESTAMP as text with second precision, which does not compare equal to a
+# bound datetime; the readers that follow updated_at read their changes from slightly before the watermark
+MARGIN = timedelta(seconds=1)
+
+# updated_at is stamped when a statement runs, not when its transaction commits: a row stamped
+# before a watermark may become visible after it was read, so the watermarks trail the database clock
+DEFAULT_SETTLE_SECONDS = 60.0
+
+
+def settled_watermark(repository, moment: Optional[datetime], settle_seconds: float) -> Optional[datetime]:
+    """
+    Caps a watermark at the database time minus a settle window, so the next read of the changes
+    covers again the rows stamped during the window and picks up the ones committed late.
+
+    :param repository: Repository whose get_database_time returns the clock updated_at is stamped with.
+    :param moment: Latest updated_at read, or None.
+    :param settle_seconds: Seconds the watermark stays behind the database time.
+    :return: The capped watermark, or None if moment is None.
+    """
+    if moment is None:
+        return None
+    return min(moment, repository.get_database_time() - timedelta(seconds=settle_seconds))
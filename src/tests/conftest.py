@@ -0,0 +1,37 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context import AppContext  # noqa: E402
+from models.models import Base, Input, Supplier  # noqa: E402
+
+
+@pytest.fixture
+def context(tmp_path, monkeypatch):
+    """AppContext on an empty SQLite database created from the models."""
+    monkeypatch.setenv('LEDGER_ARCHIVE_DIR', str(tmp_path / 'ledger-archive'))
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.sqlite'}")
+    Base.metadata.create_all(engine)
+    app_context = AppContext(engine_factory=lambda: engine)
+    yield app_context
+    app_context.session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def input_ids(context):
+    """IDs of two inputs of the same supplier."""
+    session = context.session
+    supplier = Supplier(name='Agro Sul')
+    session.add(supplier)
+    session.flush()
+    inputs = [Input(name=name, category='fertilizer', quantity=0, expiration_date=date(2030, 1, 1),
+                    supplier_id=supplier.id) for name in ('Urea', 'Potash')]
+    session.add_all(inputs)
+    session.commit()
+    return [item.id for item in inputs]
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+
+def _rows(*rows):
+    return list(enumerate(rows, start=1))
+
+
+def test_import_rejects_fractional_quantities(context, input_ids):
+    result = context.stock_movement_service.bulk_import_stock_movements(_rows(
+        {'input_id': input_ids[0], 'quantity': 2.7, 'movement_type': 'IN'},
+        {'input_id': input_ids[0], 'quantity': 3.0, 'movement_type': 'IN'},
+        {'input_id': input_ids[0], 'quantity': '4', 'movement_type': 'IN'},
+    ))
+
+    assert result.imported == 2
+    assert [(row.line_number, row.reason) for row in result.rejected] == [(1, 'Invalid quantity: 2.7 (not an integer)')]
+    assert context.stock_balance_repository.get_all_balances() == {input_ids[0]: Decimal(7)}
+
+
+def test_import_rejects_boolean_values(context, input_ids):
+    result = context.stock_movement_service.bulk_import_stock_movements(_rows(
+        {'input_id': True, 'quantity': 5, 'movement_type': 'IN'},
+        {'input_id': input_ids[0], 'quantity': True, 'movement_type': 'IN'},
+    ))
+
+    assert result.imported == 0
+    assert [row.reason for row in result.rejected] == ['Invalid input_id: True', 'Invalid quantity: True']
+
+
+def test_failed_batch_leaves_balances_in_sync(context, input_ids):
+    session = context.session
+    context.stock_movement_service.bulk_import_stock_movements(_rows(
+        {'input_id': input_ids[0], 'quantity': 10, 'movement_type': 'IN'},
+    ))
+    # the balance of the second input cannot be created, so the batch fails after the first
+    # input's balance was updated and its rows are retried one by one
+    session.connection().exec_driver_sql(
+        f"CREATE TRIGGER refuse_balance BEFORE INSERT ON stock_balances WHEN NEW.input_id = {input_ids[1]} "
+        "BEGIN SELECT RAISE(ABORT, 'balance refused'); END"
+    )
+    session.commit()
+
+    result = context.stock_movement_service.bulk_import_stock_movements(_rows(
+        {'input_id': input_ids[0], 'quantity': 5, 'movement_type': 'IN'},
+        {'input_id': input_ids[1], 'quantity': 3, 'movement_type': 'IN'},
+        {'input_id': input_ids[0], 'quantity': 2, 'movement_type': 'OUT'},
+    ))
+
+    assert result.imported == 2
+    assert [row.line_number for row in result.rejected] == [2]
+    assert context.stock_balance_repository.get_all_balances() == {input_ids[0]: Decimal(13)}
+    assert context.stock_balance_service.reconcile()['out_of_sync'] == 0